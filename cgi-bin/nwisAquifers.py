@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisAquifers.py
+#
+# Project:  wellConstruction
+# Purpose:  Module compiles the NWIS aquifer code table into partitions by
+#            state and resolves aquifer names for one state from them.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# aqfr_cd_query.txt lists the aquifer codes of every state (state_cd) and
+#  the same aqfr_cd often names different units in different states, for
+#  example 124CLRN is the Clarno Formation in Oregon and the Claron
+#  Limestone elsewhere. The table is compiled into aqfr_cd_query.states,
+#  one marshalled code -> name partition per state_cd plus a partition (*)
+#  holding the last name of every code, the way the table was read before:
+#
+#    python nwisAquifers.py data/aqfr_cd_query.txt
+#
+#  The file is memory-mapped and only the partition of the requested state
+#  is unmarshalled. A code missing from it is looked up in the national
+#  partition (00) and then in the last-name partition. A missing or stale
+#  compiled file is rebuilt on first use.
+#
+###############################################################################
+
+import os, sys
+
+import marshal
+
+import nwisTables
+
+import nwisSnapshot
+
+aquiferSuffix  = '.states'
+aquiferMagic   = b'NWISAQFR'
+aquiferVersion = 1
+nationalState  = '00'
+anyState       = '*'
+
+# Compiled files mapped by this process keyed by code table file
+#
+aquiferCacheD  = {}
+
+# =============================================================================
+def aquiferFileName (aqfrFile):
+
+    return os.path.splitext(aqfrFile)[0] + aquiferSuffix
+
+# =============================================================================
+def readAquiferCodes (aqfrFile):
+
+    import csv
+
+    partitionsD = {anyState: {}}
+
+    with open(aqfrFile, "r", newline='') as fh:
+        csv_reader = csv.reader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
+        columnsL   = next(csv_reader)
+        typesL     = next(csv_reader)
+
+        stateIndex = columnsL.index('state_cd')
+        codeIndex  = columnsL.index('aqfr_cd')
+        nameIndex  = columnsL.index('aqfr_nm')
+
+        for rowL in csv_reader:
+            if len(rowL) != len(columnsL):
+                continue
+            partitionsD.setdefault(rowL[stateIndex], {})[rowL[codeIndex]] = rowL[nameIndex]
+            partitionsD[anyState][rowL[codeIndex]] = rowL[nameIndex]
+
+    return partitionsD
+
+# =============================================================================
+def buildAquifers (aqfrFile):
+
+    stampL      = nwisTables.sourceStamp(aqfrFile)
+    partitionsD = readAquiferCodes(aqfrFile)
+
+    metaD = {
+        'source': os.path.basename(aqfrFile),
+        'stamp':  stampL,
+        'codes':  dict([(state_cd, len(codesD)) for state_cd, codesD in partitionsD.items()])
+    }
+    bytesL = nwisSnapshot.packBlobs([(state_cd, marshal.dumps(codesD)) for state_cd, codesD in sorted(partitionsD.items())], metaD)
+
+    return metaD, bytesL
+
+# =============================================================================
+def writeAquifers (aqfrFile, metaD, bytesL):
+
+    return nwisSnapshot.writePacked(aquiferFileName(aqfrFile), aquiferMagic, aquiferVersion, metaD, bytesL)
+
+# =============================================================================
+def openAquifers (aqfrFile):
+
+    aquifer_file = aquiferFileName(aqfrFile)
+    stampL       = nwisTables.sourceStamp(aqfrFile)
+
+    try:
+        packStamp = os.stat(aquifer_file).st_mtime_ns
+    except OSError:
+        packStamp = None
+
+    # Compiled file already mapped by this process
+    #
+    aquiferD = aquiferCacheD.get(aqfrFile)
+    if aquiferD is not None and aquiferD['stamp'] == stampL and aquiferD['packStamp'] == packStamp:
+        return aquiferD
+
+    metaD, viewsD, mm = None, None, None
+    if packStamp is not None:
+        metaD, viewsD, mm = nwisSnapshot.mapPacked(aquifer_file, aquiferMagic, aquiferVersion)
+
+    # Rebuild a missing or stale compiled file; this process serves the
+    #  partitions from memory and later ones map the new file
+    #
+    if metaD is None or metaD['stamp'] != stampL:
+        metaD, bytesL = buildAquifers(aqfrFile)
+        viewsD, mm    = dict(zip(metaD['blobs'], bytesL)), None
+        try:
+            writeAquifers(aqfrFile, metaD, bytesL)
+            packStamp = os.stat(aquifer_file).st_mtime_ns
+        except OSError:
+            packStamp = None
+
+    aquiferD = {
+        'stamp':      stampL,
+        'packStamp':  packStamp,
+        'meta':       metaD,
+        'views':      viewsD,
+        'mmap':       mm,
+        'partitions': {}
+    }
+    aquiferCacheD[aqfrFile] = aquiferD
+
+    return aquiferD
+
+# =============================================================================
+def aquiferPartition (aquiferD, state_cd):
+
+    partitionsD = aquiferD['partitions']
+
+    codesD = partitionsD.get(state_cd)
+    if codesD is None:
+        blob = aquiferD['views'].get(state_cd)
+        codesD = marshal.loads(blob) if blob is not None else {}
+        partitionsD[state_cd] = codesD
+
+    return codesD
+
+# =============================================================================
+class StateAquifers (dict):
+
+    # Aquifer names of one state; other codes are resolved on demand from
+    #  the national partition and then from the last name given to the code
+    #
+    def __init__ (self, aquiferD, state_cd):
+
+        dict.__init__(self, aquiferPartition(aquiferD, state_cd))
+        self.aquiferD = aquiferD
+        self.state_cd = state_cd
+
+    def __missing__ (self, aqfr_cd):
+
+        for state_cd in [nationalState, anyState]:
+            codesD = aquiferPartition(self.aquiferD, state_cd)
+            if aqfr_cd in codesD:
+                self[aqfr_cd] = codesD[aqfr_cd]
+                return self[aqfr_cd]
+
+        raise KeyError(aqfr_cd)
+
+# =============================================================================
+def stateAquifers (aqfrFile, state_cd):
+
+    try:
+        aquiferD = openAquifers(aqfrFile)
+    except (OSError, ValueError, StopIteration):
+        return None
+
+    if aquiferD['meta']['codes'].get(anyState, 0) < 1:
+        return None
+
+    return StateAquifers(aquiferD, state_cd)
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile the NWIS aquifer code table into partitions by state')
+    parser.add_argument('aqfr_files', nargs='+', help='NWIS aquifer code tables (aqfr_cd_query.txt)')
+    args = parser.parse_args()
+
+    for aqfr_file in args.aqfr_files:
+        metaD, bytesL = buildAquifers(aqfr_file)
+        aquifer_file  = writeAquifers(aqfr_file, metaD, bytesL)
+        print('%s: %d states, %d codes in %s' % (aqfr_file, len(metaD['codes']) - 1, metaD['codes'][anyState], aquifer_file))
+
+    sys.exit()
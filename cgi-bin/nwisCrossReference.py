@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisCrossReference.py
+#
+# Project:  wellConstruction
+# Purpose:  Module translates between USGS site numbers and the OWRD well
+#            log ids (gw_coop) and other agency ids (gw_otid) of the wells.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# gw_coop_01.txt holds the cooperator (OWRD well log) id of a site as
+#  written in NWIS, county and number padded apart ('DESC  1234'), and
+#  gw_otid_01.txt the ids other agencies gave it (otid_id, assigner_nm).
+#  Both tables are read once into hash indexes in each direction:
+#
+#    coop_site_no -> site_no     site_no -> coop_site_no
+#    otid_id      -> site_no     site_no -> otid_id, assigner_nm
+#
+#  Ids are compared without case or padding, and an id of a four letter
+#  county code and a number is written the OWRD way (DESC0001234), so the
+#  ids the web pages accept find the NWIS rows. The indexes are marshalled
+#  to data/well_cross_reference.xref for the next process and built again
+#  when either table changes.
+#
+#    /cgi-bin/lithology/requestUsgsCrossReference.py?coop_site_no=DESC0008977,MARI0012345
+#    {"coop_site_no": {"DESC0008977": ["433233121300601"], "MARI0012345": []}}
+#
+#    /cgi-bin/lithology/requestUsgsCrossReference.py?site_no=420030121224201
+#    {"site_no": {"420030121224201": {"coop_site_no": ["KLAM0052964"],
+#                                    "otid_id": [{"otid_id": "L50201", "assigner_nm": "OR004"}]}}}
+#
+#  Adding sections (well_construction, gw_geoh) returns the well documents
+#  of the sites found under "wells", keyed by site_no like a batch
+#  requestUsgsWell.py response.
+#
+#  Time the translations on the shipped tables with
+#
+#    python nwisCrossReference.py DESC0008977 420030121224201
+#
+###############################################################################
+
+import os, sys, re
+
+import json
+
+import threading
+
+import nwisTables
+
+import nwisSchema
+
+import usgsWellData
+
+import wellTiming
+
+coop_table_nm  = 'gw_coop'
+otid_table_nm  = 'gw_otid'
+identifiersL   = ['coop_site_no', 'otid_id', 'site_no']
+reference_file = os.path.join(usgsWellData.data_dir, "well_cross_reference.xref")
+
+owrdPattern    = re.compile(r'^([A-Z]{4}) ?(\d{1,7})$')
+
+# Indexes built by this process
+#
+referenceD     = None
+referenceLock  = threading.Lock()
+
+# =============================================================================
+def idKey (identifier):
+
+    # Case and runs of blanks are ignored; county code and number are
+    #  joined the way OWRD writes a well log id
+    #
+    value = ' '.join(identifier.split()).upper()
+
+    match = owrdPattern.match(value)
+    if match:
+        return '%s%07d' % (match.group(1), int(match.group(2)))
+
+    return value
+
+# =============================================================================
+def buildCrossReference (coopFile, otidFile):
+
+    coopD  = {}
+    otidD  = {}
+    sitesD = {}
+
+    # Each id is kept once per site in table order
+    #
+    for site_no, coop_site_no in nwisSchema.tableRows(coopFile, ['site_no', 'coop_site_no']):
+        if site_no is None or coop_site_no is None:
+            continue
+        key   = idKey(coop_site_no)
+        siteD = sitesD.setdefault(site_no, {'coop_site_no': [], 'otid_id': []})
+        if key not in siteD['coop_site_no']:
+            siteD['coop_site_no'].append(key)
+            coopD.setdefault(key, []).append(site_no)
+
+    for site_no, otid_id, assigner_nm in nwisSchema.tableRows(otidFile, ['site_no', 'otid_id', 'assigner_nm']):
+        if site_no is None or otid_id is None:
+            continue
+        key   = idKey(otid_id)
+        siteD = sitesD.setdefault(site_no, {'coop_site_no': [], 'otid_id': []})
+        otidL = otidD.setdefault(key, [])
+        if site_no not in otidL:
+            otidL.append(site_no)
+        siteD['otid_id'].append({'otid_id': otid_id.strip(), 'assigner_nm': assigner_nm})
+
+    return {
+        'stamp':        [nwisTables.sourceStamp(coopFile), nwisTables.sourceStamp(otidFile)],
+        'coop_site_no': coopD,
+        'otid_id':      otidD,
+        'site_no':      sitesD
+    }
+
+# =============================================================================
+def loadCrossReference ():
+
+    global referenceD
+
+    coopFile = usgsWellData.nwisFileName(coop_table_nm)
+    otidFile = usgsWellData.nwisFileName(otid_table_nm)
+
+    for nwis_file in [coopFile, otidFile]:
+        if not os.path.exists(nwis_file):
+            message = "NWIS file %s does not exist" % nwis_file
+            raise usgsWellData.WellDataError(message)
+
+    stampL = [nwisTables.sourceStamp(coopFile), nwisTables.sourceStamp(otidFile)]
+
+    crossD = referenceD
+    if crossD is not None and crossD['stamp'] == stampL:
+        return crossD
+
+    # One thread reads new or replaced tables; the others wait for it and
+    #  requests already running keep the indexes they started with
+    #
+    with referenceLock:
+        if referenceD is None or referenceD['stamp'] != stampL:
+            referenceD = compiledCrossReference(coopFile, otidFile, stampL)
+
+    return referenceD
+
+# =============================================================================
+def compiledCrossReference (coopFile, otidFile, stampL):
+
+    import marshal
+
+    # Indexes marshalled by an earlier process from the same tables
+    #
+    try:
+        with open(reference_file, "rb") as fh:
+            crossD = marshal.loads(fh.read())
+        if crossD['stamp'] == stampL:
+            return crossD
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    crossD = buildCrossReference(coopFile, otidFile)
+
+    # A read-only data directory builds them in every process
+    #
+    temp_file = '%s.%d.tmp' % (reference_file, os.getpid())
+    try:
+        with open(temp_file, "wb") as fh:
+            marshal.dump(crossD, fh)
+        os.replace(temp_file, reference_file)
+    except OSError:
+        pass
+
+    return crossD
+
+# =============================================================================
+def translate (crossD, identifier, idsL):
+
+    indexD   = crossD[identifier]
+    resultsD = {}
+
+    # Sites are looked up as given, other ids by their key
+    #
+    if identifier == 'site_no':
+        for site_no in idsL:
+            resultsD[site_no] = indexD.get(site_no, {'coop_site_no': [], 'otid_id': []})
+    else:
+        for value in idsL:
+            resultsD[value] = indexD.get(idKey(value), [])
+
+    return resultsD
+
+# =============================================================================
+def requestedIds (params):
+
+    # The first id parameter given is translated
+    #
+    for identifier in identifiersL:
+        if len(params.get(identifier, '')) > 0:
+            return identifier, usgsWellData.siteNumbers(params[identifier])
+
+    message = "Requires a NWIS site number, OWRD well log id or other agency id"
+    raise usgsWellData.WellDataError(message)
+
+# =============================================================================
+def wellsJson (siteL, sectionsL, definitionsD, aqfrInfoD=None):
+
+    # Well documents keyed by site_no, as a batch request returns them
+    #
+    if len(siteL) == 1:
+        return '{"%s":%s}' % (siteL[0], usgsWellData.wellJson(siteL[0], sectionsL, definitionsD, aqfrInfoD))
+
+    return usgsWellData.wellJson(','.join(siteL), sectionsL, definitionsD, aqfrInfoD)
+
+# =============================================================================
+def crossReferenceJson (params, definitionsD=None, aqfrInfoD=None):
+
+    identifier, idsL = requestedIds(params)
+
+    with wellTiming.phase('crossreference'):
+        resultsD = translate(loadCrossReference(), identifier, idsL)
+
+    membersL = ['"%s":%s' % (identifier, json.dumps(resultsD))]
+
+    # With sections the well documents of the sites found come in the same
+    #  response, so a page holding only an OWRD id needs one request
+    #
+    if len(params.get('sections', '')) > 0:
+        sectionsL = usgsWellData.wellSections(params['sections'])
+
+        siteL = []
+        for value in idsL:
+            for site_no in ([value] if identifier == 'site_no' else resultsD[value]):
+                if site_no not in siteL:
+                    siteL.append(site_no)
+
+        if len(siteL) > 0:
+            membersL.append('"wells":%s' % wellsJson(siteL, sectionsL, definitionsD, aqfrInfoD))
+
+    return "{" + ",".join(membersL) + "}"
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    import time
+
+    parser = argparse.ArgumentParser(description='Translate USGS site numbers, OWRD well log ids and other agency ids')
+    parser.add_argument('ids', nargs='+', help='Site numbers or well ids')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        crossD = loadCrossReference()
+    except usgsWellData.WellDataError as e:
+        print(str(e))
+        sys.exit(1)
+    print('indexes built in %.1f ms: %d OWRD ids, %d other ids, %d sites' % ((time.perf_counter() - started) * 1000.0, len(crossD['coop_site_no']),
+                                                                           len(crossD['otid_id']), len(crossD['site_no'])))
+
+    for value in args.ids:
+
+        # Site numbers are all digits; other ids are OWRD ids when they
+        #  match one
+        #
+        identifier = 'site_no'
+        if not value.strip().isdigit():
+            identifier = 'coop_site_no' if len(translate(crossD, 'coop_site_no', [value])[value]) > 0 else 'otid_id'
+
+        started    = time.perf_counter()
+        for count in range(10000):
+            resultsD = translate(crossD, identifier, [value])
+        print('%s %s: %s (%.2f us)' % (identifier, value, json.dumps(resultsD[value]), (time.perf_counter() - started) * 100.0))
+
+    sys.exit()
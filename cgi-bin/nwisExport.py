@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisExport.py
+#
+# Project:  wellConstruction
+# Purpose:  Module streams the shaped well construction and lithology records
+#            of every well, or of the wells of a network, as NDJSON or CSV.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The NWIS RDB dumps are sorted and grouped by site_no, so the export reads
+#  gw_cons, gw_hole, gw_csng, gw_open and gw_geoh once each, front to back
+#  and side by side: the row groups of the tables are merged on site_no and
+#  every site is shaped by the record functions of usgsWellData.py (seal_ds,
+#  csng_material_ds, open_ds, lith_ds, lith_unit_ds) as soon as its last
+#  group is read. Only the rows of one site per table are held, whatever
+#  the number of wells exported.
+#
+#  NDJSON gives one line per site, the requestUsgsWell.py document of the
+#  site with its site_no first
+#
+#    {"site_no":"420030121224201","well_construction":{"gw_cons":[...],...},"gw_geoh":[...]}
+#
+#  and CSV one row per record, keyed by site_no and table_nm, with the
+#  columns of all the tables and blanks where a table has none. A site
+#  holding a code missing from the code tables is given as a message line
+#  in NDJSON and left out of CSV, and the export goes on.
+#
+#    /cgi-bin/lithology/requestUsgsExport.py?format=ndjson
+#    /cgi-bin/lithology/requestUsgsExport.py?format=csv&netw_cd=WL&gzip=1
+#
+#  netw_cd limits the export to the sites of the networks of gw_netw_01.txt
+#  and sections (well_construction, gw_geoh) to those tables. The output
+#  is written in chunks of about chunk_bytes without a Content-Length, so
+#  the web server sends it with chunked transfer, and compressed as one
+#  gzip stream with gzip=1 or when the client accepts gzip.
+#
+#  Export to a file and report the peak traced memory with
+#
+#    python nwisExport.py --format csv --netw-cd WL --gzip -o wl.csv.gz --memory
+#
+###############################################################################
+
+import os, sys
+
+import io
+
+import json
+
+import heapq
+
+import zlib
+
+import itertools
+
+import nwisSchema
+
+import usgsWellData
+
+network_table_nm = 'gw_netw'
+chunk_bytes      = 64 * 1024
+
+# Response formats and their content types
+#
+exportFormatsD   = {
+    'ndjson': 'application/x-ndjson',
+    'csv':    'text/csv; charset=utf-8'
+}
+
+# CSV columns of the shaped records of each table, in output order
+#
+exportColumnsD   = {
+    'gw_cons': ['cons_seq_nu', 'seal_depth_va', 'seal_ds'],
+    'gw_hole': ['cons_seq_nu', 'hole_seq_nu', 'hole_top_va', 'hole_bottom_va', 'hole_dia_va'],
+    'gw_csng': ['cons_seq_nu', 'csng_seq_nu', 'csng_top_va', 'csng_bottom_va', 'csng_dia_va', 'csng_material_cd', 'csng_material_ds'],
+    'gw_open': ['cons_seq_nu', 'open_seq_nu', 'open_top_va', 'open_bottom_va', 'open_dia_va', 'open_cd', 'open_ds'],
+    'gw_geoh': ['geoh_seq_nu', 'lith_top_va', 'lith_bottom_va', 'lith_cd', 'lith_ds', 'lith_unit_cd', 'lith_unit_ds']
+}
+
+# =============================================================================
+def csvColumns (table_nmL):
+
+    columnsL = ['site_no', 'table_nm']
+    for table_nm in table_nmL:
+        for column in exportColumnsD[table_nm]:
+            if column not in columnsL:
+                columnsL.append(column)
+
+    return columnsL
+
+# =============================================================================
+def exportFormat (params):
+
+    # NDJSON unless CSV is asked for
+    #
+    export_format = params.get('format', '').lower()
+    if len(export_format) < 1:
+        return 'ndjson'
+
+    if export_format not in exportFormatsD:
+        message = "Unknown format %s; choose from %s" % (export_format, ", ".join(exportFormatsD.keys()))
+        raise usgsWellData.WellDataError(message)
+
+    return export_format
+
+# =============================================================================
+def exportCompressed (params, accept_encoding=''):
+
+    if params.get('gzip', '').lower() in ['1', 'true', 'yes']:
+        return True
+
+    # Quality of each content coding the client lists; q=0 refuses it and
+    #  gzip named by the client wins over the '*' wildcard
+    #
+    qualityD = {}
+    for item in (accept_encoding or '').split(','):
+        partsL  = item.split(';')
+        coding  = partsL[0].strip().lower()
+        quality = 1.0
+        for part in partsL[1:]:
+            name, sep, value = part.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if len(coding) > 0:
+            qualityD[coding] = quality
+
+    return qualityD.get('gzip', qualityD.get('x-gzip', qualityD.get('*', 0.0))) > 0.0
+
+# =============================================================================
+def networkSites (networks):
+
+    nwisFile = usgsWellData.nwisFileName(network_table_nm)
+    if not os.path.exists(nwisFile):
+        message = "NWIS file %s does not exist" % nwisFile
+        raise usgsWellData.WellDataError(message)
+
+    netw_cdL = [netw_cd.strip().upper() for netw_cd in networks.split(',') if len(netw_cd.strip()) > 0]
+
+    # Sites of the networks asked for, and every network code to name
+    #  the ones that exist when a code is not found
+    #
+    siteS    = set()
+    networkS = set()
+    for site_no, netw_cd in nwisSchema.tableRows(nwisFile, ['site_no', 'netw_cd']):
+        if site_no is None or netw_cd is None:
+            continue
+        networkS.add(netw_cd)
+        if netw_cd in netw_cdL:
+            siteS.add(site_no)
+
+    for netw_cd in netw_cdL:
+        if netw_cd not in networkS:
+            message = "Unknown network %s; choose from %s" % (netw_cd, ", ".join(sorted(networkS)))
+            raise usgsWellData.WellDataError(message)
+
+    return siteS
+
+# =============================================================================
+def tableGroups (table_nm, order):
+
+    # Rows of one table grouped by site in file order, tagged with the
+    #  position of the table so groups of the same site merge in turn
+    #
+    columnsL = ['site_no'] + usgsWellData.table_columnsD[table_nm]
+    rowsI    = nwisSchema.tableRows(usgsWellData.nwisFileName(table_nm), columnsL, record='slots')
+
+    for site_no, groupI in itertools.groupby(rowsI, key=lambda record: record.site_no):
+        if site_no is not None:
+            yield site_no, order, list(groupI)
+
+# =============================================================================
+def exportSites (table_nmL, siteS=None):
+
+    # One pass over all the tables at once: the row groups are merged on
+    #  site_no and every site is handed on with the rows of each table
+    #
+    groupsL = [tableGroups(table_nm, order) for order, table_nm in enumerate(table_nmL)]
+
+    for site_no, mergedI in itertools.groupby(heapq.merge(*groupsL), key=lambda group: group[0]):
+        if siteS is not None and site_no not in siteS:
+            continue
+
+        tablesD = dict([(table_nm, []) for table_nm in table_nmL])
+        for site, order, rowsL in mergedI:
+            tablesD[table_nmL[order]] = rowsL
+
+        yield site_no, tablesD
+
+# =============================================================================
+def siteRecords (tablesD, sectionsL, definitionsD, aqfrInfoD):
+
+    # Shaped records of a site by table, as the well documents hold them
+    #
+    recordsL = []
+    if 'well_construction' in sectionsL:
+        recordsL.append(('gw_cons', usgsWellData.sealRecords(tablesD['gw_cons'], definitionsD['seal_cd'])))
+        recordsL.append(('gw_hole', usgsWellData.holeRecords(tablesD['gw_hole'])))
+        recordsL.append(('gw_csng', usgsWellData.casingRecords(tablesD['gw_csng'], definitionsD['csng_material_cd'])))
+        recordsL.append(('gw_open', usgsWellData.openRecords(tablesD['gw_open'], definitionsD['open_cd'])))
+    if 'gw_geoh' in sectionsL:
+        recordsL.append(('gw_geoh', usgsWellData.geohRecords(tablesD['gw_geoh'], definitionsD['lith_cd'], aqfrInfoD)))
+
+    return recordsL
+
+# =============================================================================
+def ndjsonLines (sitesI, sectionsL, definitionsD, aqfrInfoD):
+
+    # A site that cannot be shaped is reported on its line, not the export
+    #
+    for site_no, tablesD in sitesI:
+        try:
+            document = usgsWellData.wellDocument(tablesD, sectionsL, definitionsD, aqfrInfoD)
+        except usgsWellData.WellDataError as e:
+            yield '{"site_no":%s,"message":%s}\n' % (json.dumps(site_no), json.dumps(str(e)))
+            continue
+
+        if document == '{}':
+            yield '{"site_no":%s}\n' % json.dumps(site_no)
+        else:
+            yield '{"site_no":%s,%s\n' % (json.dumps(site_no), document[1:])
+
+# =============================================================================
+def csvLines (sitesI, sectionsL, definitionsD, aqfrInfoD):
+
+    import csv
+
+    columnsL = csvColumns(usgsWellData.sectionTables(sectionsL))
+
+    # Rows of a site are written to a buffer that is emptied after each site
+    #
+    buffer   = io.StringIO()
+    writer   = csv.DictWriter(buffer, columnsL, restval='', extrasaction='ignore')
+    writer.writeheader()
+
+    for site_no, tablesD in sitesI:
+        try:
+            siteL = siteRecords(tablesD, sectionsL, definitionsD, aqfrInfoD)
+        except usgsWellData.WellDataError as e:
+            usgsWellData.screenLogger().info('Site %s: %s' % (site_no, e))
+            continue
+
+        for table_nm, recordsL in siteL:
+            for recordD in recordsL:
+                recordD['site_no']  = site_no
+                recordD['table_nm'] = table_nm
+                writer.writerow(recordD)
+
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield buffer.getvalue()
+
+# =============================================================================
+def exportChunks (linesI, compress=False):
+
+    # Lines are gathered into chunks of about chunk_bytes and compressed as
+    #  one gzip stream when asked
+    #
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    partsL = []
+    size   = 0
+    for line in linesI:
+        data    = line.encode('utf-8')
+        partsL.append(data)
+        size   += len(data)
+        if size < chunk_bytes:
+            continue
+
+        chunk  = b''.join(partsL)
+        partsL = []
+        size   = 0
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if len(chunk) > 0:
+            yield chunk
+
+    chunk = b''.join(partsL)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if len(chunk) > 0:
+        yield chunk
+
+# =============================================================================
+def exportStream (params, definitionsD, aqfrInfoD=None, compress=False):
+
+    # Parameters and tables are checked before the first chunk is sent, so
+    #  errors are still answered with a message
+    #
+    export_format = exportFormat(params)
+    sectionsL     = usgsWellData.wellSections(params.get('sections', ''))
+    table_nmL     = usgsWellData.sectionTables(sectionsL)
+
+    for table_nm in table_nmL:
+        nwisFile = usgsWellData.nwisFileName(table_nm)
+        if not os.path.exists(nwisFile):
+            message = "NWIS file %s does not exist" % nwisFile
+            raise usgsWellData.WellDataError(message)
+
+    siteS = None
+    if len(params.get('netw_cd', '')) > 0:
+        siteS = networkSites(params['netw_cd'])
+
+    sitesI = exportSites(table_nmL, siteS)
+
+    if export_format == 'csv':
+        linesI = csvLines(sitesI, sectionsL, definitionsD, aqfrInfoD)
+    else:
+        linesI = ndjsonLines(sitesI, sectionsL, definitionsD, aqfrInfoD)
+
+    return exportFormatsD[export_format], exportChunks(linesI, compress)
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    import time
+
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description='Export the shaped well construction and lithology records as NDJSON or CSV')
+    parser.add_argument('--format', default='ndjson', choices=list(exportFormatsD.keys()), help='Output format')
+    parser.add_argument('--netw-cd', default='', help='Export only the sites of these networks (WL,QW)')
+    parser.add_argument('--sections', default='', help='Sections exported (well_construction, gw_geoh); all by default')
+    parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+    parser.add_argument('-o', '--output', default=None, help='Output file; standard output by default')
+    parser.add_argument('--memory', action='store_true', help='Report the peak traced memory of the export')
+    args = parser.parse_args()
+
+    params = {'format': args.format, 'netw_cd': args.netw_cd, 'sections': args.sections}
+
+    try:
+        definitionsD = usgsWellData.loadDefinitions()
+        aqfrInfoD    = usgsWellData.loadAquifers()
+    except usgsWellData.WellDataError as e:
+        print(str(e))
+        sys.exit(1)
+
+    if args.memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    written = 0
+    try:
+        content_type, chunksI = exportStream(params, definitionsD, aqfrInfoD, args.gzip)
+        fh = open(args.output, "wb") if args.output is not None else sys.stdout.buffer
+        for chunk in chunksI:
+            fh.write(chunk)
+            written += len(chunk)
+        if args.output is not None:
+            fh.close()
+    except usgsWellData.WellDataError as e:
+        print(str(e))
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - started
+
+    if args.output is not None or args.memory:
+        reportL = ['%s %.2f MB in %.2f s' % (content_type.split(';')[0], written / 1048576.0, elapsed)]
+        if args.memory:
+            reportL.append('peak traced memory %.1f KB' % (tracemalloc.get_traced_memory()[1] / 1024.0))
+            tracemalloc.stop()
+        sys.stderr.write(', '.join(reportL) + '\n')
+
+    sys.exit()
@@ -0,0 +1,574 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisIntervals.py
+#
+# Project:  wellConstruction
+# Purpose:  Module finds the wells with lithology, open, casing or hole
+#            intervals in a depth range and with given codes through
+#            interval trees and inverted code indexes.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The tables registered with an interval (gw_geoh, gw_open, gw_csng and
+#  gw_hole; see nwisRegistry.py) are read once into
+#
+#    a centered interval tree over the top and bottom depths of the rows,
+#     one for all rows and one per code (lith_cd, open_cd,
+#     csng_material_cd), answering "which rows overlap top,bottom" in
+#     O(log n + matches)
+#    an inverted index from each code to the sites using it
+#
+#  The depths, sites and tree nodes are flat typed arrays, marshalled as
+#  bytes to data/well_intervals.ivl so a CGI process loads them in a few
+#  milliseconds, and rebuilt when one of the tables changes.
+#
+# A filter request names depth ranges (top,bottom in feet; either end may
+#  be left open) and codes per table; a site matches a table filter when
+#  one row overlaps the range with one of the codes, and the filters of
+#  several tables must all match. Sites come back sorted and paged:
+#
+#    /cgi-bin/lithology/requestUsgsFilter.py?lith_cd=BSLT&lith_depth=100,300
+#    /cgi-bin/lithology/requestUsgsFilter.py?open_depth=500,&limit=50&offset=50
+#    {"count": 1234, "offset": 0, "limit": 100, "site_no": ["413640121124301", ...]}
+#
+#  Time the filters on the shipped tables with
+#
+#    python nwisIntervals.py
+#
+###############################################################################
+
+import os, sys
+
+import json
+
+import threading
+
+from array import array
+
+import nwisTables
+
+import nwisSchema
+
+import nwisRegistry
+
+import usgsWellData
+
+import wellTiming
+
+interval_file  = os.path.join(usgsWellData.data_dir, "well_intervals.ivl")
+default_limit  = 100
+
+# Indexes built by this process
+#
+intervalD      = None
+intervalLock   = threading.Lock()
+
+# =============================================================================
+def buildTree (topsL, bottomsL, rowsL):
+
+    centersL  = []
+    leftL     = []
+    rightL    = []
+    byTopL    = []
+    byBottomL = []
+
+    # Each node keeps the rows spanning its center, sorted by top and by
+    #  bottom (deepest first); rows wholly above or below go to the left or
+    #  right subtree. The median midpoint lies in at least one row, so
+    #  every node holds a row
+    #
+    pendingL = [(rowsL, -1, None)] if len(rowsL) > 0 else []
+    while len(pendingL) > 0:
+        itemsL, parent, side = pendingL.pop()
+
+        node = len(centersL)
+        if parent >= 0:
+            (leftL if side == 'left' else rightL)[parent] = node
+
+        midpointsL = sorted([(topsL[row] + bottomsL[row]) / 2.0 for row in itemsL])
+        center     = midpointsL[len(midpointsL) // 2]
+
+        hereL      = [row for row in itemsL if topsL[row] <= center <= bottomsL[row]]
+        lowerL     = [row for row in itemsL if bottomsL[row] < center]
+        upperL     = [row for row in itemsL if topsL[row] > center]
+
+        centersL.append(center)
+        leftL.append(-1)
+        rightL.append(-1)
+        byTopL.append(sorted(hereL, key=lambda row: topsL[row]))
+        byBottomL.append(sorted(hereL, key=lambda row: -bottomsL[row]))
+
+        if len(lowerL) > 0:
+            pendingL.append((lowerL, node, 'left'))
+        if len(upperL) > 0:
+            pendingL.append((upperL, node, 'right'))
+
+    # Rows of node n are entries start[n] to start[n + 1] of the top and
+    #  bottom orders
+    #
+    startL = [0]
+    for hereL in byTopL:
+        startL.append(startL[-1] + len(hereL))
+
+    return {
+        'center': array('d', centersL).tobytes(),
+        'left':   array('i', leftL).tobytes(),
+        'right':  array('i', rightL).tobytes(),
+        'start':  array('i', startL).tobytes(),
+        'top':    array('i', [row for hereL in byTopL for row in hereL]).tobytes(),
+        'bottom': array('i', [row for hereL in byBottomL for row in hereL]).tobytes()
+    }
+
+# =============================================================================
+def arrayValues (kind, data):
+
+    values = array(kind)
+    values.frombytes(data)
+
+    return values
+
+# =============================================================================
+def openTree (treeD):
+
+    return {
+        'center': arrayValues('d', treeD['center']),
+        'left':   arrayValues('i', treeD['left']),
+        'right':  arrayValues('i', treeD['right']),
+        'start':  arrayValues('i', treeD['start']),
+        'top':    arrayValues('i', treeD['top']),
+        'bottom': arrayValues('i', treeD['bottom'])
+    }
+
+# =============================================================================
+def overlapRows (treeD, topsA, bottomsA, top, bottom):
+
+    rowsL = []
+    if len(treeD['center']) < 1:
+        return rowsL
+
+    centersA  = treeD['center']
+    leftA     = treeD['left']
+    rightA    = treeD['right']
+    startA    = treeD['start']
+    byTopA    = treeD['top']
+    byBottomA = treeD['bottom']
+
+    # Rows overlapping top,bottom: below a node's center only the rows
+    #  starting above the range bottom overlap, above it only those ending
+    #  below the range top; a center inside the range takes every row
+    #
+    pendingL = [0]
+    while len(pendingL) > 0:
+        node   = pendingL.pop()
+        center = centersA[node]
+
+        if bottom < center:
+            for row in byTopA[startA[node]:startA[node + 1]]:
+                if topsA[row] > bottom:
+                    break
+                rowsL.append(row)
+            if leftA[node] >= 0:
+                pendingL.append(leftA[node])
+
+        elif top > center:
+            for row in byBottomA[startA[node]:startA[node + 1]]:
+                if bottomsA[row] < top:
+                    break
+                rowsL.append(row)
+            if rightA[node] >= 0:
+                pendingL.append(rightA[node])
+
+        else:
+            rowsL.extend(byTopA[startA[node]:startA[node + 1]])
+            if leftA[node] >= 0:
+                pendingL.append(leftA[node])
+            if rightA[node] >= 0:
+                pendingL.append(rightA[node])
+
+    return rowsL
+
+# =============================================================================
+def buildTableIntervals (nwisFile, intervalL):
+
+    top_column, bottom_column, code_column = intervalL
+
+    columnsL  = ['site_no', top_column, bottom_column] + ([code_column] if code_column is not None else [])
+    siteL     = []
+    siteD     = {}
+    topsL     = []
+    bottomsL  = []
+    sitesL    = []
+    codesL    = []
+    postingsD = {}
+
+    for recordT in nwisSchema.tableRows(nwisFile, columnsL):
+        site_no = recordT[0]
+        if site_no is None:
+            continue
+        code    = recordT[3] if code_column is not None else None
+
+        if site_no not in siteD:
+            siteD[site_no] = len(siteL)
+            siteL.append(site_no)
+        site = siteD[site_no]
+
+        # Codes find their sites with or without depths
+        #
+        if code is not None:
+            postingL = postingsD.setdefault(code, [])
+            if len(postingL) < 1 or postingL[-1] != site:
+                postingL.append(site)
+
+        # Only rows with both depths are intervals; a reversed pair is
+        #  taken top first
+        #
+        top, bottom = recordT[1], recordT[2]
+        if top is None or bottom is None:
+            continue
+        topsL.append(min(top, bottom))
+        bottomsL.append(max(top, bottom))
+        sitesL.append(site)
+        codesL.append(code)
+
+    rowsL  = list(range(len(topsL)))
+    treesD = {'': buildTree(topsL, bottomsL, rowsL)}
+
+    codeRowsD = {}
+    for row, code in enumerate(codesL):
+        if code is not None:
+            codeRowsD.setdefault(code, []).append(row)
+    for code, codeRowsL in codeRowsD.items():
+        treesD[code] = buildTree(topsL, bottomsL, codeRowsL)
+
+    return {
+        'sites':    siteL,
+        'top':      array('d', topsL).tobytes(),
+        'bottom':   array('d', bottomsL).tobytes(),
+        'site':     array('i', sitesL).tobytes(),
+        'trees':    treesD,
+        'postings': dict([(code, array('i', sorted(postingL)).tobytes()) for code, postingL in postingsD.items()])
+    }
+
+# =============================================================================
+def openTableIntervals (tableD):
+
+    # Typed arrays over the marshalled bytes
+    #
+    return {
+        'sites':    tableD['sites'],
+        'top':      arrayValues('d', tableD['top']),
+        'bottom':   arrayValues('d', tableD['bottom']),
+        'site':     arrayValues('i', tableD['site']),
+        'trees':    dict([(code, openTree(treeD)) for code, treeD in tableD['trees'].items()]),
+        'postings': dict([(code, arrayValues('i', postings)) for code, postings in tableD['postings'].items()])
+    }
+
+# =============================================================================
+def intervalFiles ():
+
+    return [(table_nm, usgsWellData.nwisFileName(table_nm)) for table_nm in nwisRegistry.intervalTables()]
+
+# =============================================================================
+def buildIntervals ():
+
+    intervalsD = {'stamp': [nwisTables.sourceStamp(nwis_file) for table_nm, nwis_file in intervalFiles()], 'tables': {}}
+
+    for table_nm, nwis_file in intervalFiles():
+        intervalsD['tables'][table_nm] = buildTableIntervals(nwis_file, nwisRegistry.tableInterval(table_nm))
+
+    return intervalsD
+
+# =============================================================================
+def loadIntervals ():
+
+    global intervalD
+
+    for table_nm, nwis_file in intervalFiles():
+        if not os.path.exists(nwis_file):
+            message = "NWIS file %s does not exist" % nwis_file
+            raise usgsWellData.WellDataError(message)
+
+    stampL = [nwisTables.sourceStamp(nwis_file) for table_nm, nwis_file in intervalFiles()]
+
+    intervalsD = intervalD
+    if intervalsD is not None and intervalsD['stamp'] == stampL:
+        return intervalsD
+
+    # One thread reads new or replaced tables; the others wait for it and
+    #  requests already running keep the indexes they started with
+    #
+    with intervalLock:
+        if intervalD is None or intervalD['stamp'] != stampL:
+            intervalD = compiledIntervals(stampL)
+
+    return intervalD
+
+# =============================================================================
+def compiledIntervals (stampL):
+
+    import marshal
+
+    # Indexes marshalled by an earlier process from the same tables
+    #
+    try:
+        with open(interval_file, "rb") as fh:
+            intervalsD = marshal.loads(fh.read())
+        if intervalsD['stamp'] == stampL:
+            return openIntervals(intervalsD)
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    intervalsD = buildIntervals()
+
+    # A read-only data directory builds them in every process
+    #
+    temp_file = '%s.%d.tmp' % (interval_file, os.getpid())
+    try:
+        with open(temp_file, "wb") as fh:
+            marshal.dump(intervalsD, fh)
+        os.replace(temp_file, interval_file)
+    except OSError:
+        pass
+
+    return openIntervals(intervalsD)
+
+# =============================================================================
+def openIntervals (intervalsD):
+
+    return {
+        'stamp':  intervalsD['stamp'],
+        'tables': dict([(table_nm, openTableIntervals(tableD)) for table_nm, tableD in intervalsD['tables'].items()])
+    }
+
+# =============================================================================
+def depthRange (parameter, value):
+
+    # top,bottom in feet with either end left open; a single depth is a
+    #  range of its own
+    #
+    partsL = [part.strip() for part in value.split(',')]
+    if len(partsL) == 1:
+        partsL = partsL * 2
+
+    try:
+        if len(partsL) != 2 or partsL == ['', '']:
+            raise ValueError(value)
+        top    = float(partsL[0]) if len(partsL[0]) > 0 else float('-inf')
+        bottom = float(partsL[1]) if len(partsL[1]) > 0 else float('inf')
+    except ValueError:
+        message = "Depth range %s must be given as top,bottom in feet" % parameter
+        raise usgsWellData.WellDataError(message)
+
+    if top > bottom:
+        top, bottom = bottom, top
+
+    return top, bottom
+
+# =============================================================================
+def tableSites (tableD, depthT, codesL):
+
+    # Codes alone are answered from the inverted index
+    #
+    if depthT is None:
+        siteS = set()
+        for code in codesL:
+            siteS.update(tableD['postings'].get(code, []))
+        return siteS
+
+    top, bottom = depthT
+    sitesL      = tableD['site']
+    siteS       = set()
+    for code in (codesL if codesL is not None else ['']):
+        treeD = tableD['trees'].get(code)
+        if treeD is not None:
+            siteS.update([sitesL[row] for row in overlapRows(treeD, tableD['top'], tableD['bottom'], top, bottom)])
+
+    return siteS
+
+# =============================================================================
+def tableFilters (params):
+
+    filtersL = []
+
+    # Depth range and codes requested of each table
+    #
+    for table_nm in nwisRegistry.intervalTables():
+        depth_parm  = nwisRegistry.depthParameter(table_nm)
+        code_column = nwisRegistry.tableInterval(table_nm)[2]
+
+        depthT = None
+        if len(params.get(depth_parm, '').strip()) > 0:
+            depthT = depthRange(depth_parm, params[depth_parm])
+
+        codesL = None
+        if code_column is not None and len(params.get(code_column, '').strip()) > 0:
+            codesL = []
+            for code in params[code_column].split(','):
+                code = code.strip().upper()
+                if len(code) > 0 and code not in codesL:
+                    codesL.append(code)
+
+        if depthT is not None or codesL is not None:
+            filtersL.append((table_nm, depthT, codesL))
+
+    if len(filtersL) < 1:
+        message = "Requires a depth range or code filter; choose from %s" % ", ".join(nwisRegistry.filterParameters())
+        raise usgsWellData.WellDataError(message)
+
+    return filtersL
+
+# =============================================================================
+def filterSites (intervalsD, params):
+
+    matchS = None
+
+    # Each table filter gives a set of sites; the sites of every table
+    #  filter requested are kept
+    #
+    for table_nm, depthT, codesL in tableFilters(params):
+        tableD = intervalsD['tables'][table_nm]
+        with wellTiming.phase(table_nm):
+            siteS = set([tableD['sites'][site] for site in tableSites(tableD, depthT, codesL)])
+
+        matchS = siteS if matchS is None else matchS & siteS
+        if len(matchS) < 1:
+            break
+
+    return sorted(matchS)
+
+# =============================================================================
+def scanSites (params):
+
+    matchS = None
+
+    # The same filters answered by reading every row of the tables; kept
+    #  as the reference the indexes are checked against
+    #
+    for table_nm, depthT, codesL in tableFilters(params):
+        siteS = set()
+        columnsL = ['site_no'] + [column for column in nwisRegistry.tableInterval(table_nm) if column is not None]
+        for recordT in nwisSchema.tableRows(usgsWellData.nwisFileName(table_nm), columnsL):
+            site_no, top, bottom, code = (recordT + (None,))[:4]
+            if codesL is not None and code not in codesL:
+                continue
+            if depthT is not None:
+                if top is None or bottom is None:
+                    continue
+                if min(top, bottom) > depthT[1] or max(top, bottom) < depthT[0]:
+                    continue
+            siteS.add(site_no)
+
+        matchS = siteS if matchS is None else matchS & siteS
+
+    return sorted(matchS)
+
+# =============================================================================
+def pageParameter (params, name, default):
+
+    value = params.get(name, '').strip()
+    if len(value) < 1:
+        return default
+
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        message = "Paging argument %s must be a whole number" % name
+        raise usgsWellData.WellDataError(message)
+
+    return number
+
+# =============================================================================
+def filterJson (params):
+
+    # Pages are limited to a batch request of well documents
+    #
+    offset = pageParameter(params, 'offset', 0)
+    limit  = min(pageParameter(params, 'limit', default_limit), usgsWellData.max_batch_sites)
+
+    with wellTiming.phase('intervals'):
+        intervalsD = loadIntervals()
+
+    siteL = filterSites(intervalsD, params)
+
+    return json.dumps({
+        'count':   len(siteL),
+        'offset':  offset,
+        'limit':   limit,
+        'site_no': siteL[offset:offset + limit]
+    })
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    import time
+
+    parser = argparse.ArgumentParser(description='Time depth-range and code filters over the NWIS interval indexes')
+    parser.add_argument('--rebuild', action='store_true', help='Build the indexes from the tables even when the compiled file is current')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        if args.rebuild:
+            intervalD = openIntervals(buildIntervals())
+        else:
+            intervalD = loadIntervals()
+    except usgsWellData.WellDataError as e:
+        print(str(e))
+        sys.exit(1)
+    print('indexes loaded in %.1f ms' % ((time.perf_counter() - started) * 1000.0))
+
+    for table_nm, tableD in intervalD['tables'].items():
+        print('%s: %d intervals, %d sites, %d codes' % (table_nm, len(tableD['top']), len(tableD['sites']), len(tableD['postings'])))
+
+    # Indexed filters against a scan of the tables
+    #
+    for paramsD in [{'lith_cd': 'BSLT', 'lith_depth': '100,300'},
+                    {'open_depth': '500,'},
+                    {'open_cd': 'S,P'},
+                    {'csng_material_cd': 'S', 'csng_depth': '0,20', 'lith_cd': 'CLAY'},
+                    {'hole_depth': '1000,1200'}]:
+
+        started = time.perf_counter()
+        for count in range(100):
+            siteL = filterSites(intervalD, paramsD)
+        indexed = (time.perf_counter() - started) * 10.0
+
+        started = time.perf_counter()
+        scanL   = scanSites(paramsD)
+        scanned = (time.perf_counter() - started) * 1000.0
+
+        print('%s: %d sites in %.3f ms, scan %.1f ms%s' % (json.dumps(paramsD), len(siteL), indexed, scanned,
+                                                         '' if siteL == scanL else ' (scan found %d sites)' % len(scanL)))
+
+    sys.exit()
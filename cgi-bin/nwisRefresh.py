@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisRefresh.py
+#
+# Project:  wellConstruction
+# Purpose:  Module refreshes the served NWIS extract from a new one, updating
+#            only the indexes, compiled tables and responses of the sites
+#            that changed, and publishes the new version at once.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# A nightly extract differs from the one being served in a few sites. The
+#  refresh reads every gw_*_01.txt table of the new extract and the table it
+#  replaces once, listing the site groups with the *_md modification times
+#  of their rows (cons_md, hole_md, ...), and takes a site as changed when
+#  it was added or removed or any of its rows was added, removed or
+#  modified:
+#
+#    python nwisRefresh.py /incoming/nwis
+#
+#  Tables without changed sites keep their files. For the others the new
+#  RDB file is staged with the sidecar index built in the same pass and a
+#  new snapshot. The responses of the changed sites are rendered again and
+#  those of every other site copied from the current response pack. The
+#  SQLite database, when there is one, is copied into the new version and
+#  has the rows of the changed sites replaced in one transaction.
+#
+# WELL_DATA_DIR must be a symbolic link (/srv/nwis/data -> data.<version>):
+#  the new version is built in a directory next to the current one, sharing
+#  the unchanged files through hard links, and published by replacing the
+#  link with one rename, so readers see either the old or the new version,
+#  never a mix. The previous version directory is kept for the requests
+#  still reading it and older ones are removed. A plain data directory is
+#  refused, since its files could only be replaced one at a time; link it
+#  once before the first refresh:
+#
+#    mv data data.initial && ln -s data.initial data
+#
+# A site whose rows change without a new *_md time is not picked up; run
+#  with --dry-run to list the changes without publishing them.
+#
+###############################################################################
+
+import os, sys, re, glob
+
+import time
+
+import shutil
+
+import nwisTables
+
+import nwisSnapshot
+
+import usgsWellData
+
+import nwisResponseCache
+
+stagePrefix    = '.refresh'
+versionPattern = '^%s\\.[0-9a-f]{16}$'
+
+# Files of a data version that are not shared with the next one; the
+#  database is written in place, so it is copied instead
+#
+unsharedL      = ['nwis.sqlite']
+
+# =============================================================================
+def tableChanges (current_file, new_file):
+
+    # Site groups of both extracts with the digest of their modification
+    #  times; the new index comes out of the same pass
+    #
+    newSignaturesD     = {}
+    indexD             = nwisTables.buildNwisIndex(new_file, newSignaturesD)
+
+    currentSignaturesD = {}
+    stampL             = None
+    if os.path.exists(current_file):
+        stampL = nwisTables.sourceStamp(current_file)
+        nwisTables.buildNwisIndex(current_file, currentSignaturesD)
+
+    siteS    = set(newSignaturesD) | set(currentSignaturesD)
+    changedL = sorted([site for site in siteS if newSignaturesD.get(site) != currentSignaturesD.get(site)])
+
+    return {
+        'name':     os.path.basename(new_file),
+        'table_nm': nwisTables.tableName(new_file),
+        'current':  current_file,
+        'new':      new_file,
+        'stamp':    stampL,
+        'index':    indexD,
+        'changed':  changedL,
+        'added':    len([site for site in changedL if site not in currentSignaturesD]),
+        'removed':  len([site for site in changedL if site not in newSignaturesD])
+    }
+
+# =============================================================================
+def linkFile (source_file, target_file):
+
+    # Unchanged files are shared with the current version
+    #
+    try:
+        os.link(source_file, target_file)
+    except OSError:
+        shutil.copy2(source_file, target_file)
+
+# =============================================================================
+def stageFiles (data_dir, stage_dir, skipS):
+
+    # Every file of the current version except those being replaced
+    #
+    for root, dirsL, filesL in os.walk(data_dir):
+        dirsL[:] = [name for name in dirsL if not name.startswith(stagePrefix)]
+        relative = os.path.relpath(root, data_dir)
+        os.makedirs(os.path.join(stage_dir, relative), exist_ok=True)
+
+        for name in filesL:
+            path = os.path.normpath(os.path.join(relative, name))
+            if path in skipS or name.endswith('.tmp') or any([name.startswith(prefix) for prefix in unsharedL]):
+                continue
+            linkFile(os.path.join(root, name), os.path.join(stage_dir, path))
+
+# =============================================================================
+def stageDirectory (data_dir):
+
+    # Beside the current version directory
+    #
+    target = os.path.realpath(data_dir)
+
+    return os.path.join(os.path.dirname(target), '%s.%d.tmp' % (os.path.basename(data_dir), os.getpid()))
+
+# =============================================================================
+def stageTables (stage_dir, changedL):
+
+    for changeD in changedL:
+        staged_file = os.path.join(stage_dir, changeD['name'])
+        shutil.copy2(changeD['new'], staged_file)
+
+        indexD          = changeD['index']
+        indexD['stamp'] = nwisTables.sourceStamp(staged_file)
+        nwisTables.writeNwisIndex(staged_file, indexD)
+
+        # Snapshots are compiled for the tables that had one
+        #
+        if os.path.exists(nwisSnapshot.snapshotFileName(changeD['current'])):
+            metaD, bytesL = nwisSnapshot.buildSnapshot(staged_file)
+            nwisSnapshot.writeSnapshot(staged_file, metaD, bytesL)
+
+# =============================================================================
+def stageResponses (stage_dir, packD, changedS):
+
+    pack_file = os.path.join(stage_dir, os.path.basename(nwisResponseCache.cache_file))
+    stampsL   = usgsWellData.dataStamps(stage_dir)
+
+    # The staged tables are read in place of the served ones
+    #
+    data_dir = usgsWellData.data_dir
+    usgsWellData.data_dir = stage_dir
+    try:
+        pack_file, metaD, countsD = nwisResponseCache.updateCache(packD, changedS, stampsL, pack_file)
+    finally:
+        usgsWellData.data_dir = data_dir
+
+    return pack_file, countsD
+
+# =============================================================================
+def stageDatabase (database_file, stage_dir, changedL):
+
+    import sqlite3
+
+    # A consistent copy of the served database, refreshed before it is
+    #  published with the tables
+    #
+    staged_file = os.path.join(stage_dir, os.path.basename(database_file))
+    source      = sqlite3.connect(database_file)
+    target      = sqlite3.connect(staged_file)
+    try:
+        source.backup(target)
+        target.execute('PRAGMA journal_mode=WAL')
+    finally:
+        target.close()
+        source.close()
+
+    return refreshDatabase(staged_file, stage_dir, changedL)
+
+# =============================================================================
+def publishVersion (data_dir, stage_dir):
+
+    version = usgsWellData.dataVersion(usgsWellData.dataStamps(stage_dir))
+
+    # One rename of the link switches every file
+    #
+    link_nm     = os.path.basename(data_dir)
+    previous    = os.path.realpath(data_dir)
+    version_dir = os.path.join(os.path.dirname(stage_dir), '%s.%s' % (link_nm, version))
+    if os.path.isdir(version_dir) and version_dir != previous:
+        shutil.rmtree(version_dir)
+    os.rename(stage_dir, version_dir)
+
+    temp_link = '%s.%d.tmp' % (data_dir, os.getpid())
+    os.symlink(os.path.relpath(version_dir, os.path.dirname(data_dir)), temp_link)
+    os.replace(temp_link, data_dir)
+
+    # Versions before the previous one are no longer read
+    #
+    pattern = re.compile(versionPattern % re.escape(link_nm))
+    for name in os.listdir(os.path.dirname(version_dir)):
+        path = os.path.join(os.path.dirname(version_dir), name)
+        if pattern.match(name) and path not in [version_dir, previous] and os.path.isdir(path):
+            shutil.rmtree(path)
+
+    return version_dir, version
+
+# =============================================================================
+def refreshDatabase (database_file, table_dir, changedL):
+
+    import nwisSqlite
+
+    changesL = []
+    for changeD in changedL:
+        changesL.append((os.path.join(table_dir, changeD['name']), changeD['changed'], changeD['stamp']))
+
+    return nwisSqlite.refreshDatabase(database_file, changesL)
+
+# =============================================================================
+def refreshExtract (extract_dir, dry_run=False):
+
+    data_dir = usgsWellData.data_dir.rstrip(os.sep)
+    summaryD = {'tables': [], 'responses': None, 'version': None, 'database': []}
+
+    # Tables of the new extract with changed sites
+    #
+    for new_file in sorted(glob.glob(os.path.join(extract_dir, 'gw_*_01.txt'))):
+        changeD = tableChanges(os.path.join(data_dir, os.path.basename(new_file)), new_file)
+        summaryD['tables'].append(changeD)
+
+    changedL = [changeD for changeD in summaryD['tables'] if len(changeD['changed']) > 0]
+    if dry_run or len(changedL) < 1:
+        return summaryD
+
+    # Only a linked data directory is published in one rename
+    #
+    if not os.path.islink(data_dir):
+        raise usgsWellData.WellDataError('%s is not a symbolic link to a version directory; link it before refreshing (mv data data.initial && ln -s data.initial data)' % data_dir)
+
+    # A database kept in the data directory is published with it, one kept
+    #  elsewhere (NWIS_SQLITE) is refreshed once the tables are published
+    #
+    import nwisSqlite
+
+    database_file = nwisSqlite.database_file
+    if not os.path.exists(database_file):
+        database_file = None
+    staged_database = database_file is not None and not os.path.relpath(database_file, data_dir).startswith(os.pardir)
+
+    # Sites whose responses change; the current pack is mapped before
+    #  anything is replaced
+    #
+    changedS = set()
+    for changeD in changedL:
+        if changeD['table_nm'] in usgsWellData.construction_tablesL + usgsWellData.geohydrology_tablesL:
+            changedS.update(changeD['changed'])
+    packD = nwisResponseCache.openCache()
+
+    publishL = []
+    for changeD in changedL:
+        for path in [changeD['name'], os.path.basename(nwisTables.indexFileName(changeD['name'])),
+                     os.path.basename(nwisSnapshot.snapshotFileName(changeD['name']))]:
+            publishL.append(path)
+
+    # The pack carries the data version, so it is staged again even when
+    #  only tables outside the responses (gw_netw, ...) changed
+    #
+    if packD is not None:
+        publishL.append(os.path.basename(nwisResponseCache.cache_file))
+
+    stage_dir = stageDirectory(data_dir)
+    try:
+        stageFiles(data_dir, stage_dir, set(publishL))
+        stageTables(stage_dir, changedL)
+
+        # Without a current pack the responses are rendered per request as
+        #  they were before the refresh
+        #
+        if packD is not None:
+            summaryD['responses'] = stageResponses(stage_dir, packD, changedS)[1]
+
+        if staged_database:
+            summaryD['database'] = stageDatabase(database_file, stage_dir, changedL)
+
+        summaryD['directory'], summaryD['version'] = publishVersion(data_dir, stage_dir)
+    except:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        raise
+
+    if database_file is not None and not staged_database:
+        summaryD['database'] = refreshDatabase(database_file, data_dir, changedL)
+
+    return summaryD
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Refresh the served NWIS extract with the sites changed in a new one')
+    parser.add_argument('extract_dir', help='Directory holding the new gw_*_01.txt tables')
+    parser.add_argument('--dry-run', action='store_true', help='List the changed sites without publishing them')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    try:
+        summaryD = refreshExtract(args.extract_dir, args.dry_run)
+    except (usgsWellData.WellDataError, OSError, ValueError) as e:
+        print(str(e))
+        sys.exit(1)
+
+    for changeD in summaryD['tables']:
+        changed = len(changeD['changed'])
+        print('%s: %d sites changed (%d added, %d removed, %d modified)' % (changeD['name'], changed, changeD['added'], changeD['removed'],
+                                                                          changed - changeD['added'] - changeD['removed']))
+
+    if summaryD['responses'] is not None:
+        skippedD = summaryD['responses']['skipped']
+        for site_no, message in sorted(skippedD.items()):
+            print('skipped %s: %s' % (site_no, message))
+        print('responses: %d sites rendered, %d copied, %d skipped' % (summaryD['responses']['rendered'], summaryD['responses']['copied'],
+                                                                      len(skippedD)))
+
+    for table_nm, rows in summaryD['database']:
+        print('%s: %d rows of changed sites written to SQLite' % (table_nm, rows))
+
+    if summaryD['version'] is not None:
+        print('data version %s published in %s' % (summaryD['version'], summaryD['directory']))
+    elif not args.dry_run:
+        print('no changed sites; nothing published')
+
+    print('%.2f s' % (time.perf_counter() - started))
+
+    sys.exit()
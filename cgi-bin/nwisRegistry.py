@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisRegistry.py
+#
+# Project:  wellConstruction
+# Purpose:  Module declares the NWIS tables served by the scripts and the
+#            service: their key columns, projected columns and code tables.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Every gw_*_01.txt table is read through the same lookup (snapshot, index,
+#  bisect, sqlite, memory or scan; see nwisTables.py) keyed on site_no. A
+#  table is served once it is declared here with
+#
+#    keys      site_no and the sequence numbers that order its rows
+#    columns   the other columns returned, in output order
+#    codes     code columns joined to a code table of
+#              well_construction_lookup.json (repr_cd -> repr_ds), or to
+#              the aquifer names (aqfr_cd)
+#    interval  optionally the top and bottom depth columns of a row and a
+#              code column, indexed for depth-range filters (see
+#              nwisIntervals.py)
+#
+#  The key columns after site_no and the columns are projected by the row
+#  decoder, which types them from gw_gwdd.txt (see nwisSchema.py), and each
+#  joined code column is followed by its description (_cd -> _ds) in the
+#  records of requestUsgsTable.py:
+#
+#    /cgi-bin/lithology/requestUsgsTable.py?site_no=434400121275801&tables=gw_repr
+#    {"gw_repr":[{"repr_seq_nu": 1, "repr_cd": "D", "repr_ds": "Deepened", ...}]}
+#
+#  List the registered tables and the types of their columns with
+#
+#    python nwisRegistry.py
+#
+###############################################################################
+
+import os, sys
+
+aquiferCodes   = 'aqfr_cd'
+
+# Tables in the order they are read and returned
+#
+tableRegistryD = {
+    'gw_cons': {
+        'keys':    ['site_no', 'cons_seq_nu'],
+        'columns': ['seal_depth_va', 'seal_cd'],
+        'codes':   {'seal_cd': 'seal_cd'}
+    },
+    'gw_hole': {
+        'keys':     ['site_no', 'cons_seq_nu', 'hole_seq_nu'],
+        'columns':  ['hole_top_va', 'hole_bottom_va', 'hole_dia_va'],
+        'codes':    {},
+        'interval': ['hole_top_va', 'hole_bottom_va', None]
+    },
+    'gw_csng': {
+        'keys':     ['site_no', 'cons_seq_nu', 'csng_seq_nu'],
+        'columns':  ['csng_top_va', 'csng_bottom_va', 'csng_dia_va', 'csng_material_cd'],
+        'codes':    {'csng_material_cd': 'csng_material_cd'},
+        'interval': ['csng_top_va', 'csng_bottom_va', 'csng_material_cd']
+    },
+    'gw_open': {
+        'keys':     ['site_no', 'cons_seq_nu', 'open_seq_nu'],
+        'columns':  ['open_top_va', 'open_bottom_va', 'open_dia_va', 'open_cd'],
+        'codes':    {'open_cd': 'open_cd'},
+        'interval': ['open_top_va', 'open_bottom_va', 'open_cd']
+    },
+    'gw_geoh': {
+        'keys':     ['site_no', 'geoh_seq_nu'],
+        'columns':  ['lith_cd', 'lith_top_va', 'lith_bottom_va', 'lith_unit_cd'],
+        'codes':    {'lith_cd': 'lith_cd', 'lith_unit_cd': aquiferCodes},
+        'interval': ['lith_top_va', 'lith_bottom_va', 'lith_cd']
+    },
+    'gw_repr': {
+        'keys':    ['site_no', 'repr_seq_nu'],
+        'columns': ['repr_cd', 'repr_dt', 'repr_contractor_nm', 'change_va'],
+        'codes':   {'repr_cd': 'repr_cd'}
+    },
+    'gw_netw': {
+        'keys':    ['site_no', 'netw_seq_nu'],
+        'columns': ['netw_cd', 'netw_begin_dt', 'netw_end_dt', 'analyses_tp', 'netw_src_cd', 'anal_agency_cd',
+                    'netw_freq_cd', 'netw_meth_cd', 'netw_1_cd', 'netw_2_cd'],
+        'codes':   {}
+    },
+    'gw_coop': {
+        'keys':    ['site_no', 'coop_seq_nu'],
+        'columns': ['coop_site_no', 'registration_no_va', 'coop_stat_cd', 'unapproved_cd', 'coop_inspect_dt', 'coop_remark_tx'],
+        'codes':   {}
+    },
+    'gw_otid': {
+        'keys':    ['site_no', 'otid_seq_nu'],
+        'columns': ['otid_id', 'assigner_nm'],
+        'codes':   {}
+    },
+    'gw_otdt': {
+        'keys':    ['site_no', 'otdt_seq_nu'],
+        'columns': ['otdt_tx', 'otdt_loc_cd', 'otdt_format_cd'],
+        'codes':   {}
+    }
+}
+
+# =============================================================================
+def registeredTables ():
+
+    return list(tableRegistryD.keys())
+
+# =============================================================================
+def projectedColumns (table_nm):
+
+    # site_no is the lookup key and is not repeated in the records
+    #
+    entryD = tableRegistryD[table_nm]
+
+    return entryD['keys'][1:] + entryD['columns']
+
+# =============================================================================
+def tableCodes (table_nm):
+
+    return tableRegistryD[table_nm]['codes']
+
+# =============================================================================
+def descriptionColumn (column):
+
+    # seal_cd -> seal_ds, csng_material_cd -> csng_material_ds
+    #
+    if column.endswith('_cd'):
+        return column[:-3] + '_ds'
+
+    return column + '_ds'
+
+# =============================================================================
+def definitionCodes ():
+
+    # Code tables of the lookup file joined by any registered table
+    #
+    code_nmL = []
+    for table_nm in tableRegistryD:
+        for code_nm in tableCodes(table_nm).values():
+            if code_nm != aquiferCodes and code_nm not in code_nmL:
+                code_nmL.append(code_nm)
+
+    return code_nmL
+
+# =============================================================================
+def intervalTables ():
+
+    return [table_nm for table_nm in tableRegistryD if 'interval' in tableRegistryD[table_nm]]
+
+# =============================================================================
+def tableInterval (table_nm):
+
+    # Top and bottom depth columns and the code column (or None)
+    #
+    return tableRegistryD[table_nm].get('interval')
+
+# =============================================================================
+def depthParameter (table_nm):
+
+    # lith_top_va -> lith_depth
+    #
+    return tableInterval(table_nm)[0].replace('_top_va', '') + '_depth'
+
+# =============================================================================
+def filterParameters ():
+
+    # Query parameters of the depth-range and code filters
+    #
+    parmsL = []
+    for table_nm in intervalTables():
+        parmsL.append(depthParameter(table_nm))
+        if tableInterval(table_nm)[2] is not None:
+            parmsL.append(tableInterval(table_nm)[2])
+
+    return parmsL
+
+# =============================================================================
+def needsAquifers (table_nmL):
+
+    return any([aquiferCodes in tableCodes(table_nm).values() for table_nm in table_nmL])
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    import nwisSchema
+
+    import usgsWellData
+
+    parser = argparse.ArgumentParser(description='List the registered NWIS tables and the types of their projected columns')
+    parser.parse_args()
+
+    for table_nm in registeredTables():
+        nwis_file = usgsWellData.nwisFileName(table_nm)
+        if not os.path.exists(nwis_file):
+            print('%s: %s missing' % (table_nm, nwis_file))
+            continue
+
+        decoder = nwisSchema.rowDecoder(nwis_file, projectedColumns(table_nm))
+        codesL  = ['%s->%s' % item for item in tableCodes(table_nm).items()]
+        print('%s: %s%s' % (table_nm, ' '.join(['%s:%s' % item for item in zip(decoder.columnsL, decoder.kindsL)]),
+                            ' codes %s' % ' '.join(codesL) if len(codesL) > 0 else ''))
+
+    sys.exit()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisResponseCache.py
+#
+# Project:  wellConstruction
+# Purpose:  Module pre-renders the well construction, geohydrology and
+#            combined JSON responses of every site into a packed cache file
+#            and serves them from a memory mapping of the file.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The data only change when a new NWIS extract or lookup file is dropped in,
+#  so the responses of every site can be rendered once:
+#
+#    python nwisResponseCache.py
+#
+#  writes data/well_responses.pack to a temporary file and renames it into
+#  place. The pack holds the response bodies back to back, a fixed-width
+#  sorted site table, the offset and length of each (site, response kind)
+#  and a 16-byte content hash of each body. It records the data version of
+#  the files it was rendered from and is ignored once any of them changes.
+#  Responses for sites outside the pack, batches and section filters are
+#  rendered per request as before.
+#
+# A refresh of the extract (nwisRefresh.py) renders only the changed sites
+#  and copies the bodies and hashes of the others from the current pack.
+#
+###############################################################################
+
+import os, sys
+
+import hashlib
+
+from array import array
+
+import nwisTables
+
+import nwisSnapshot
+
+import usgsWellData
+
+responseKindsL = ['construction', 'geohydrology', 'well']
+cache_file     = os.path.join(usgsWellData.data_dir, "well_responses.pack")
+cacheMagic     = b'NWISRESP'
+cacheVersion   = 1
+hashSize       = 16
+
+# Pack mapped by this process
+#
+cacheD         = {}
+
+# =============================================================================
+def contentHash (body):
+
+    return hashlib.blake2b(body, digest_size=hashSize).digest()
+
+# =============================================================================
+def cachedSites ():
+
+    siteS = set()
+    for table_nm in usgsWellData.construction_tablesL + usgsWellData.geohydrology_tablesL:
+        siteS.update(nwisTables.loadNwisIndex(usgsWellData.nwisFileName(table_nm))['sites'])
+
+    return sorted(siteS)
+
+# =============================================================================
+def renderResponses (siteL, definitionsD, aqfrInfoD, skippedD):
+
+    table_nmL = usgsWellData.construction_tablesL + usgsWellData.geohydrology_tablesL
+    batchD    = usgsWellData.readBatchTables(table_nmL, siteL)
+    sectionsL = usgsWellData.wellSections('')
+
+    renderersL = [
+        lambda tablesD: usgsWellData.constructionDocument(tablesD, definitionsD),
+        lambda tablesD: usgsWellData.geohydrologyDocument(tablesD, definitionsD, aqfrInfoD),
+        lambda tablesD: usgsWellData.wellDocument(tablesD, sectionsL, definitionsD, aqfrInfoD)
+    ]
+
+    # Sites whose records cannot be rendered (a code without a name) are
+    #  left to the request path, which reports the same error, and kept in
+    #  skippedD with their message for the build summary
+    #
+    for site_no in siteL:
+        try:
+            yield site_no, [render(batchD[site_no]).encode('utf-8') for render in renderersL]
+        except usgsWellData.WellDataError as e:
+            skippedD[site_no] = str(e)
+
+# =============================================================================
+def writeCache (responsesI, stampsL, pack_file=cache_file):
+
+    siteL    = []
+    entriesA = array('Q')
+    hashesL  = []
+    bodiesL  = []
+    offset   = 0
+
+    # Responses in site order, with their content hashes when they are
+    #  copied from another pack
+    #
+    for site_no, bodyL, digestL in responsesI:
+        siteL.append(site_no)
+        if digestL is None:
+            digestL = [contentHash(body) for body in bodyL]
+        for body, digest in zip(bodyL, digestL):
+            entriesA.extend([offset, len(body)])
+            hashesL.append(digest)
+            bodiesL.append(body)
+            offset += len(body)
+
+    width, sites = nwisSnapshot.siteTable(siteL)
+
+    metaD = {
+        'version': usgsWellData.dataVersion(stampsL),
+        'stamps':  stampsL,
+        'kinds':   responseKindsL,
+        'width':   width,
+        'nsites':  len(siteL)
+    }
+    bytesL = nwisSnapshot.packBlobs([
+        ('sites', sites),
+        ('entries', entriesA),
+        ('hashes', b''.join(hashesL)),
+        ('bodies', b''.join(bodiesL))
+    ], metaD)
+
+    return nwisSnapshot.writePacked(pack_file, cacheMagic, cacheVersion, metaD, bytesL), metaD
+
+# =============================================================================
+def buildCache ():
+
+    # Code tables that cannot be loaded stop the build
+    #
+    stampsL      = usgsWellData.dataStamps()
+    definitionsD = usgsWellData.loadDefinitions()
+    aqfrInfoD    = usgsWellData.loadAquifers()
+
+    skippedD     = {}
+    responsesI   = renderResponses(cachedSites(), definitionsD, aqfrInfoD, skippedD)
+
+    pack_file, metaD = writeCache(((site_no, bodyL, None) for site_no, bodyL in responsesI), stampsL)
+
+    return pack_file, metaD, skippedD
+
+# =============================================================================
+def packedResponses (packD, site):
+
+    # Bodies and content hashes of one site of a mapped pack
+    #
+    viewsD   = packD['views']
+    bodiesL  = []
+    digestsL = []
+    for entry in range(site * len(responseKindsL), (site + 1) * len(responseKindsL)):
+        offset = viewsD['entries'][entry * 2]
+        length = viewsD['entries'][entry * 2 + 1]
+        bodiesL.append(viewsD['bodies'][offset:offset + length].tobytes())
+        digestsL.append(viewsD['hashes'][entry * hashSize:(entry + 1) * hashSize].tobytes())
+
+    return bodiesL, digestsL
+
+# =============================================================================
+def updateCache (packD, changedS, stampsL, pack_file):
+
+    definitionsD = usgsWellData.loadDefinitions()
+    aqfrInfoD    = usgsWellData.loadAquifers()
+
+    # Only the changed sites are rendered; the responses of the others are
+    #  copied from the pack of the previous data version
+    #
+    siteL     = cachedSites()
+    renderL   = [site_no for site_no in siteL if site_no in changedS]
+    skippedD  = {}
+    renderedD = dict(renderResponses(renderL, definitionsD, aqfrInfoD, skippedD))
+    countsD   = {'rendered': len(renderedD), 'copied': 0, 'skipped': skippedD}
+
+    def responses ():
+        for site_no in siteL:
+            if site_no in changedS:
+                if site_no in renderedD:
+                    yield site_no, renderedD[site_no], None
+                continue
+            site = nwisSnapshot.findSite(packD, site_no)
+            if site is not None:
+                countsD['copied'] += 1
+                yield (site_no,) + packedResponses(packD, site)
+
+    pack_file, metaD = writeCache(responses(), stampsL, pack_file)
+
+    return pack_file, metaD, countsD
+
+# =============================================================================
+def closeCache ():
+
+    if 'mmap' in cacheD:
+        nwisSnapshot.closeMapped(cacheD['views'], cacheD['mmap'])
+    cacheD.clear()
+
+# =============================================================================
+def openCache ():
+
+    try:
+        packStamp = os.stat(cache_file).st_mtime_ns
+    except OSError:
+        return None
+
+    # Pack already mapped by this process and still current
+    #
+    version = usgsWellData.dataVersion()
+    if cacheD.get('packStamp') == packStamp and cacheD.get('version') == version:
+        return cacheD
+
+    # The mapping of a replaced pack is closed, as is a pack of another data
+    #  version
+    #
+    metaD, viewsD, mm = nwisSnapshot.mapPacked(cache_file, cacheMagic, cacheVersion)
+    if metaD is not None and metaD['version'] != version:
+        nwisSnapshot.closeMapped(viewsD, mm)
+        metaD = None
+
+    closeCache()
+    if metaD is None:
+        return None
+
+    cacheD.update({
+        'packStamp': packStamp,
+        'version':   version,
+        'meta':      metaD,
+        'views':     viewsD,
+        'mmap':      mm
+    })
+
+    return cacheD
+
+# =============================================================================
+def cachedResponse (kind, site_no):
+
+    # Only single-site requests are cached
+    #
+    if ',' in site_no or kind not in responseKindsL:
+        return None
+
+    packD = openCache()
+    if packD is None:
+        return None
+
+    site = nwisSnapshot.findSite(packD, site_no)
+    if site is None:
+        return None
+
+    viewsD = packD['views']
+    entry  = site * len(responseKindsL) + responseKindsL.index(kind)
+    offset = viewsD['entries'][entry * 2]
+    length = viewsD['entries'][entry * 2 + 1]
+
+    return str(viewsD['bodies'][offset:offset + length], 'utf-8')
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Pre-render the well construction and geohydrology responses of every site')
+    parser.parse_args()
+
+    try:
+        pack_file, metaD, skippedD = buildCache()
+    except usgsWellData.WellDataError as e:
+        print(str(e))
+        sys.exit(1)
+
+    for site_no, message in sorted(skippedD.items()):
+        print('skipped %s: %s' % (site_no, message))
+
+    print('%d sites rendered into %s (data version %s), %d skipped' % (metaD['nsites'], pack_file, metaD['version'], len(skippedD)))
+
+    sys.exit()
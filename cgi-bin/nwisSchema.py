@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisSchema.py
+#
+# Project:  wellConstruction
+# Purpose:  Module builds row decoders for NWIS RDB tables from the column
+#            header, the type/width line and the gw_gwdd data dictionary.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The type/width line of an RDB table (5s 15s 9n 8s ...) only marks the
+#  sequence numbers as numeric; depths and diameters are carried as text
+#  (8s). gw_gwdd.txt gives the parameter type of every table column:
+#
+#    10         integer            cons_seq_nu, hole_seq_nu, ...
+#    11, 12     real               seal_depth_va, hole_top_va, ...
+#    others     code, text, date   lith_cd, cons_dt, ...
+#
+#  A decoder is built for one table and the columns the caller projects:
+#
+#    decoder = rowDecoder('data/gw_hole_01.txt', ['cons_seq_nu', 'hole_top_va'])
+#    recordsL = decoder.decode(block)
+#
+#  Only the projected fields of a row are converted, once, with an empty or
+#  unreadable value given as None. Integer columns are those typed 10 in
+#  gw_gwdd or n in the type line, real columns the _va columns typed 11 or
+#  12 (any _va column without gw_gwdd); all others stay text. Rows come back
+#  as records, tuples with an attribute for each projected column read as
+#  record.hole_top_va or record.get('hole_top_va'), or as plain tuples in
+#  projection order.
+#
+###############################################################################
+
+import os, sys
+
+import operator
+
+import nwisTables
+
+gwddName        = 'gw_gwdd.txt'
+integerTypesL   = ['10']
+realTypesL      = ['11', '12']
+
+# Data dictionaries and decoders built by this process
+#
+gwddCacheD      = {}
+decoderCacheD   = {}
+
+# =============================================================================
+def gwddFileName (nwisFile):
+
+    return os.path.join(os.path.dirname(nwisFile), gwddName)
+
+# =============================================================================
+def gwddTypes (gwddFile):
+
+    stampL = nwisTables.sourceStamp(gwddFile)
+
+    gwddD = gwddCacheD.get(gwddFile)
+    if gwddD is not None and gwddD['stamp'] == stampL:
+        return gwddD['types']
+
+    import csv
+
+    typesD = {}
+
+    # Parameter type of each column keyed by table (gw_hole_## -> gw_hole)
+    #
+    with open(gwddFile, "r", newline='') as fh:
+        csv_reader = csv.reader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
+        columnsL   = next(csv_reader)
+        next(csv_reader)
+
+        tableIndex  = columnsL.index('table_nm')
+        columnIndex = columnsL.index('column_nm')
+        typeIndex   = columnsL.index('parameter_tp')
+
+        for rowL in csv_reader:
+            if len(rowL) != len(columnsL) or len(rowL[columnIndex]) < 1:
+                continue
+            table_nm = rowL[tableIndex]
+            if table_nm.endswith('_##'):
+                table_nm = table_nm[:-3]
+            typesD.setdefault(table_nm, {})[rowL[columnIndex]] = rowL[typeIndex]
+
+    gwddCacheD[gwddFile] = {'stamp': stampL, 'types': typesD}
+
+    return typesD
+
+# =============================================================================
+def columnKind (column, rdbType, parameter_tp=None):
+
+    if parameter_tp in integerTypesL or (rdbType or '').endswith('n'):
+        return 'int'
+
+    if column.endswith('_va') and (parameter_tp is None or parameter_tp in realTypesL):
+        return 'float'
+
+    return 'str'
+
+# =============================================================================
+def intValue (value):
+
+    if len(value) < 1:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+# =============================================================================
+def floatValue (value):
+
+    if len(value) < 1:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+# =============================================================================
+def textValue (value):
+
+    if len(value) < 1:
+        return None
+
+    # Quoted fields are read the way the csv module reads them
+    #
+    if value[0] == '"' and value[-1] == '"' and len(value) > 1:
+        return value[1:-1].replace('""', '"')
+
+    return value
+
+converterD = {'int': intValue, 'float': floatValue, 'str': textValue}
+
+# =============================================================================
+class RdbRecord (tuple):
+
+    __slots__ = ()
+    columnsT  = ()
+
+    def get (self, column, default=None):
+
+        return getattr(self, column, default)
+
+    def keys (self):
+
+        return list(self.columnsT)
+
+    def asDict (self):
+
+        return dict(zip(self.columnsT, iter(self)))
+
+    def __repr__ (self):
+
+        return '%s(%s)' % (type(self).__name__, ', '.join(['%s=%r' % item for item in self.asDict().items()]))
+
+# =============================================================================
+def recordClass (table_nm, columnsL):
+
+    # The values are held as a tuple and each column reads its position,
+    #  the way namedtuple builds its classes
+    #
+    namespaceD = {'__slots__': (), 'columnsT': tuple(columnsL)}
+    for index, column in enumerate(columnsL):
+        namespaceD[column] = property(operator.itemgetter(index))
+
+    return type('%sRecord' % table_nm, (RdbRecord,), namespaceD)
+
+# =============================================================================
+class RowDecoder:
+
+    def __init__ (self, nwisFile, columnsL=None, record='slots', gwdd=True):
+
+        headerD       = nwisTables.rdbHeader(nwisFile)
+        table_nm      = nwisTables.tableName(nwisFile)
+        tableColumnsL = headerD['columns']
+        typesL        = headerD['types'] or []
+
+        if columnsL is None:
+            columnsL = tableColumnsL
+
+        missingL = [column for column in columnsL if column not in tableColumnsL]
+        if len(missingL) > 0:
+            raise ValueError('Columns %s not found in NWIS file %s' % (', '.join(missingL), nwisFile))
+
+        # Parameter types from the data dictionary next to the table
+        #
+        parametersD = {}
+        gwddFile    = gwddFileName(nwisFile)
+        if gwdd and os.path.exists(gwddFile):
+            parametersD = gwddTypes(gwddFile).get(table_nm, {})
+
+        self.nwisFile = nwisFile
+        self.table_nm = table_nm
+        self.headerD  = headerD
+        self.columnsL = list(columnsL)
+        self.width    = len(tableColumnsL)
+        self.indexesL = [tableColumnsL.index(column) for column in columnsL]
+        self.kindsL   = []
+        for column, index in zip(columnsL, self.indexesL):
+            self.kindsL.append(columnKind(column, typesL[index] if index < len(typesL) else None, parametersD.get(column)))
+        self.convertL = [converterD[kind] for kind in self.kindsL]
+        self.record   = record
+        self.make     = tuple if record == 'tuple' else recordClass(table_nm, columnsL)
+
+    # -------------------------------------------------------------------------
+    def iterate (self, linesI):
+
+        make     = self.make
+        width    = self.width
+        fieldsL  = list(zip(self.indexesL, self.convertL))
+
+        # Rows of the RDB text; short rows are skipped like the csv reader
+        #  leaves them out of the index
+        #
+        for line in linesI:
+            valuesL = line.rstrip('\r\n').split('\t')
+            if len(valuesL) != width:
+                continue
+            yield make([convert(valuesL[index]) for index, convert in fieldsL])
+
+    # -------------------------------------------------------------------------
+    def decode (self, block):
+
+        return list(self.iterate(block.decode('utf-8').split('\n')))
+
+    # -------------------------------------------------------------------------
+    def records (self, rowsL):
+
+        # Rows already read as dictionaries (SQLite, scan); typed
+        #  values are kept and text values converted
+        #
+        recordsL = []
+        make     = self.make
+        fieldsL  = list(zip(self.columnsL, self.convertL))
+
+        for rowD in rowsL:
+            valuesL = []
+            for column, convert in fieldsL:
+                value = rowD.get(column)
+                if isinstance(value, str):
+                    value = convert(value)
+                valuesL.append(value)
+            recordsL.append(make(valuesL))
+
+        return recordsL
+
+# =============================================================================
+def rowDecoder (nwisFile, columnsL=None, record='slots', gwdd=True):
+
+    key = (nwisFile, tuple(columnsL) if columnsL is not None else None, record, gwdd)
+
+    # A decoder is kept while the table header it was built from is current
+    #
+    decoder = decoderCacheD.get(key)
+    if decoder is not None and decoder.headerD is nwisTables.rdbHeader(nwisFile):
+        return decoder
+
+    decoder = RowDecoder(nwisFile, columnsL, record, gwdd)
+    decoderCacheD[key] = decoder
+
+    return decoder
+
+# =============================================================================
+def tableRows (nwisFile, columnsL, record='tuple'):
+
+    import io
+
+    # Every row of the table as projected records, read in one pass
+    #
+    headerD = nwisTables.rdbHeader(nwisFile)
+    decoder = rowDecoder(nwisFile, columnsL, record=record)
+
+    with open(nwisFile, "rb") as fh:
+        fh.seek(headerD['offset'])
+        for recordT in decoder.iterate(io.TextIOWrapper(fh, encoding='utf-8', newline='')):
+            yield recordT
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List the column types the row decoder reads from NWIS RDB tables')
+    parser.add_argument('nwis_files', nargs='+', help='NWIS RDB table files (gw_*_01.txt)')
+    parser.add_argument('--no-gwdd', dest='gwdd', action='store_false', help='Ignore the gw_gwdd data dictionary')
+    args = parser.parse_args()
+
+    for nwis_file in args.nwis_files:
+        decoder = rowDecoder(nwis_file, gwdd=args.gwdd)
+        print('%s: %s' % (nwis_file, ' '.join(['%s:%s' % item for item in zip(decoder.columnsL, decoder.kindsL)])))
+
+    sys.exit()
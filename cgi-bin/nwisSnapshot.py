@@ -0,0 +1,487 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisSnapshot.py
+#
+# Project:  wellConstruction
+# Purpose:  Module compiles the NWIS RDB data tables (gw_*_01.txt) into
+#            columnar binary snapshots and answers site lookups from the
+#            memory-mapped snapshot without text parsing.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# A snapshot (gw_hole_01.txt -> gw_hole_01.snap) holds every column of the
+#  table as a typed array:
+#
+#    n columns (cons_seq_nu, ...)        array('i'), null stored as intNull
+#    numeric _va columns (hole_top_va)   array('d'), null stored as NaN
+#    all other columns (lith_cd, ...)    dictionary encoded; array('I') codes
+#                                         into a string table, code 0 is null
+#
+#  followed by a site table of fixed-width sorted site numbers with the first
+#  row and row count of each site. The file is laid out as
+#
+#    magic, version, metadata length, metadata JSON, 8-byte aligned arrays
+#
+#  where the metadata gives the source table stamp and the byte offset of
+#  every array. Lookups memory-map the snapshot, bisect the site table and
+#  slice the arrays. A missing or stale snapshot makes the lookup fall back
+#  to the RDB text. Build the snapshots when a new NWIS extract is loaded:
+#
+#    python nwisSnapshot.py data/gw_*_01.txt
+#
+###############################################################################
+
+import os, sys
+
+import json
+
+import math
+
+import mmap
+
+import struct
+
+from array import array
+
+import nwisTables
+
+snapshotSuffix  = '.snap'
+snapshotMagic   = b'NWISSNAP'
+snapshotVersion = 1
+intNull         = -2147483648
+
+headerStruct    = struct.Struct('<8sII')
+
+# Snapshots already mapped by this process keyed by table file
+#
+snapshotCacheD  = {}
+
+# =============================================================================
+def snapshotFileName (nwisFile):
+
+    return os.path.splitext(nwisFile)[0] + snapshotSuffix
+
+# =============================================================================
+def readRdbRows (nwisFile):
+
+    import csv
+
+    headerD = nwisTables.rdbHeader(nwisFile)
+
+    with open(nwisFile, "rb") as fh:
+        fh.seek(headerD['offset'])
+        block = fh.read()
+
+    rowsL = list(csv.reader(block.decode('utf-8').splitlines(), delimiter='\t'))
+
+    return headerD, rowsL
+
+# =============================================================================
+def columnKind (column, rdbType, valuesL):
+
+    # Integer and numeric value columns are typed only when every value
+    #  converts; anything else is dictionary encoded
+    #
+    try:
+        if rdbType.endswith('n'):
+            [int(value) for value in valuesL if len(value) > 0]
+            return 'int'
+        if column.endswith('_va'):
+            [float(value) for value in valuesL if len(value) > 0]
+            return 'float'
+    except ValueError:
+        pass
+
+    return 'code'
+
+# =============================================================================
+def encodeColumn (kind, valuesL):
+
+    if kind == 'int':
+        return [('values', array('i', [int(value) if len(value) > 0 else intNull for value in valuesL]))]
+
+    if kind == 'float':
+        return [('values', array('d', [float(value) if len(value) > 0 else math.nan for value in valuesL]))]
+
+    # Dictionary encoding; code 0 is the null value
+    #
+    codesD   = {}
+    stringsL = [b'']
+    codesA   = array('I')
+    for value in valuesL:
+        if len(value) < 1:
+            codesA.append(0)
+            continue
+        code = codesD.get(value)
+        if code is None:
+            code = codesD[value] = len(stringsL)
+            stringsL.append(value.encode('utf-8'))
+        codesA.append(code)
+
+    offsetsA = array('I', [0])
+    for string in stringsL:
+        offsetsA.append(offsetsA[-1] + len(string))
+
+    return [('values', codesA), ('offsets', offsetsA), ('strings', b''.join(stringsL))]
+
+# =============================================================================
+def siteTable (siteL):
+
+    # Sorted site numbers padded to a fixed width for bisecting in place
+    #
+    width = max([len(site_no.encode('utf-8')) for site_no in siteL] + [1])
+
+    return width, b''.join([site_no.encode('utf-8').ljust(width, b'\0') for site_no in siteL])
+
+# =============================================================================
+def buildSnapshot (nwisFile):
+
+    stampL           = nwisTables.sourceStamp(nwisFile)
+    headerD, rowsL   = readRdbRows(nwisFile)
+    columnsL         = headerD['columns']
+    typesL           = headerD['types'] or [''] * len(columnsL)
+    keyIndex         = headerD['keyIndex']
+
+    # Rows without one value per column are left out as the RDB readers do
+    #  and reported; blank lines are passed over
+    #
+    badL  = [row for row, rowL in enumerate(rowsL) if len(rowL) > 0 and len(rowL) != len(columnsL)]
+    if len(badL) > 0:
+        import usgsWellData
+        usgsWellData.screenLogger().warning('NWIS file %s: %d rows without %d columns skipped, first at data row %d' %
+                                            (nwisFile, len(badL), len(columnsL), badL[0] + 1))
+    rowsL = [rowL for rowL in rowsL if len(rowL) == len(columnsL)]
+
+    # Site table from the first group of each site
+    #
+    sitesD = {}
+    for row, rowL in enumerate(rowsL):
+        site_no = rowL[keyIndex]
+        entryL  = sitesD.get(site_no)
+        if entryL is None:
+            sitesD[site_no] = [row, 1]
+        elif entryL[0] + entryL[1] == row:
+            entryL[1] += 1
+
+    siteL         = sorted(sitesD)
+    width, sites  = siteTable(siteL)
+    blobsL = [
+        ('sites', sites),
+        ('starts', array('I', [sitesD[site_no][0] for site_no in siteL])),
+        ('counts', array('I', [sitesD[site_no][1] for site_no in siteL]))
+    ]
+
+    # Typed columns
+    #
+    columnInfoL = []
+    for index, column in enumerate(columnsL):
+        valuesL = [rowL[index] for rowL in rowsL]
+        kind    = columnKind(column, typesL[index] if index < len(typesL) else '', valuesL)
+        columnInfoL.append({'name': column, 'kind': kind})
+        for part, blob in encodeColumn(kind, valuesL):
+            blobsL.append(('%s.%s' % (column, part), blob))
+
+    metaD = {
+        'source':  os.path.basename(nwisFile),
+        'stamp':   stampL,
+        'rows':    len(rowsL),
+        'width':   width,
+        'nsites':  len(siteL),
+        'columns': columnInfoL
+    }
+    bytesL = packBlobs(blobsL, metaD)
+
+    return metaD, bytesL
+
+# =============================================================================
+def packBlobs (blobsL, metaD):
+
+    # Lay out the arrays on 8-byte boundaries and record their offsets
+    #
+    metaD['blobs'] = {}
+    bytesL = []
+    offset = 0
+    for name, blob in blobsL:
+        data = blob.tobytes() if isinstance(blob, array) else blob
+        metaD['blobs'][name] = [offset, len(data), blob.typecode if isinstance(blob, array) else 'B']
+        bytesL.append(data + b'\0' * (-len(data) % 8))
+        offset += len(bytesL[-1])
+
+    return bytesL
+
+# =============================================================================
+def writePacked (packed_file, magic, version, metaD, bytesL):
+
+    temp_file = '%s.%d.tmp' % (packed_file, os.getpid())
+
+    meta = json.dumps(metaD, separators=(',', ':')).encode('utf-8')
+    meta += b' ' * (-(headerStruct.size + len(meta)) % 8)
+
+    # Write to a temporary file and rename so readers never see a partial file
+    #
+    with open(temp_file, "wb") as fh:
+        fh.write(headerStruct.pack(magic, version, len(meta)))
+        fh.write(meta)
+        for data in bytesL:
+            fh.write(data)
+
+    os.replace(temp_file, packed_file)
+
+    return packed_file
+
+# =============================================================================
+def mapPacked (packed_file, magic, version):
+
+    try:
+        with open(packed_file, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None, None, None
+
+    try:
+        fileMagic, fileVersion, metaLength = headerStruct.unpack_from(mm, 0)
+    except struct.error:
+        fileMagic, fileVersion, metaLength = None, None, 0
+    if fileMagic != magic or fileVersion != version:
+        mm.close()
+        return None, None, None
+
+    metaD = json.loads(mm[headerStruct.size:headerStruct.size + metaLength])
+
+    # Typed views over the mapped arrays
+    #
+    base   = headerStruct.size + metaLength
+    view   = memoryview(mm)
+    viewsD = {}
+    for name, (offset, length, typecode) in metaD['blobs'].items():
+        blobView = view[base + offset:base + offset + length]
+        viewsD[name] = blobView if typecode == 'B' else blobView.cast(typecode)
+
+    return metaD, viewsD, mm
+
+# =============================================================================
+def writeSnapshot (nwisFile, metaD, bytesL):
+
+    return writePacked(snapshotFileName(nwisFile), snapshotMagic, snapshotVersion, metaD, bytesL)
+
+# =============================================================================
+def closeMapped (viewsD, mm):
+
+    # The views are released so the mapping is closed now rather than when
+    #  the last reference goes; a slice still in use keeps it open until it
+    #  is dropped
+    #
+    for view in viewsD.values():
+        view.release()
+    try:
+        mm.close()
+    except BufferError:
+        pass
+
+# =============================================================================
+def closeSnapshot (snapshotD):
+
+    snapshotD['readers'] = []
+    closeMapped(snapshotD['views'], snapshotD['mmap'])
+
+# =============================================================================
+def openSnapshot (nwisFile):
+
+    snapshot_file = snapshotFileName(nwisFile)
+
+    try:
+        stampL    = nwisTables.sourceStamp(nwisFile)
+        snapStamp = os.stat(snapshot_file).st_mtime_ns
+    except OSError:
+        return None
+
+    # Snapshot already mapped by this process
+    #
+    snapshotD = snapshotCacheD.get(nwisFile)
+    if snapshotD is not None and snapshotD['stamp'] == stampL and snapshotD['snapStamp'] == snapStamp:
+        return snapshotD
+
+    # The mapping of a replaced table or snapshot is closed
+    #
+    if snapshotD is not None and snapshotCacheD.pop(nwisFile, None) is snapshotD:
+        closeSnapshot(snapshotD)
+
+    metaD, viewsD, mm = mapPacked(snapshot_file, snapshotMagic, snapshotVersion)
+    if metaD is None or metaD['stamp'] != stampL:
+        return None
+
+    snapshotD = {
+        'stamp':     stampL,
+        'snapStamp': snapStamp,
+        'meta':      metaD,
+        'views':     viewsD,
+        'mmap':      mm
+    }
+    snapshotD['readers'] = [(column['name'], columnReader(snapshotD, column)) for column in metaD['columns']]
+    snapshotCacheD[nwisFile] = snapshotD
+
+    return snapshotD
+
+# =============================================================================
+def findSite (snapshotD, site_no):
+
+    width  = snapshotD['meta']['width']
+    sites  = snapshotD['views']['sites']
+    target = site_no.encode('utf-8')
+    if len(target) > width:
+        return None
+    target = target.ljust(width, b'\0')
+
+    lo = 0
+    hi = snapshotD['meta']['nsites']
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if sites[mid * width:(mid + 1) * width].tobytes() < target:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    if lo < snapshotD['meta']['nsites'] and sites[lo * width:(lo + 1) * width].tobytes() == target:
+        return lo
+
+    return None
+
+# =============================================================================
+def columnReader (snapshotD, column):
+
+    viewsD = snapshotD['views']
+    values = viewsD['%s.values' % column['name']]
+
+    if column['kind'] == 'int':
+        return lambda row: None if values[row] == intNull else values[row]
+
+    if column['kind'] == 'float':
+        return lambda row: None if math.isnan(values[row]) else values[row]
+
+    offsets = viewsD['%s.offsets' % column['name']]
+    strings = viewsD['%s.strings' % column['name']]
+
+    def readCode (row):
+        code = values[row]
+        if code == 0:
+            return None
+        return str(strings[offsets[code]:offsets[code + 1]], 'utf-8')
+
+    return readCode
+
+# =============================================================================
+def typedReader (reader, convert):
+
+    def readValue (row):
+        value = reader(row)
+        return None if value is None else convert(value)
+
+    return readValue
+
+# =============================================================================
+def projectedReaders (snapshotD, decoder):
+
+    projectionsD = snapshotD.setdefault('projections', {})
+    if decoder in projectionsD:
+        return projectionsD[decoder]
+
+    readersD = dict(snapshotD['readers'])
+    kindsD   = dict([(column['name'], column['kind']) for column in snapshotD['meta']['columns']])
+
+    # Readers of the projected columns; text the decoder types is converted
+    #  and a column typed here but kept as text by the decoder cannot be
+    #  given back as written, so the lookup falls back to the RDB text
+    #
+    readersL = []
+    for column, kind, convert in zip(decoder.columnsL, decoder.kindsL, decoder.convertL):
+        reader = readersD[column]
+        if kindsD[column] == 'code' and kind != 'str':
+            reader = typedReader(reader, convert)
+        elif kindsD[column] != 'code' and kind == 'str':
+            readersL = None
+            break
+        readersL.append(reader)
+
+    projectionsD[decoder] = readersL
+
+    return readersL
+
+# =============================================================================
+def snapshotBatchRows (nwisFile, siteL, decoder=None):
+
+    snapshotD = openSnapshot(nwisFile)
+    if snapshotD is None:
+        return None
+
+    readersL = snapshotD['readers']
+    starts   = snapshotD['views']['starts']
+    counts   = snapshotD['views']['counts']
+    sitesD   = {}
+
+    # Only the columns a row decoder projects are read (see nwisSchema.py)
+    #
+    if decoder is not None:
+        readersL = projectedReaders(snapshotD, decoder)
+        if readersL is None:
+            return None
+        make = decoder.make
+
+    for site_no in set(siteL):
+        site = findSite(snapshotD, site_no)
+        if site is None:
+            continue
+
+        rowsL = []
+        for row in range(starts[site], starts[site] + counts[site]):
+            if decoder is not None:
+                rowsL.append(make([reader(row) for reader in readersL]))
+            else:
+                rowsL.append(dict([(name, reader(row)) for name, reader in readersL]))
+        sitesD[site_no] = rowsL
+
+    return sitesD
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile NWIS RDB tables into columnar binary snapshots')
+    parser.add_argument('nwis_files', nargs='+', help='NWIS RDB table files (gw_*_01.txt)')
+    args = parser.parse_args()
+
+    for nwis_file in args.nwis_files:
+        metaD, bytesL = buildSnapshot(nwis_file)
+        snapshot_file = writeSnapshot(nwis_file, metaD, bytesL)
+        kindsL        = ['%s:%s' % (column['name'], column['kind']) for column in metaD['columns']]
+        print('%s: %d rows, %d sites in %s' % (nwis_file, metaD['rows'], metaD['nsites'], snapshot_file))
+        print('  %s' % ' '.join(kindsL))
+
+    sys.exit()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisSqlite.py
+#
+# Project:  wellConstruction
+# Purpose:  Module imports the NWIS RDB data tables, the aquifer codes and
+#            the well construction code tables into one SQLite database and
+#            answers site and code lookups from it.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The import loads every gw_*_01.txt table under its table name (gw_hole,
+#  ...) with text columns and an index on (site_no, first *_seq_nu column),
+#  aqfr_cd_query.txt as aqfr_cd_query, and every code table of
+#  well_construction_lookup.json as rows of nwis_codes. All tables are
+#  replaced inside a single transaction of a WAL mode database, so readers
+#  in other processes keep serving the previous extract until the commit:
+#
+#    python nwisSqlite.py --database data/nwis.sqlite
+#
+# With NWIS_LOOKUP=sqlite the scripts read site rows, code definitions and
+#  aquifer names from the database. A table whose import is older than its
+#  RDB file is read from the RDB text instead, and the code definitions or
+#  aquifer names from their files when those were edited after the import.
+#  A connection is opened again once the database file is replaced, as when
+#  nwisRefresh.py publishes a new data version behind the data link.
+#
+###############################################################################
+
+import os, sys, glob
+
+import csv
+
+import json
+
+import sqlite3
+
+import threading
+
+import nwisTables
+
+import usgsWellData
+
+database_file  = os.environ.get('NWIS_SQLITE', os.path.join(usgsWellData.data_dir, "nwis.sqlite"))
+
+# Read-only connections are kept per thread
+#
+connectionLocal = threading.local()
+
+# =============================================================================
+def quoteName (name):
+
+    return '"%s"' % name.replace('"', '""')
+
+# =============================================================================
+def readRdbFile (rdbFile):
+
+    with open(rdbFile, "r", newline='') as fh:
+        csv_reader = csv.reader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
+        columnsL   = next(csv_reader)
+        typesL     = next(csv_reader)
+        rowsL      = [rowL for rowL in csv_reader if len(rowL) == len(columnsL)]
+
+    return columnsL, rowsL
+
+# =============================================================================
+def importTable (connection, table_nm, columnsL, rowsL):
+
+    table = quoteName(table_nm)
+
+    connection.execute('DROP TABLE IF EXISTS %s' % table)
+    connection.execute('CREATE TABLE %s (%s)' % (table, ', '.join(['%s TEXT' % quoteName(column) for column in columnsL])))
+    connection.executemany('INSERT INTO %s VALUES (%s)' % (table, ', '.join(['?'] * len(columnsL))),
+                           [[value if len(value) > 0 else None for value in rowL] for rowL in rowsL])
+
+# =============================================================================
+def importedSource (connection, table_nm, source_file):
+
+    stampL = nwisTables.sourceStamp(source_file)
+
+    connection.execute('INSERT OR REPLACE INTO nwis_import VALUES (?, ?, ?, ?)',
+                       (table_nm, os.path.basename(source_file), stampL[0], stampL[1]))
+
+# =============================================================================
+def importNwisTable (connection, nwisFile):
+
+    table_nm          = nwisTables.tableName(nwisFile)
+    stampL            = nwisTables.sourceStamp(nwisFile)
+    columnsL, rowsL   = readRdbFile(nwisFile)
+
+    importTable(connection, table_nm, columnsL, rowsL)
+
+    # Index on site and the first sequence column
+    #
+    keyL = [nwisTables.keyColumn] + [column for column in columnsL if column.endswith('_seq_nu')][:1]
+    connection.execute('CREATE INDEX %s ON %s (%s)' % (quoteName('%s_site_seq' % table_nm),
+                                                      quoteName(table_nm),
+                                                      ', '.join([quoteName(column) for column in keyL])))
+
+    connection.execute('INSERT OR REPLACE INTO nwis_import VALUES (?, ?, ?, ?)',
+                       (table_nm, os.path.basename(nwisFile), stampL[0], stampL[1]))
+
+    return table_nm, len(rowsL)
+
+# =============================================================================
+def refreshNwisTable (connection, nwisFile, siteL, previousL=None):
+
+    table_nm = nwisTables.tableName(nwisFile)
+    stampL   = nwisTables.sourceStamp(nwisFile)
+    columnsL = nwisTables.rdbHeader(nwisFile)['columns']
+    table    = quoteName(table_nm)
+
+    # A new table, one whose columns changed or one not imported from the
+    #  extract being replaced (previousL) is imported whole
+    #
+    tableL    = [row[1] for row in connection.execute('PRAGMA table_info(%s)' % table)]
+    importedL = connection.execute('SELECT size, mtime_ns FROM nwis_import WHERE table_nm = ?', (table_nm,)).fetchone()
+    if tableL != columnsL or importedL is None or list(importedL) != previousL:
+        return importNwisTable(connection, nwisFile)
+
+    # Rows of the changed sites are replaced; a site keeps its rows in file
+    #  order since they are inserted together
+    #
+    siteL = sorted(set(siteL))
+    for start in range(0, len(siteL), 500):
+        batchL = siteL[start:start + 500]
+        connection.execute('DELETE FROM %s WHERE site_no IN (%s)' % (table, ', '.join(['?'] * len(batchL))), batchL)
+
+    rowsL = []
+    for site_no, siteInfoL in sorted(nwisTables.indexBatchRows(nwisFile, siteL).items()):
+        rowsL.extend([[rowD[column] for column in columnsL] for rowD in siteInfoL if len(rowD) == len(columnsL)])
+    connection.executemany('INSERT INTO %s VALUES (%s)' % (table, ', '.join(['?'] * len(columnsL))), rowsL)
+
+    connection.execute('INSERT OR REPLACE INTO nwis_import VALUES (?, ?, ?, ?)',
+                       (table_nm, os.path.basename(nwisFile), stampL[0], stampL[1]))
+
+    return table_nm, len(rowsL)
+
+# =============================================================================
+def refreshDatabase (database, changesL):
+
+    connection = sqlite3.connect(database, isolation_level=None)
+
+    summaryL = []
+
+    # Changed sites of every refreshed table in one transaction
+    #
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for nwis_file, siteL, previousL in changesL:
+            summaryL.append(refreshNwisTable(connection, nwis_file, siteL, previousL))
+        connection.execute('COMMIT')
+    except:
+        connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+
+    return summaryL
+
+# =============================================================================
+def importDatabase (data_dir, database):
+
+    connection = sqlite3.connect(database, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+
+    summaryL = []
+
+    # Replace everything in one transaction so readers switch extracts at once
+    #
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        connection.execute('CREATE TABLE IF NOT EXISTS nwis_import (table_nm TEXT PRIMARY KEY, source TEXT, size INTEGER, mtime_ns INTEGER)')
+        connection.execute('DELETE FROM nwis_import')
+
+        for nwis_file in sorted(glob.glob(os.path.join(data_dir, 'gw_*_01.txt'))):
+            summaryL.append(importNwisTable(connection, nwis_file))
+
+        # Aquifer codes
+        #
+        aqfr_file = os.path.join(data_dir, 'aqfr_cd_query.txt')
+        if os.path.exists(aqfr_file):
+            columnsL, rowsL = readRdbFile(aqfr_file)
+            importTable(connection, 'aqfr_cd_query', columnsL, rowsL)
+            connection.execute('CREATE INDEX aqfr_cd_query_code ON aqfr_cd_query (aqfr_cd, state_cd)')
+            importedSource(connection, 'aqfr_cd_query', aqfr_file)
+            summaryL.append(('aqfr_cd_query', len(rowsL)))
+
+        # Code tables of the well construction lookup file
+        #
+        lookup_file = os.path.join(data_dir, 'well_construction_lookup.json')
+        with open(lookup_file, "r") as fh:
+            jsonD = json.load(fh)
+
+        codesL = []
+        for code_nm, codeD in jsonD.items():
+            if isinstance(codeD, dict) and 'Codes' in codeD:
+                for code, description in codeD['Codes'].items():
+                    codesL.append((code_nm, code, description))
+
+        connection.execute('DROP TABLE IF EXISTS nwis_codes')
+        connection.execute('CREATE TABLE nwis_codes (code_nm TEXT, code TEXT, description TEXT, PRIMARY KEY (code_nm, code))')
+        connection.executemany('INSERT INTO nwis_codes VALUES (?, ?, ?)', codesL)
+        importedSource(connection, 'nwis_codes', lookup_file)
+        summaryL.append(('nwis_codes', len(codesL)))
+
+        # Lithology units are named through the state partitions of
+        #  nwisAquifers; the unused view of earlier imports is dropped
+        #
+        connection.execute('DROP VIEW IF EXISTS gw_geoh_aqfr')
+
+        connection.execute('COMMIT')
+    except:
+        connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+
+    return summaryL
+
+# =============================================================================
+def databaseStamp ():
+
+    # The file the path resolves to; a refresh publishes a new database
+    #  behind the same data link
+    #
+    try:
+        statInfo = os.stat(database_file)
+    except OSError:
+        return None
+
+    return [os.path.realpath(database_file), statInfo.st_dev, statInfo.st_ino]
+
+# =============================================================================
+def databaseConnection ():
+
+    stampL     = databaseStamp()
+    connection = getattr(connectionLocal, 'connection', None)
+
+    # A connection to a replaced database is closed and opened again
+    #
+    if connection is not None and connectionLocal.stamp != stampL:
+        connection.close()
+        connection = connectionLocal.connection = None
+
+    if connection is None:
+        if stampL is None:
+            return None
+        connection = sqlite3.connect('file:%s?mode=ro' % stampL[0], uri=True)
+        connection.row_factory = sqlite3.Row
+        connectionLocal.connection = connection
+        connectionLocal.stamp      = stampL
+
+    return connection
+
+# =============================================================================
+def currentImport (connection, table_nm, source_file):
+
+    # Rows imported from the source file as it is now
+    #
+    try:
+        rowL = connection.execute('SELECT size, mtime_ns FROM nwis_import WHERE table_nm = ?', (table_nm,)).fetchone()
+    except sqlite3.Error:
+        return False
+
+    try:
+        return rowL is not None and list(rowL) == nwisTables.sourceStamp(source_file)
+    except OSError:
+        return False
+
+# =============================================================================
+def currentTable (connection, nwisFile):
+
+    table_nm = nwisTables.tableName(nwisFile)
+    if not currentImport(connection, table_nm, nwisFile):
+        return None
+
+    return table_nm
+
+# =============================================================================
+def sqliteBatchRows (nwisFile, siteL):
+
+    connection = databaseConnection()
+    if connection is None:
+        return None
+
+    table_nm = currentTable(connection, nwisFile)
+    if table_nm is None:
+        return None
+
+    sitesD = {}
+    siteL  = sorted(set(siteL))
+
+    # Bounded IN lists keep within the SQLite host parameter limit
+    #
+    for start in range(0, len(siteL), 500):
+        batchL = siteL[start:start + 500]
+        query  = 'SELECT * FROM %s WHERE site_no IN (%s) ORDER BY rowid' % (quoteName(table_nm), ', '.join(['?'] * len(batchL)))
+        for row in connection.execute(query, batchL):
+            sitesD.setdefault(row['site_no'], []).append(dict(row))
+
+    return sitesD
+
+# =============================================================================
+def sqliteCodes (code_nm):
+
+    connection = databaseConnection()
+    if connection is None:
+        return None
+
+    # Code files edited since the import are read from the file
+    #
+    if not currentImport(connection, 'nwis_codes', usgsWellData.well_lookup_file):
+        return None
+
+    try:
+        rowsL = connection.execute('SELECT code, description FROM nwis_codes WHERE code_nm = ?', (code_nm,)).fetchall()
+    except sqlite3.Error:
+        return None
+
+    return dict([(row['code'], row['description']) for row in rowsL])
+
+# =============================================================================
+class AquiferNames (dict):
+
+    # Aquifer names resolved one code at a time through the indexed
+    #  aqfr_cd_query table instead of loading the whole code file; the name
+    #  of the site state wins, then the national name, then the last one
+    #
+    def __init__ (self, state_cd=None):
+
+        dict.__init__(self)
+        self.state_cd = state_cd
+
+    def __missing__ (self, aqfr_cd):
+
+        row = databaseConnection().execute('''SELECT aqfr_nm FROM aqfr_cd_query WHERE aqfr_cd = ?
+                                              ORDER BY state_cd = ? DESC, state_cd = '00' DESC, rowid DESC LIMIT 1''',
+                                           (aqfr_cd, self.state_cd)).fetchone()
+        if row is None:
+            raise KeyError(aqfr_cd)
+
+        self[aqfr_cd] = row['aqfr_nm']
+
+        return self[aqfr_cd]
+
+# =============================================================================
+def sqliteAquifers (state_cd=None):
+
+    connection = databaseConnection()
+    if connection is None:
+        return None
+
+    if not currentImport(connection, 'aqfr_cd_query', usgsWellData.aqfr_lookup_file):
+        return None
+
+    return AquiferNames(state_cd)
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Import the NWIS RDB tables and code tables into SQLite')
+    parser.add_argument('--data', default=usgsWellData.data_dir,
+                        help='Directory holding the gw_*_01.txt tables and code files')
+    parser.add_argument('--database', default=database_file, help='SQLite database file')
+    args = parser.parse_args()
+
+    for table_nm, rows in importDatabase(args.data, args.database):
+        print('%s: %d rows' % (table_nm, rows))
+
+    sys.exit()
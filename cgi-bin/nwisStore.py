@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisStore.py
+#
+# Project:  wellConstruction
+# Purpose:  Module holds NWIS RDB tables in memory as parallel typed arrays
+#            for a resident server.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The memory lookup mode (NWIS_LOOKUP=memory) reads each table once into
+#  the process and keeps every column as one typed array, with the column
+#  types of the row decoder (see nwisSchema.py):
+#
+#    int columns (cons_seq_nu, ...)     array('i'), null stored as intNull
+#    float columns (hole_top_va, ...)   array('d'), null stored as NaN
+#    text columns (lith_cd, ...)        interned string table and array
+#                                        ('B', 'H' or 'I') of codes into it,
+#                                        code 0 is null
+#
+#  and a site_no -> (start, length) index of the contiguous site groups. A
+#  lookup slices the arrays of the columns the caller projects and returns
+#  the same records the row decoder reads from the RDB text. A table whose
+#  file changes is read again on the next lookup.
+#
+# The store is meant for a resident server (wellService.py --lookup memory);
+#  a CGI process would read the whole table for one site. Compare its size
+#  with a list of csv.DictReader rows on the shipped data with
+#
+#    python nwisStore.py data/gw_cons_01.txt data/gw_hole_01.txt ...
+#
+###############################################################################
+
+import os, sys, io
+
+import math
+
+import threading
+
+from array import array
+
+import nwisTables
+
+import nwisSchema
+
+intNull        = -2147483648
+
+# Stores built by this process keyed by table file
+#
+storeCacheD    = {}
+storeLock      = threading.Lock()
+
+# =============================================================================
+def codeArray (codesL, count):
+
+    # Smallest array type holding every code of the string table
+    #
+    for typecode in ['B', 'H', 'I']:
+        if count <= 1 << (8 * array(typecode).itemsize):
+            return array(typecode, codesL)
+
+    return array('L', codesL)
+
+# =============================================================================
+def buildStore (nwisFile):
+
+    stampL   = nwisTables.sourceStamp(nwisFile)
+    headerD  = nwisTables.rdbHeader(nwisFile)
+    decoder  = nwisSchema.rowDecoder(nwisFile, record='tuple')
+    keyIndex = headerD['keyIndex']
+
+    valuesL  = []
+    for kind in decoder.kindsL:
+        if kind == 'int':
+            valuesL.append(array('i'))
+        elif kind == 'float':
+            valuesL.append(array('d'))
+        else:
+            valuesL.append([])
+    stringsD = [{None: 0} if kind == 'str' else None for kind in decoder.kindsL]
+    sitesD   = {}
+    rows     = 0
+
+    # One pass over the table; text values are replaced by their code in
+    #  the column's string table as they are read
+    #
+    with open(nwisFile, "rb") as fh:
+        fh.seek(headerD['offset'])
+
+        site_no = None
+        start   = 0
+        for recordT in decoder.iterate(io.TextIOWrapper(fh, encoding='utf-8', newline='')):
+            for column, value in enumerate(recordT):
+                codesD = stringsD[column]
+                if codesD is not None:
+                    code = codesD.get(value)
+                    if code is None:
+                        code = codesD[sys.intern(value)] = len(codesD)
+                    valuesL[column].append(code)
+                elif value is None:
+                    valuesL[column].append(intNull if decoder.kindsL[column] == 'int' else math.nan)
+                else:
+                    valuesL[column].append(value)
+
+            # Site groups are contiguous in the sorted extract; a site found
+            #  again further on keeps its first group, as the sidecar index
+            #  and the snapshot do
+            #
+            if recordT[keyIndex] != site_no:
+                if site_no is not None and site_no not in sitesD:
+                    sitesD[site_no] = (start, rows - start)
+                site_no = sys.intern(recordT[keyIndex])
+                start   = rows
+            rows += 1
+
+        if site_no is not None and site_no not in sitesD:
+            sitesD[site_no] = (start, rows - start)
+
+    columnsL = []
+    for column, kind, values, codesD in zip(decoder.columnsL, decoder.kindsL, valuesL, stringsD):
+        columnD = {'name': column, 'kind': kind, 'values': values}
+        if codesD is not None:
+            columnD['values']  = codeArray(values, len(codesD))
+            columnD['strings'] = [value for value, code in sorted(codesD.items(), key=lambda item: item[1])]
+        columnsL.append(columnD)
+
+    return {
+        'stamp':   stampL,
+        'file':    nwisFile,
+        'rows':    rows,
+        'columns': columnsL,
+        'sites':   sitesD
+    }
+
+# =============================================================================
+def openStore (nwisFile):
+
+    stampL = nwisTables.sourceStamp(nwisFile)
+
+    storeD = storeCacheD.get(nwisFile)
+    if storeD is not None and storeD['stamp'] == stampL:
+        return storeD
+
+    # One thread reads a new or replaced table; the others wait for it
+    #
+    with storeLock:
+        storeD = storeCacheD.get(nwisFile)
+        if storeD is None or storeD['stamp'] != stampL:
+            storeD = buildStore(nwisFile)
+            storeCacheD[nwisFile] = storeD
+
+    return storeD
+
+# =============================================================================
+def columnSlice (columnD, start, stop):
+
+    values = columnD['values'][start:stop]
+
+    if columnD['kind'] == 'int':
+        return [None if value == intNull else value for value in values]
+
+    if columnD['kind'] == 'float':
+        return [None if math.isnan(value) else value for value in values]
+
+    stringsL = columnD['strings']
+
+    return [stringsL[code] for code in values]
+
+# =============================================================================
+def storeBatchRows (nwisFile, siteL, decoder=None):
+
+    storeD   = openStore(nwisFile)
+    columnsD = dict([(columnD['name'], columnD) for columnD in storeD['columns']])
+    sitesD   = {}
+
+    # Every column as a dictionary row without a decoder
+    #
+    if decoder is None:
+        namesL    = [columnD['name'] for columnD in storeD['columns']]
+        projectL  = storeD['columns']
+        make      = lambda valuesL: dict(zip(namesL, valuesL))
+    else:
+        projectL  = [columnsD[column] for column in decoder.columnsL]
+        make      = decoder.make
+
+        # Both are typed by nwisSchema; a decoder built without gw_gwdd
+        #  may type a column differently and reads the RDB text instead
+        #
+        for columnD, kind in zip(projectL, decoder.kindsL):
+            if columnD['kind'] != kind:
+                return None
+
+    for site_no in set(siteL):
+        entryT = storeD['sites'].get(site_no)
+        if entryT is None:
+            continue
+        start, length = entryT
+
+        slicesL = [columnSlice(columnD, start, start + length) for columnD in projectL]
+        sitesD[site_no] = [make(list(valuesT)) for valuesT in zip(*slicesL)]
+
+    return sitesD
+
+# =============================================================================
+def dictRows (nwisFile):
+
+    import csv
+
+    rowsL = []
+
+    # Rows as the scripts used to hold them: one dictionary per row with
+    #  empty values set to None
+    #
+    with open(nwisFile, "r") as fh:
+        csv_reader = csv.DictReader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
+        next(csv_reader)
+        for tempD in csv_reader:
+            for key, value in tempD.items():
+                if len(value) < 1:
+                    tempD[key] = None
+            rowsL.append(tempD)
+
+    return rowsL
+
+# =============================================================================
+def tracedBytes (builder, nwisFile):
+
+    import gc
+
+    import tracemalloc
+
+    # Memory still held by the result once it is built
+    #
+    gc.collect()
+    tracemalloc.start()
+    result = builder(nwisFile)
+    gc.collect()
+    size   = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return result, size
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare the memory of the NWIS array store with dictionary rows')
+    parser.add_argument('nwis_files', nargs='+', help='NWIS RDB table files (gw_*_01.txt)')
+    args = parser.parse_args()
+
+    totalRows  = 0
+    totalDicts = 0
+    totalStore = 0
+
+    for nwis_file in args.nwis_files:
+
+        # Header and data dictionary are read before measuring
+        #
+        nwisSchema.rowDecoder(nwis_file, record='tuple')
+
+        rowsL, dictSize   = tracedBytes(dictRows, nwis_file)
+        del rowsL
+        storeD, storeSize = tracedBytes(buildStore, nwis_file)
+
+        totalRows  += storeD['rows']
+        totalDicts += dictSize
+        totalStore += storeSize
+        print('%s: %d rows, %d sites, dictionaries %.1f MB, store %.2f MB (%.1f%%)' % (nwis_file, storeD['rows'], len(storeD['sites']),
+                                                                                     dictSize / 1048576.0, storeSize / 1048576.0,
+                                                                                     100.0 * storeSize / max(dictSize, 1)))
+
+    print('total: %d rows, dictionaries %.1f MB, store %.2f MB, saved %.1f MB' % (totalRows, totalDicts / 1048576.0, totalStore / 1048576.0,
+                                                                                (totalDicts - totalStore) / 1048576.0))
+
+    sys.exit()
@@ -0,0 +1,532 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: nwisTables.py
+#
+# Project:  wellConstruction
+# Purpose:  Module provides site lookups into the NWIS RDB data tables
+#            (gw_*_01.txt) through a byte-offset sidecar index or a binary
+#            search of the memory-mapped table.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The NWIS RDB dumps are sorted and grouped by site_no. The sidecar index
+#  (gw_hole_01.txt -> gw_hole_01.idx) records the byte offset, byte length
+#  and row count of every site group together with the size and modification
+#  time of the table it was built from. A lookup seeks straight to the site
+#  group and parses only those rows. A missing or stale index is rebuilt on
+#  first use; run this module from the command line to build the indexes
+#  when a new NWIS extract is loaded:
+#
+#    python nwisTables.py data/gw_*_01.txt
+#
+# The bisect lookup mode needs no sidecar at all: the table is memory-mapped
+#  and bisected on line boundaries by the site_no column, so a freshly
+#  swapped NWIS extract is searched in O(log n) without a rebuild step. The
+#  mode is chosen by the NWIS_LOOKUP environment variable (snapshot, index,
+#  bisect, sqlite, memory or scan). The default snapshot mode reads the
+#  compiled columnar snapshots of nwisSnapshot.py, the sqlite mode the
+#  database imported by nwisSqlite.py and the memory mode the typed arrays
+#  a resident server keeps (nwisStore.py); all fall back to the indexed RDB
+#  text. The scan mode reads the whole table line by line as the scripts
+#  originally did and is only kept as a baseline for benchmarks.
+#
+# Batch lookups sort the requested sites and answer them in one forward pass
+#  over each table, seeking or bisecting from where the previous site ended.
+#
+# Built with a signatures dictionary the index pass also gives a digest of
+#  the *_md modification times of every site group, which nwisRefresh.py
+#  compares between extracts.
+#
+###############################################################################
+
+import os, sys
+
+import json
+
+import mmap
+
+import hashlib
+
+import threading
+
+import wellTiming
+
+keyColumn      = 'site_no'
+modifiedSuffix = '_md'
+indexSuffix    = '.idx'
+lookupMode     = os.environ.get('NWIS_LOOKUP', 'snapshot')
+
+# Indexes and RDB headers already loaded by this process keyed by table file
+#
+indexCacheD  = {}
+headerCacheD = {}
+
+# =============================================================================
+def indexFileName (nwisFile):
+
+    return os.path.splitext(nwisFile)[0] + indexSuffix
+
+# =============================================================================
+def sourceStamp (nwisFile):
+
+    statInfo = os.stat(nwisFile)
+
+    return [statInfo.st_size, statInfo.st_mtime_ns]
+
+# =============================================================================
+def splitRdbLine (line):
+
+    return line.rstrip(b'\r\n').decode('utf-8').split('\t')
+
+# =============================================================================
+def buildNwisIndex (nwisFile, signaturesD=None):
+
+    stampL    = sourceStamp(nwisFile)
+    columnsL  = None
+    typesL    = None
+    keyIndex  = None
+    stampsL   = None
+    sitesD    = {}
+    current   = None
+    entryL    = None
+    offset    = 0
+
+    # Read the table in binary so offsets are exact byte positions
+    #
+    with open(nwisFile, "rb") as fh:
+
+        for line in fh:
+            length = len(line)
+
+            # Skip comment header lines
+            #
+            if line[:1] == b'#':
+                offset += length
+                continue
+
+            # Column names followed by the RDB type/width line
+            #
+            if columnsL is None:
+                columnsL = splitRdbLine(line)
+                keyIndex = columnsL.index(keyColumn)
+                stampsL  = [index for index, column in enumerate(columnsL) if column.endswith(modifiedSuffix)]
+
+            elif typesL is None:
+                typesL = splitRdbLine(line)
+
+            # Data rows grouped by site; only the first group of a site is
+            #  kept, matching the early break of a sequential scan
+            #
+            else:
+                fieldsL = line.split(b'\t', keyIndex + 1)
+                if len(fieldsL) > keyIndex:
+                    site = fieldsL[keyIndex].decode('utf-8')
+
+                    if site != current:
+                        current = site
+                        entryL  = None
+                        if site not in sitesD:
+                            entryL = sitesD[site] = [offset, 0, 0]
+
+                    if entryL is not None:
+                        entryL[1] += length
+                        entryL[2] += 1
+
+                        # Modification times of the rows (cons_md, ...) or
+                        #  the whole row for a table without them
+                        #
+                        if signaturesD is not None:
+                            valuesL = line.rstrip(b'\r\n').split(b'\t')
+                            if len(stampsL) > 0:
+                                valuesL = [valuesL[index] if index < len(valuesL) else b'' for index in stampsL]
+                            signaturesD.setdefault(site, []).append(b'\t'.join(valuesL))
+
+            offset += length
+
+    if columnsL is None:
+        raise ValueError('No column header found in NWIS file %s' % nwisFile)
+
+    # One digest per site group; any row added, removed or modified changes it
+    #
+    if signaturesD is not None:
+        header = '\t'.join(columnsL).encode('utf-8')
+        for site, valuesL in signaturesD.items():
+            signaturesD[site] = hashlib.blake2b(b'\n'.join([header] + valuesL), digest_size=16).digest()
+
+    indexD = {
+        'source':  os.path.basename(nwisFile),
+        'stamp':   stampL,
+        'columns': columnsL,
+        'types':   typesL,
+        'sites':   sitesD
+    }
+
+    return indexD
+
+# =============================================================================
+def writeNwisIndex (nwisFile, indexD):
+
+    index_file = indexFileName(nwisFile)
+    temp_file  = '%s.%d.%d.tmp' % (index_file, os.getpid(), threading.get_ident())
+
+    # Write to a temporary file and rename so readers never see a partial index
+    #
+    with open(temp_file, "w") as fh:
+        json.dump(indexD, fh, separators=(',', ':'))
+
+    os.replace(temp_file, index_file)
+
+    return index_file
+
+# =============================================================================
+def loadNwisIndex (nwisFile):
+
+    stampL = sourceStamp(nwisFile)
+
+    # Index already held by this process
+    #
+    indexD = indexCacheD.get(nwisFile)
+    if indexD is not None and indexD['stamp'] == stampL:
+        return indexD
+
+    # Sidecar index on disk
+    #
+    indexD     = None
+    index_file = indexFileName(nwisFile)
+    try:
+        with open(index_file, "r") as fh:
+            indexD = json.load(fh)
+        if indexD.get('stamp') != stampL:
+            indexD = None
+    except (OSError, ValueError):
+        indexD = None
+
+    # Missing or stale index; rebuild and save it when the data directory
+    #  is writable
+    #
+    if indexD is None:
+        indexD = buildNwisIndex(nwisFile)
+        try:
+            writeNwisIndex(nwisFile, indexD)
+        except OSError:
+            pass
+
+    indexCacheD[nwisFile] = indexD
+
+    return indexD
+
+# =============================================================================
+def decodeRows (columnsL, block):
+
+    import csv
+
+    siteInfoL = []
+
+    # Parse only the rows of the site group and set empty values to None
+    #
+    csv_reader = csv.reader(block.decode('utf-8').splitlines(), delimiter='\t')
+    for rowL in csv_reader:
+        siteInfoL.append(dict(zip(columnsL, [value if len(value) > 0 else None for value in rowL])))
+
+    return siteInfoL
+
+# =============================================================================
+def rdbHeader (nwisFile):
+
+    stampL = sourceStamp(nwisFile)
+
+    headerD = headerCacheD.get(nwisFile)
+    if headerD is not None and headerD['stamp'] == stampL:
+        return headerD
+
+    columnsL = None
+    typesL   = None
+    offset   = 0
+
+    # Column names and type/width line follow the comment header lines
+    #
+    with open(nwisFile, "rb") as fh:
+        for line in fh:
+            offset += len(line)
+            if line[:1] == b'#':
+                continue
+            if columnsL is None:
+                columnsL = splitRdbLine(line)
+            else:
+                typesL = splitRdbLine(line)
+                break
+
+    if columnsL is None:
+        raise ValueError('No column header found in NWIS file %s' % nwisFile)
+
+    headerD = {
+        'stamp':    stampL,
+        'columns':  columnsL,
+        'types':    typesL,
+        'keyIndex': columnsL.index(keyColumn),
+        'offset':   offset
+    }
+    headerCacheD[nwisFile] = headerD
+
+    return headerD
+
+# =============================================================================
+def lineEnd (mm, start):
+
+    end = mm.find(b'\n', start)
+
+    return len(mm) if end < 0 else end + 1
+
+# =============================================================================
+def lineKey (mm, start, end, keyIndex):
+
+    fieldsL = mm[start:end].split(b'\t', keyIndex + 1)
+
+    return fieldsL[keyIndex] if len(fieldsL) > keyIndex else b''
+
+# =============================================================================
+def bisectGroup (mm, lo, keyIndex, target):
+
+    # Find the first line at or after lo whose site_no is not less than the
+    #  target; lo and hi always sit on line starts
+    #
+    hi = len(mm)
+    while lo < hi:
+        mid   = (lo + hi) // 2
+        start = mm.rfind(b'\n', lo, mid) + 1
+        if start < lo:
+            start = lo
+        end   = lineEnd(mm, start)
+        if lineKey(mm, start, end, keyIndex) < target:
+            lo = end
+        else:
+            hi = start
+
+    # Extend over the site group
+    #
+    stop = lo
+    while stop < len(mm):
+        end = lineEnd(mm, stop)
+        if lineKey(mm, stop, end, keyIndex) != target:
+            break
+        stop = end
+
+    return lo, stop
+
+# =============================================================================
+def bisectBatchRows (nwisFile, siteL, decoder=None):
+
+    headerD  = rdbHeader(nwisFile)
+    keyIndex = headerD['keyIndex']
+    sitesD   = {}
+
+    with open(nwisFile, "rb") as fh:
+
+        if os.fstat(fh.fileno()).st_size <= headerD['offset']:
+            return sitesD
+
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+            # Merge the sorted site list against the sorted table; each search
+            #  starts where the previous site left off
+            #
+            lo = headerD['offset']
+            for site_no in sorted(set(siteL)):
+                start, lo = bisectGroup(mm, lo, keyIndex, site_no.encode('utf-8'))
+                if lo > start:
+                    if decoder is not None:
+                        sitesD[site_no] = decoder.decode(mm[start:lo])
+                    else:
+                        sitesD[site_no] = decodeRows(headerD['columns'], mm[start:lo])
+
+    return sitesD
+
+# =============================================================================
+def bisectSiteRows (nwisFile, site_no):
+
+    return bisectBatchRows(nwisFile, [site_no]).get(site_no, [])
+
+# =============================================================================
+def indexBatchRows (nwisFile, siteL, decoder=None):
+
+    indexD = loadNwisIndex(nwisFile)
+    sitesD = {}
+
+    # Read the site groups in file order through a single handle
+    #
+    entriesL = []
+    for site_no in set(siteL):
+        entryL = indexD['sites'].get(site_no)
+        if entryL is not None:
+            entriesL.append((entryL[0], entryL[1], site_no))
+
+    if len(entriesL) < 1:
+        return sitesD
+
+    with open(nwisFile, "rb") as fh:
+        for offset, length, site_no in sorted(entriesL):
+            fh.seek(offset)
+            if decoder is not None:
+                sitesD[site_no] = decoder.decode(fh.read(length))
+            else:
+                sitesD[site_no] = decodeRows(indexD['columns'], fh.read(length))
+
+    return sitesD
+
+# =============================================================================
+def indexSiteRows (nwisFile, site_no):
+
+    return indexBatchRows(nwisFile, [site_no]).get(site_no, [])
+
+# =============================================================================
+def tableName (nwisFile):
+
+    # gw_hole_01.txt holds table gw_hole
+    #
+    table_nm = os.path.splitext(os.path.basename(nwisFile))[0]
+    if table_nm.endswith('_01'):
+        table_nm = table_nm[:-3]
+
+    return table_nm
+
+# =============================================================================
+def scanBatchRows (nwisFile, siteL):
+
+    import csv
+
+    siteS  = set(siteL)
+    sitesD = {}
+    passed = 0
+
+    # Linear scan of the whole table the way the scripts read it before the
+    #  indexes; kept as the reference the other lookup modes are measured by
+    #
+    with open(nwisFile, "r") as fh:
+        csv_reader = csv.DictReader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
+
+        for tempD in csv_reader:
+            if tempD[keyColumn] in siteS:
+                for key, value in tempD.items():
+                    if len(value) < 1:
+                        tempD[key] = None
+                sitesD.setdefault(tempD[keyColumn], []).append(tempD)
+
+            # Stop once the last requested site group has been read
+            #
+            elif len(sitesD) == len(siteS):
+                break
+
+            else:
+                passed += 1
+
+    # Rows read without being returned
+    #
+    wellTiming.rows(tableName(nwisFile), 0, passed)
+
+    return sitesD
+
+# =============================================================================
+def decodedRows (sitesD, decoder):
+
+    # Dictionary rows of the SQLite and scan lookups as the decoder's
+    #  records
+    #
+    if decoder is None:
+        return sitesD
+
+    return dict([(site_no, decoder.records(rowsL)) for site_no, rowsL in sitesD.items()])
+
+# =============================================================================
+def lookupBatchRows (nwisFile, siteL, mode=None, decoder=None):
+
+    # A row decoder (see nwisSchema.py) returns projected, typed records in
+    #  place of a dictionary of every column
+    #
+    if mode is None:
+        mode = lookupMode
+
+    # Compiled snapshot first, falling back to the RDB text through the
+    #  sidecar index when no current snapshot exists
+    #
+    if mode == 'snapshot':
+        import nwisSnapshot
+        sitesD = nwisSnapshot.snapshotBatchRows(nwisFile, siteL, decoder)
+        if sitesD is not None:
+            return sitesD
+        mode = 'index'
+
+    # SQLite database, falling back the same way for tables it does not hold
+    #  or holds from an older extract
+    #
+    elif mode == 'sqlite':
+        import nwisSqlite
+        sitesD = nwisSqlite.sqliteBatchRows(nwisFile, siteL)
+        if sitesD is not None:
+            return decodedRows(sitesD, decoder)
+        mode = 'index'
+
+    # Typed arrays held by a resident process
+    #
+    elif mode == 'memory':
+        import nwisStore
+        sitesD = nwisStore.storeBatchRows(nwisFile, siteL, decoder)
+        if sitesD is not None:
+            return sitesD
+        mode = 'index'
+
+    if mode == 'bisect':
+        return bisectBatchRows(nwisFile, siteL, decoder)
+    elif mode == 'index':
+        return indexBatchRows(nwisFile, siteL, decoder)
+    elif mode == 'scan':
+        return decodedRows(scanBatchRows(nwisFile, siteL), decoder)
+
+    raise ValueError('Unknown NWIS lookup mode %s' % mode)
+
+# =============================================================================
+def lookupSiteRows (nwisFile, site_no, mode=None, decoder=None):
+
+    return lookupBatchRows(nwisFile, [site_no], mode, decoder).get(site_no, [])
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build site_no sidecar indexes for NWIS RDB tables')
+    parser.add_argument('nwis_files', nargs='+', help='NWIS RDB table files (gw_*_01.txt)')
+    args = parser.parse_args()
+
+    for nwis_file in args.nwis_files:
+        indexD     = buildNwisIndex(nwis_file)
+        index_file = writeNwisIndex(nwis_file, indexD)
+        print('%s: %d sites indexed in %s' % (nwis_file, len(indexD['sites']), index_file))
+
+    sys.exit()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: requestUsgsCrossReference.py
+#
+# Project:  wellConstruction
+# Purpose:  Script translates USGS site numbers, OWRD well log ids
+#            (coop_site_no) and other agency ids (otid_id) into each other
+#            in JSON format; several ids are separated by commas. The
+#            optional sections argument (well_construction, gw_geoh) adds
+#            the well documents of the sites found.
+# 
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os, sys
+
+import usgsWellData
+
+import wellTiming
+
+import nwisCrossReference
+
+# Parse the Query String
+#
+params = {}
+
+HardWired = None
+#HardWired = 1
+
+if HardWired is not None:
+    #os.environ['QUERY_STRING'] = 'site_no=420030121224201'
+    #os.environ['QUERY_STRING'] = 'otid_id=L50201'
+    #os.environ['QUERY_STRING'] = 'coop_site_no=DESC0008977&sections=well_construction,gw_geoh'
+    os.environ['QUERY_STRING'] = 'coop_site_no=DESC0008977'
+
+if 'QUERY_STRING' in os.environ:
+    params = usgsWellData.queryParameters(os.environ['QUERY_STRING'])
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+debug           = False
+
+program         = "USGS Well Cross Reference Script"
+version         = "1.00"
+version_date    = "18October2026"
+
+program_args    = []
+
+# =============================================================================
+def errorMessage(error_message):
+
+    usgsWellData.screenLogger().info(error_message)
+    timingD = wellTiming.finishRequest('error')
+    print("Content-type:application/json")
+    if timingD is not None:
+        print('Server-Timing: %s' % timingD['server_timing'])
+    print("\n")
+    print(usgsWellData.messageJson(error_message))
+    sys.exit()
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+# Time the request phases when WELL_TIMING is set
+#
+wellTiming.startRequest('crossreference', interpreter=True)
+
+try:
+    # Code tables and aquifer names only for the well documents
+    #
+    definitionsD = None
+    aqfrInfoD    = None
+    if len(params.get('sections', '')) > 0:
+        with wellTiming.phase('definitions'):
+            definitionsD = usgsWellData.loadDefinitions()
+        if 'gw_geoh' in usgsWellData.wellSections(params['sections']):
+            with wellTiming.phase('aquifers'):
+                aqfrInfoD = usgsWellData.loadAquifers()
+
+    jsonOutput = nwisCrossReference.crossReferenceJson(params, definitionsD, aqfrInfoD)
+
+except usgsWellData.WellDataError as e:
+    errorMessage(str(e))
+
+# Output json
+# -------------------------------------------------
+#
+timingD = wellTiming.finishRequest('200')
+
+print("Content-type:application/json")
+if timingD is not None:
+    print('Server-Timing: %s' % timingD['server_timing'])
+print("\n")
+print(jsonOutput)
+
+sys.exit()
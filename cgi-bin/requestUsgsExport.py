@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: requestUsgsExport.py
+#
+# Project:  wellConstruction
+# Purpose:  Script streams the shaped well construction and lithology
+#            records of every well, or of the wells of the networks given
+#            (netw_cd=WL), as NDJSON or CSV (format=csv), compressed with
+#            gzip when asked (gzip=1) or accepted by the client.
+# 
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os, sys
+
+import usgsWellData
+
+import wellTiming
+
+import nwisExport
+
+# Parse the Query String
+#
+params = {}
+
+HardWired = None
+#HardWired = 1
+
+if HardWired is not None:
+    #os.environ['QUERY_STRING'] = 'format=csv&netw_cd=WL&gzip=1'
+    #os.environ['QUERY_STRING'] = 'sections=gw_geoh&netw_cd=QW'
+    os.environ['QUERY_STRING'] = 'format=ndjson&netw_cd=WL'
+
+if 'QUERY_STRING' in os.environ:
+    params = usgsWellData.queryParameters(os.environ['QUERY_STRING'])
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+debug           = False
+
+program         = "USGS Well Export Script"
+version         = "1.00"
+version_date    = "18October2026"
+
+program_args    = []
+
+# =============================================================================
+def errorMessage(error_message):
+
+    usgsWellData.screenLogger().info(error_message)
+    timingD = wellTiming.finishRequest('error')
+    print("Content-type:application/json")
+    if timingD is not None:
+        print('Server-Timing: %s' % timingD['server_timing'])
+    print("\n")
+    print(usgsWellData.messageJson(error_message))
+    sys.exit()
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+# Time the request phases when WELL_TIMING is set
+#
+wellTiming.startRequest('export', interpreter=True)
+
+try:
+    with wellTiming.phase('definitions'):
+        definitionsD = usgsWellData.loadDefinitions()
+
+    # Aquifer names are only needed for the lithology section
+    #
+    aqfrInfoD    = None
+    if 'gw_geoh' in usgsWellData.wellSections(params.get('sections')):
+        with wellTiming.phase('aquifers'):
+            aqfrInfoD = usgsWellData.loadAquifers()
+
+    compress     = nwisExport.exportCompressed(params, os.environ.get('HTTP_ACCEPT_ENCODING'))
+    content_type, chunksI = nwisExport.exportStream(params, definitionsD, aqfrInfoD, compress)
+
+except usgsWellData.WellDataError as e:
+    errorMessage(str(e))
+
+# Output the records as they are shaped; without a Content-Length the web
+#  server sends them with chunked transfer
+# -------------------------------------------------
+#
+print("Content-type:%s" % content_type)
+if compress:
+    print("Content-Encoding: gzip")
+print("")
+sys.stdout.flush()
+
+for chunk in chunksI:
+    sys.stdout.buffer.write(chunk)
+    sys.stdout.buffer.flush()
+
+wellTiming.finishRequest('200')
+
+sys.exit()
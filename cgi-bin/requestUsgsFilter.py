@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: requestUsgsFilter.py
+#
+# Project:  wellConstruction
+# Purpose:  Script outputs the NWIS site numbers of the wells with
+#            lithology, open, casing or hole intervals in a depth range
+#            (lith_depth=100,300) and with given codes (lith_cd, open_cd,
+#            csng_material_cd) in JSON format, a page (offset, limit) at
+#            a time.
+# 
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os, sys
+
+import usgsWellData
+
+import wellTiming
+
+import nwisIntervals
+
+# Parse the Query String
+#
+params = {}
+
+HardWired = None
+#HardWired = 1
+
+if HardWired is not None:
+    #os.environ['QUERY_STRING'] = 'open_depth=500,&limit=50&offset=50'
+    #os.environ['QUERY_STRING'] = 'csng_material_cd=S&csng_depth=0,20&lith_cd=CLAY'
+    os.environ['QUERY_STRING'] = 'lith_cd=BSLT&lith_depth=100,300'
+
+if 'QUERY_STRING' in os.environ:
+    params = usgsWellData.queryParameters(os.environ['QUERY_STRING'])
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+debug           = False
+
+program         = "USGS Well Filter Script"
+version         = "1.00"
+version_date    = "18October2026"
+
+program_args    = []
+
+# =============================================================================
+def errorMessage(error_message):
+
+    usgsWellData.screenLogger().info(error_message)
+    timingD = wellTiming.finishRequest('error')
+    print("Content-type:application/json")
+    if timingD is not None:
+        print('Server-Timing: %s' % timingD['server_timing'])
+    print("\n")
+    print(usgsWellData.messageJson(error_message))
+    sys.exit()
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+# Time the request phases when WELL_TIMING is set
+#
+wellTiming.startRequest('filter', interpreter=True)
+
+try:
+    jsonOutput = nwisIntervals.filterJson(params)
+
+except usgsWellData.WellDataError as e:
+    errorMessage(str(e))
+
+# Output json
+# -------------------------------------------------
+#
+timingD = wellTiming.finishRequest('200')
+
+print("Content-type:application/json")
+if timingD is not None:
+    print('Server-Timing: %s' % timingD['server_timing'])
+print("\n")
+print(jsonOutput)
+
+sys.exit()
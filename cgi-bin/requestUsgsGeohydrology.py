@@ -31,30 +31,13 @@
 # DEALINGS IN THE SOFTWARE.
 ###############################################################################
 
-import os, sys, string, re
+import os, sys
 
-import csv
+import usgsWellData
 
-import json
+import wellTiming
 
-# Set up logging
-#
-import logging
-
-# -- Set logging file
-#
-# Create screen handler
-#
-screen_logger = logging.getLogger()
-formatter     = logging.Formatter(fmt='%(message)s')
-console       = logging.StreamHandler()
-console.setFormatter(formatter)
-screen_logger.addHandler(console)
-screen_logger.setLevel(logging.INFO)
-
-# Import modules for CGI handling
-#
-from urllib.parse import urlparse, parse_qs
+import nwisResponseCache
 
 # Parse the Query String
 #
@@ -77,27 +60,14 @@ if HardWired is not None:
     os.environ['QUERY_STRING'] = 'site_no=451626122522001'
 
 if 'QUERY_STRING' in os.environ:
-    queryString = os.environ['QUERY_STRING']
-
-    queryStringD = parse_qs(queryString, encoding='utf-8')
-
-    myParmsL = [
-        'site_no'
-    ]
-
-    for myParm in myParmsL:
-        myItems = re.escape(queryStringD.get(myParm, [''])[0]).split(',')
-        if len(myItems) > 1:
-            params[myParm] = re.escape(queryStringD.get(myParm, [''])[0])
-        else:
-            params[myParm] = re.escape(myItems[0])
+    params = usgsWellData.queryParameters(os.environ['QUERY_STRING'])
 
 if 'site_no' in params:
     site_no = params['site_no']
 else:
     message = "Requires a NWIS site number"
     print("Content-type:application/json\n\n")
-    print('{ "message": "%s" }' % message)
+    print(usgsWellData.messageJson(message))
     sys.exit()
     
 # ------------------------------------------------------------
@@ -106,245 +76,90 @@ else:
 debug           = False
 
 program         = "USGS Geohydrology Script"
-version         = "3.02"
-version_date    = "14January2025"
+version         = "3.03"
+version_date    = "18October2026"
 
 program_args    = []
 
 # =============================================================================
 def errorMessage(error_message):
 
-    screen_logger.info(error_message)
-    print("Content-type:application/json\n\n")
-    print('{ "message": "%s" }' % message)
+    usgsWellData.screenLogger().info(error_message)
+    timingD = wellTiming.finishRequest('error')
+    print("Content-type:application/json")
+    if timingD is not None:
+        print('Server-Timing: %s' % timingD['server_timing'])
+    print("\n")
+    print(usgsWellData.messageJson(error_message))
     sys.exit()
 
-# =============================================================================
-def processAqfrCodes (aqfr_lookup_file):
-
-    aqfrInfoD   = {}
-
-    # Create a CSV reader object and remove comment header lines
-    #
-    try:
-        with open(aqfr_lookup_file, "r") as fh:
-            csv_reader = csv.DictReader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
-            for tempD in csv_reader:
-                aqfr_cd = tempD['aqfr_cd']
-                aqfr_nm = tempD['aqfr_nm']
-
-                aqfrInfoD[aqfr_cd] = aqfr_nm
-
-    except FileNotFoundError:
-        message = 'File %s not found' % aqfr_lookup_file
-        errorMessage(message)
-    except PermissionError:
-        message = 'No permission to access file %s' % aqfr_lookup_file
-        errorMessage(message)
-    except Exception as e:
-        message = 'An error occurred: %s' % e
-        errorMessage(message)
-
-    # Error
-    #
-    if len(aqfrInfoD) < 1:
-        message = 'No aquifer definitions loaded from file %s' % aqfr_lookup_file
-        errorMessage(message)        
-
-    return aqfrInfoD
-
-# =============================================================================
-def jsonDefinitions (well_lookup_file):
-
-    jsonD = {}
-    
-    # Read json file
-    #
-    try:
-        with open(well_lookup_file, "r") as fh:
-            jsonD = json.load(fh)
-            sealD = jsonD['seal_cd']['Codes']
-            csngD = jsonD['csng_material_cd']['Codes']
-            openD = jsonD['open_cd']['Codes']
-            geohD = jsonD['lith_cd']['Codes']
-    except FileNotFoundError:
-        message = 'File %s not found' % well_lookup_file
-        errorMessage(message)
-    except PermissionError:
-        message = 'No permission to access file %s' % well_lookup_file
-        errorMessage(message)
-    except Exception as e:
-        message = 'An error occurred: %s' % e
-        errorMessage(message)
-
-    # Error
-    #
-    if len(jsonD) < 1:
-        message = 'No well construction definitions loaded from file %s' % well_lookup_file
-        errorMessage(message)
-
-    return sealD, csngD, openD, geohD
-
-# =============================================================================
-
-def processNwisFile (nwisFile, site_no):
-
-    keyColumn = 'site_no'
-    siteInfoL   = []
-    siteFlag    = False
-
-    # Create a CSV reader object and remove comment header lines
-    #
-    try:
-        with open(nwisFile, "r") as fh:
-            csv_reader = csv.DictReader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
-
-            # Loop through file
-            #
-            for tempD in csv_reader:
-
-                # Check for sites with no valid location
-                #
-                if tempD[keyColumn] == site_no:
-                    screen_logger.info(tempD)
-                        
-                    # Set empty value to None
-                    #
-                    for key, value in tempD.items():
-                        if len(value) < 1:
-                            tempD[key] = None
-
-                    siteInfoL.append(tempD)
-                    siteFlag = True
-
-                else:
-                    if siteFlag:
-                        break
-                    
-    except FileNotFoundError:
-        message = 'File %s not found' % nwisFile
-        errorMessage(message)
-    except PermissionError:
-        message = 'No permission to access file %s' % nwisFile
-        errorMessage(message)
-    except Exception as e:
-        message = 'An error occurred: %s' % e
-        errorMessage(message)
-
-    return siteInfoL
-
 # =============================================================================
 
 # ----------------------------------------------------------------------
 # -- Main program
 # ----------------------------------------------------------------------
-well_lookup_file = "data/well_construction_lookup.json"
-aqfr_lookup_file = "data/codes/aqfr_cd_query.txt"
-
-# Read
+# Time the request phases when WELL_TIMING is set
 #
-if os.path.exists(well_lookup_file):
+wellTiming.startRequest('geohydrology', site_no, interpreter=True)
 
-    sealDefs, csngDefs, openDefs, geohDefs = jsonDefinitions(well_lookup_file)
+validatorsD = usgsWellData.responseValidators('geohydrology', site_no, params.get('sections'))
+headersL    = usgsWellData.validatorHeaders(validatorsD)
 
-else:
-    message = "Can not open well definitions file %s" % well_lookup_file
-    errorMessage(message)
-
-# Read
+# Answer a revalidation without reading any table
 #
-if os.path.exists(aqfr_lookup_file):
-
-    # Open file
-    #
-    aqfrInfoD = processAqfrCodes(aqfr_lookup_file)
-
-else:
-    message = "Can not open NWIS aquifer definitions file %s" % aqfr_lookup_file
-    errorMessage(message)
+if usgsWellData.notModified(validatorsD,
+                            os.environ.get('HTTP_IF_NONE_MATCH'),
+                            os.environ.get('HTTP_IF_MODIFIED_SINCE')):
+    timingD = wellTiming.finishRequest('304')
+    if timingD is not None:
+        headersL.append(('Server-Timing', timingD['server_timing']))
+    print("Status: 304 Not Modified")
+    for header, value in headersL:
+        print('%s: %s' % (header, value))
+    print("")
+    sys.exit()
 
-# Read
-#
-nwis_file = os.path.join("data", "gw_geoh_01.txt")
-if os.path.exists(nwis_file):
+output = None
 
-    # Open file
+try:
+    # Pre-rendered response when the cache is current
     #
-    geohInfoD = processNwisFile(nwis_file, site_no)
+    with wellTiming.phase('pack'):
+        cached = nwisResponseCache.cachedResponse('geohydrology', site_no)
 
-else:
-    message = "NWIS file %s does not exist" % nwis_file
-    errorMessage(message)
-
-# Prepare geohydrology output
-# -------------------------------------------------
-#
-
-# Process geohydrology records
-#
-geohsL = []
-if len(geohInfoD) > 0:
-
-    for record in geohInfoD:
-        geoh             = True
-        geoh_seq_nu      = int(record['geoh_seq_nu'])
-        lith_cd          = record['lith_cd']
-        lith_top_va      = record['lith_top_va']
-        lith_bottom_va   = record['lith_bottom_va']
-        lith_unit_cd     = record['lith_unit_cd']
-        lith_ds          = record['lith_ds']
-
-        # Valid record
-        #
-        if lith_cd is None:
-            continue
+    if cached is not None:
+        jsonOutput = cached
 
-        try:
-            lith_top_va = float(record['lith_top_va'])
-        except:
-            lith_top_va = None
-        try:
-            lith_bottom_va = float(record['lith_bottom_va'])
-        except:
-            lith_bottom_va = None
+    else:
+        with wellTiming.phase('definitions'):
+            definitionsD = usgsWellData.loadDefinitions()
+        with wellTiming.phase('aquifers'):
+            aqfrInfoD = usgsWellData.loadAquifers()
+        output       = usgsWellData.geohydrologyOutput(site_no, definitionsD, aqfrInfoD)
 
-        # Valid record
-        #
-        recordD                   = {}
-        recordD['geoh_seq_nu']    = geoh_seq_nu
-        recordD['lith_top_va']    = lith_top_va
-        recordD['lith_bottom_va'] = lith_bottom_va
-        recordD['lith_cd']        = lith_cd
-        recordD['lith_unit_cd']   = lith_unit_cd
-        if lith_cd is not None:
-            recordD['lith_ds'] = geohDefs[lith_cd]
-        if lith_unit_cd is not None :
-            recordD['lith_unit_ds'] = aqfrInfoD[lith_unit_cd]
+except usgsWellData.WellDataError as e:
+    errorMessage(str(e))
 
-        geohsL.append(recordD)
-
-# Output json
+# Output json; documents read from the tables are written to the output
+#  record by record, or rendered first when Server-Timing reports them
 # -------------------------------------------------
 #
-cnsL  = []
-jsonL = []
-
-jsonL.append("{")
-
-if len(geohsL) > 0:
-    GeolL = []
-    for myRecord in geohsL:
-        GeolL.append(json.dumps(myRecord))
-    cnsL.append('"gw_geoh":' + '[' + ",".join(GeolL) + ']')
-
-jsonL.append(",".join(cnsL))
+if output is not None and wellTiming.active() is not None:
+    jsonOutput = usgsWellData.renderJson(output)
+    output     = None
 
-jsonL.append('}')
+timingD = wellTiming.finishRequest('200')
+if timingD is not None:
+    headersL.append(('Server-Timing', timingD['server_timing']))
 
-# Output json
-# -------------------------------------------------
-#
-print("Content-type:application/json\n\n")
-print("".join(jsonL))
+print("Content-type:application/json")
+for header, value in headersL:
+    print('%s: %s' % (header, value))
+print("\n")
+if output is None:
+    print(jsonOutput)
+else:
+    output(sys.stdout.write)
+    print("")
 
 sys.exit()
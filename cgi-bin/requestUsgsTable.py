@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: requestUsgsTable.py
+#
+# Project:  wellConstruction
+# Purpose:  Script outputs the rows of any registered NWIS table (see
+#            nwisRegistry.py) for a site in JSON format, with code columns
+#            joined to their descriptions. The optional tables argument
+#            (gw_repr, gw_netw, ...) limits the document to the listed
+#            tables.
+# 
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os, sys
+
+import usgsWellData
+
+import wellTiming
+
+import nwisRegistry
+
+# Parse the Query String
+#
+params = {}
+
+HardWired = None
+#HardWired = 1
+
+if HardWired is not None:
+    #os.environ['QUERY_STRING'] = 'site_no=413640121124301&tables=gw_netw,gw_coop'
+    #os.environ['QUERY_STRING'] = 'site_no=420312121263001&tables=gw_otdt'
+    os.environ['QUERY_STRING'] = 'site_no=434400121275801&tables=gw_repr'
+
+if 'QUERY_STRING' in os.environ:
+    params = usgsWellData.queryParameters(os.environ['QUERY_STRING'])
+
+if 'site_no' in params:
+    site_no = params['site_no']
+else:
+    message = "Requires a NWIS site number"
+    print("Content-type:application/json\n\n")
+    print(usgsWellData.messageJson(message))
+    sys.exit()
+    
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+debug           = False
+
+program         = "USGS NWIS Table Script"
+version         = "1.00"
+version_date    = "18October2026"
+
+program_args    = []
+
+# =============================================================================
+def errorMessage(error_message):
+
+    usgsWellData.screenLogger().info(error_message)
+    timingD = wellTiming.finishRequest('error')
+    print("Content-type:application/json")
+    if timingD is not None:
+        print('Server-Timing: %s' % timingD['server_timing'])
+    print("\n")
+    print(usgsWellData.messageJson(error_message))
+    sys.exit()
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+# Time the request phases when WELL_TIMING is set
+#
+wellTiming.startRequest('table', site_no, interpreter=True)
+
+validatorsD = usgsWellData.responseValidators('table', site_no, params.get('tables'))
+headersL    = usgsWellData.validatorHeaders(validatorsD)
+
+# Answer a revalidation without reading any table
+#
+if usgsWellData.notModified(validatorsD,
+                            os.environ.get('HTTP_IF_NONE_MATCH'),
+                            os.environ.get('HTTP_IF_MODIFIED_SINCE')):
+    timingD = wellTiming.finishRequest('304')
+    if timingD is not None:
+        headersL.append(('Server-Timing', timingD['server_timing']))
+    print("Status: 304 Not Modified")
+    for header, value in headersL:
+        print('%s: %s' % (header, value))
+    print("")
+    sys.exit()
+
+output = None
+
+try:
+    table_nmL    = usgsWellData.registryTables(params.get('tables'))
+    with wellTiming.phase('definitions'):
+        definitionsD = usgsWellData.loadDefinitions()
+
+    # Aquifer names are only needed for tables joining aquifer codes
+    #
+    aqfrInfoD    = None
+    if nwisRegistry.needsAquifers(table_nmL):
+        with wellTiming.phase('aquifers'):
+            aqfrInfoD = usgsWellData.loadAquifers()
+
+    output       = usgsWellData.tablesOutput(site_no, table_nmL, definitionsD, aqfrInfoD)
+
+except usgsWellData.WellDataError as e:
+    errorMessage(str(e))
+
+# Output json; documents read from the tables are written to the output
+#  record by record, or rendered first when Server-Timing reports them
+# -------------------------------------------------
+#
+if output is not None and wellTiming.active() is not None:
+    jsonOutput = usgsWellData.renderJson(output)
+    output     = None
+
+timingD = wellTiming.finishRequest('200')
+if timingD is not None:
+    headersL.append(('Server-Timing', timingD['server_timing']))
+
+print("Content-type:application/json")
+for header, value in headersL:
+    print('%s: %s' % (header, value))
+print("\n")
+if output is None:
+    print(jsonOutput)
+else:
+    output(sys.stdout.write)
+    print("")
+
+sys.exit()
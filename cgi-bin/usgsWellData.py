@@ -0,0 +1,1103 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: usgsWellData.py
+#
+# Project:  wellConstruction
+# Purpose:  Module builds the well construction and geohydrology JSON
+#            documents from NWIS data records for the CGI scripts and the
+#            persistent web service.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os, sys, re
+
+import time
+
+import threading
+
+import json
+
+import hashlib
+
+import nwisTables
+
+import nwisSchema
+
+import nwisRegistry
+
+import nwisAquifers
+
+import wellTiming
+
+# Import modules for query string handling
+#
+from urllib.parse import parse_qs
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+data_dir         = os.environ.get('WELL_DATA_DIR',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+well_lookup_file = os.path.join(data_dir, "well_construction_lookup.json")
+definitions_file = os.path.join(data_dir, "well_construction_lookup.codes")
+aqfr_lookup_file = os.path.join(data_dir, "aqfr_cd_query.txt")
+
+construction_tablesL = ['gw_cons', 'gw_hole', 'gw_csng', 'gw_open']
+geohydrology_tablesL = ['gw_geoh']
+well_sectionsL       = ['well_construction', 'gw_geoh']
+definition_codesL    = nwisRegistry.definitionCodes()
+
+# Columns read from each registered table (see nwisRegistry.py)
+#
+table_columnsD = dict([(table_nm, nwisRegistry.projectedColumns(table_nm)) for table_nm in nwisRegistry.registeredTables()])
+
+# Code columns the construction and lithology records name through the
+#  definitions, with the columns a record needs for its code to be shown
+#
+code_joinsL    = [
+    ('gw_cons', 'seal_cd',          []),
+    ('gw_csng', 'csng_material_cd', ['csng_top_va', 'csng_bottom_va', 'csng_dia_va']),
+    ('gw_open', 'open_cd',          ['open_top_va', 'open_bottom_va', 'open_dia_va']),
+    ('gw_geoh', 'lith_cd',          [])
+]
+max_batch_sites      = 1000
+cache_max_age        = int(os.environ.get('WELL_CACHE_MAX_AGE', 3600))
+state_cd             = os.environ.get('NWIS_STATE_CD', '41')
+
+# One encoder, configured as json.dumps is by default, writes every record
+#
+recordEncoder        = json.JSONEncoder()
+
+# Tables of a request read concurrently by this many threads; 1 keeps the
+#  sequential reads for single-core hosts
+#
+table_threads        = int(os.environ.get('WELL_TABLE_THREADS', 1))
+table_executor       = None
+table_executor_lock  = threading.Lock()
+
+# =============================================================================
+class WellDataError(Exception):
+
+    pass
+
+# =============================================================================
+class JsonBuffer:
+
+    # Fragments written are joined into chunks of about chunk_chars so a
+    #  large response is held as a few strings and copied once at the end
+    #
+    chunk_chars = 8192
+
+    # ----------------------------------------------------------------------
+    def __init__ (self):
+
+        self.chunksL = []
+        self.partsL  = []
+        self.size    = 0
+
+    # ----------------------------------------------------------------------
+    def write (self, text):
+
+        self.partsL.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_chars:
+            self.chunksL.append(''.join(self.partsL))
+            self.partsL = []
+            self.size   = 0
+
+    # ----------------------------------------------------------------------
+    def getvalue (self):
+
+        return ''.join(self.chunksL + [''.join(self.partsL)])
+
+# =============================================================================
+def screenLogger ():
+
+    # Logging is imported on first use so requests that never log do not
+    #  pay for it; a process without a handler gets the console handler the
+    #  CGI scripts always set up
+    #
+    import logging
+
+    screen_logger = logging.getLogger()
+    if len(screen_logger.handlers) < 1:
+        formatter = logging.Formatter(fmt='%(message)s')
+        console   = logging.StreamHandler()
+        console.setFormatter(formatter)
+        screen_logger.addHandler(console)
+        screen_logger.setLevel(logging.INFO)
+
+    return screen_logger
+
+# =============================================================================
+def nwisFileName (table_nm):
+
+    return os.path.join(data_dir, "".join([table_nm, "_01.txt"]))
+
+# =============================================================================
+def queryParameters (queryString):
+
+    params = {}
+
+    queryStringD = parse_qs(queryString, encoding='utf-8')
+
+    myParmsL = [
+        'site_no',
+        'sections',
+        'tables'
+    ]
+
+    for myParm in myParmsL:
+        myItems = re.escape(queryStringD.get(myParm, [''])[0]).split(',')
+        if len(myItems) > 1:
+            params[myParm] = re.escape(queryStringD.get(myParm, [''])[0])
+        else:
+            params[myParm] = re.escape(myItems[0])
+
+    # Well ids of other agencies are only looked up and keep their blanks;
+    #  depth ranges, filter codes, paging and the export options are parsed
+    #  by their endpoint
+    #
+    for myParm in ['coop_site_no', 'otid_id', 'offset', 'limit', 'format', 'netw_cd', 'gzip'] + nwisRegistry.filterParameters():
+        if myParm in queryStringD:
+            params[myParm] = queryStringD[myParm][0]
+
+    return params
+
+# =============================================================================
+def messageJson (message):
+
+    return '{ "message": "%s" }' % message
+
+# =============================================================================
+def jsonDefinitions (well_lookup_file, code_nmL=None):
+
+    jsonD        = {}
+    definitionsD = {}
+
+    if code_nmL is None:
+        code_nmL = definition_codesL
+
+    # Read json file
+    #
+    try:
+        with open(well_lookup_file, "r") as fh:
+            jsonD = json.load(fh)
+            for code_nm in code_nmL:
+                definitionsD[code_nm] = jsonD[code_nm]['Codes']
+    except FileNotFoundError:
+        message = 'File %s not found' % well_lookup_file
+        raise WellDataError(message)
+    except PermissionError:
+        message = 'No permission to access file %s' % well_lookup_file
+        raise WellDataError(message)
+    except Exception as e:
+        message = 'An error occurred: %s' % e
+        raise WellDataError(message)
+
+    # Error
+    #
+    if len(jsonD) < 1:
+        message = 'No well construction definitions loaded from file %s' % well_lookup_file
+        raise WellDataError(message)
+
+    return definitionsD
+
+# =============================================================================
+def processAqfrCodes (aqfr_lookup_file, state_cd=None):
+
+    import csv
+
+    aqfrInfoD   = {}
+    stateD      = {}
+    nationalD   = {}
+
+    # Create a CSV reader object and remove comment header lines
+    #
+    try:
+        with open(aqfr_lookup_file, "r") as fh:
+            csv_reader = csv.DictReader(filter(lambda row: row[0]!='#', fh), delimiter='\t')
+            for tempD in csv_reader:
+                aqfr_cd = tempD['aqfr_cd']
+                aqfr_nm = tempD['aqfr_nm']
+
+                aqfrInfoD[aqfr_cd] = aqfr_nm
+
+                # Names of the site state, then national names, win over
+                #  the same code used by other states
+                #
+                if tempD['state_cd'] == state_cd:
+                    stateD[aqfr_cd] = aqfr_nm
+                elif tempD['state_cd'] == nwisAquifers.nationalState:
+                    nationalD[aqfr_cd] = aqfr_nm
+
+    except FileNotFoundError:
+        message = 'File %s not found' % aqfr_lookup_file
+        raise WellDataError(message)
+    except PermissionError:
+        message = 'No permission to access file %s' % aqfr_lookup_file
+        raise WellDataError(message)
+    except Exception as e:
+        message = 'An error occurred: %s' % e
+        raise WellDataError(message)
+
+    # Error
+    #
+    if len(aqfrInfoD) < 1:
+        message = 'No aquifer definitions loaded from file %s' % aqfr_lookup_file
+        raise WellDataError(message)
+
+    aqfrInfoD.update(nationalD)
+    aqfrInfoD.update(stateD)
+
+    return aqfrInfoD
+
+# =============================================================================
+def processNwisFile (nwisFile, site_no, columnsL=None):
+
+    siteInfoL   = []
+
+    # Seek straight to the site rows of the table; projected columns are
+    #  returned as typed records
+    #
+    try:
+        decoder   = nwisSchema.rowDecoder(nwisFile, columnsL) if columnsL is not None else None
+        siteInfoL = nwisTables.lookupSiteRows(nwisFile, site_no, decoder=decoder)
+
+    except FileNotFoundError:
+        message = 'File %s not found' % nwisFile
+        raise WellDataError(message)
+    except PermissionError:
+        message = 'No permission to access file %s' % nwisFile
+        raise WellDataError(message)
+    except Exception as e:
+        message = 'An error occurred: %s' % e
+        raise WellDataError(message)
+
+    return siteInfoL
+
+# =============================================================================
+def compiledDefinitions ():
+
+    import marshal
+
+    stampL = nwisTables.sourceStamp(well_lookup_file)
+
+    # Code tables marshalled from the lookup file while it is unchanged
+    #
+    try:
+        with open(definitions_file, "rb") as fh:
+            compiledD = marshal.load(fh)
+        if compiledD['stamp'] == stampL and sorted(compiledD['codes']) == sorted(definition_codesL):
+            return compiledD['codes']
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    definitionsD = jsonDefinitions(well_lookup_file)
+
+    # Keep only the code tables the registered tables join for the next
+    #  request; a read-only data directory keeps reading the JSON
+    #
+    temp_file = '%s.%d.tmp' % (definitions_file, os.getpid())
+    try:
+        with open(temp_file, "wb") as fh:
+            marshal.dump({'stamp': stampL, 'codes': definitionsD}, fh)
+        os.replace(temp_file, definitions_file)
+    except OSError:
+        pass
+
+    return definitionsD
+
+# =============================================================================
+def loadDefinitions ():
+
+    if not os.path.exists(well_lookup_file):
+        message = "Can not open well definitions file %s" % well_lookup_file
+        raise WellDataError(message)
+
+    # Code tables from the SQLite database when it is the lookup backend
+    #
+    if nwisTables.lookupMode == 'sqlite':
+        import nwisSqlite
+        definitionsD = dict([(code_nm, nwisSqlite.sqliteCodes(code_nm)) for code_nm in definition_codesL])
+        if None not in definitionsD.values():
+            return definitionsD
+
+    return compiledDefinitions()
+
+# =============================================================================
+def loadAquifers ():
+
+    # Aquifer names resolved through the indexed SQLite table on demand
+    #
+    if nwisTables.lookupMode == 'sqlite':
+        import nwisSqlite
+        aqfrInfoD = nwisSqlite.sqliteAquifers(state_cd)
+        if aqfrInfoD is not None:
+            return aqfrInfoD
+
+    if not os.path.exists(aqfr_lookup_file):
+        message = "Can not open NWIS aquifer definitions file %s" % aqfr_lookup_file
+        raise WellDataError(message)
+
+    # Partition of the configured state from the compiled code table
+    #
+    aqfrInfoD = nwisAquifers.stateAquifers(aqfr_lookup_file, state_cd)
+    if aqfrInfoD is not None:
+        return aqfrInfoD
+
+    return processAqfrCodes(aqfr_lookup_file, state_cd)
+
+# =============================================================================
+def tableExecutor ():
+
+    global table_executor
+
+    # Pool shared by the requests of this process, started on first use
+    #
+    with table_executor_lock:
+        if table_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            table_executor = ThreadPoolExecutor(max_workers=table_threads, thread_name_prefix='nwis-table')
+
+    return table_executor
+
+# =============================================================================
+def resetTableExecutor ():
+
+    global table_executor, table_executor_lock
+
+    # Pool threads do not survive a fork (prefork workers)
+    #
+    table_executor      = None
+    table_executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=resetTableExecutor)
+
+# =============================================================================
+def tableResults (reader, table_nmL, sites):
+
+    # Tables are read one after another unless a pool is configured; the
+    #  results and the first error are taken in table order either way
+    #
+    if table_threads < 2 or len(table_nmL) < 2:
+        return [reader(table_nm, sites) for table_nm in table_nmL]
+
+    timer    = wellTiming.active()
+    futuresL = [tableExecutor().submit(wellTiming.runWith, timer, reader, table_nm, sites) for table_nm in table_nmL]
+
+    return [future.result() for future in futuresL]
+
+# =============================================================================
+def readTable (table_nm, site_no):
+
+    nwis_file = nwisFileName(table_nm)
+    if not os.path.exists(nwis_file):
+        message = "NWIS file %s does not exist" % nwis_file
+        raise WellDataError(message)
+
+    with wellTiming.phase(table_nm):
+        rowsL = processNwisFile(nwis_file, site_no, table_columnsD.get(table_nm))
+    wellTiming.rows(table_nm, len(rowsL))
+
+    return rowsL
+
+# =============================================================================
+def readTables (table_nmL, site_no):
+
+    return dict(zip(table_nmL, tableResults(readTable, table_nmL, site_no)))
+
+# =============================================================================
+def siteNumbers (site_no):
+
+    # Requested sites in request order without duplicates
+    #
+    siteL = []
+    for site in site_no.split(','):
+        site = site.strip()
+        if len(site) > 0 and site not in siteL:
+            siteL.append(site)
+
+    if len(siteL) > max_batch_sites:
+        message = "Requests are limited to %d NWIS site numbers" % max_batch_sites
+        raise WellDataError(message)
+
+    return siteL
+
+# =============================================================================
+def processNwisBatch (nwisFile, siteL, columnsL=None):
+
+    sitesD   = {}
+
+    # Answer every site with one pass over the sorted table
+    #
+    try:
+        decoder = nwisSchema.rowDecoder(nwisFile, columnsL) if columnsL is not None else None
+        sitesD  = nwisTables.lookupBatchRows(nwisFile, siteL, decoder=decoder)
+
+    except FileNotFoundError:
+        message = 'File %s not found' % nwisFile
+        raise WellDataError(message)
+    except PermissionError:
+        message = 'No permission to access file %s' % nwisFile
+        raise WellDataError(message)
+    except Exception as e:
+        message = 'An error occurred: %s' % e
+        raise WellDataError(message)
+
+    return sitesD
+
+# =============================================================================
+def readBatchTable (table_nm, siteL):
+
+    nwis_file = nwisFileName(table_nm)
+    if not os.path.exists(nwis_file):
+        message = "NWIS file %s does not exist" % nwis_file
+        raise WellDataError(message)
+
+    with wellTiming.phase(table_nm):
+        sitesD = processNwisBatch(nwis_file, siteL, table_columnsD.get(table_nm))
+    if wellTiming.active() is not None:
+        wellTiming.rows(table_nm, sum([len(rowsL) for rowsL in sitesD.values()]))
+
+    return sitesD
+
+# =============================================================================
+def readBatchTables (table_nmL, siteL):
+
+    batchD = dict([(site, {}) for site in siteL])
+
+    for table_nm, sitesD in zip(table_nmL, tableResults(readBatchTable, table_nmL, siteL)):
+        for site in siteL:
+            batchD[site][table_nm] = sitesD.get(site, [])
+
+    return batchD
+
+# =============================================================================
+def codeName (codesD, code_nm, code):
+
+    # A code missing from its definitions is a data error, reported like an
+    #  aquifer code without a name
+    #
+    try:
+        return codesD[code]
+    except KeyError:
+        message = 'No description for %s %s' % (code_nm, code)
+        raise WellDataError(message)
+
+# =============================================================================
+def sealRecords (consInfoD, sealDefs):
+
+    sealsL = []
+
+    for record in consInfoD:
+        seal_cd          = record.seal_cd
+
+        # Valid record
+        #
+        recordD                  = {}
+        recordD['cons_seq_nu']   = record.cons_seq_nu
+        recordD['seal_depth_va'] = record.seal_depth_va
+        recordD['seal_ds']       = None
+        if seal_cd is not None:
+            recordD['seal_ds'] = codeName(sealDefs, 'seal_cd', seal_cd)
+
+        sealsL.append(recordD)
+
+    return sealsL
+
+# =============================================================================
+def holeRecords (holeInfoD):
+
+    holesL = []
+
+    for record in holeInfoD:
+        hole_top_va      = record.hole_top_va
+        hole_bottom_va   = record.hole_bottom_va
+        hole_dia_va      = record.hole_dia_va
+
+        # Valid record
+        #
+        if None not in (hole_top_va, hole_bottom_va, hole_dia_va):
+            recordD                   = {}
+            recordD['cons_seq_nu']    = record.cons_seq_nu
+            recordD['hole_seq_nu']    = record.hole_seq_nu
+            recordD['hole_top_va']    = hole_top_va
+            recordD['hole_bottom_va'] = hole_bottom_va
+            recordD['hole_dia_va']    = hole_dia_va
+
+            holesL.append(recordD)
+
+    return holesL
+
+# =============================================================================
+def casingRecords (csngInfoD, csngDefs):
+
+    csngsL = []
+
+    for record in csngInfoD:
+        csng_top_va      = record.csng_top_va
+        csng_bottom_va   = record.csng_bottom_va
+        csng_dia_va      = record.csng_dia_va
+        csng_material_cd = record.csng_material_cd
+
+        # Valid record
+        #
+        if None not in (csng_top_va, csng_bottom_va, csng_dia_va):
+
+            recordD                     = {}
+            recordD['cons_seq_nu']      = record.cons_seq_nu
+            recordD['csng_seq_nu']      = record.csng_seq_nu
+            recordD['csng_top_va']      = csng_top_va
+            recordD['csng_bottom_va']   = csng_bottom_va
+            recordD['csng_dia_va']      = csng_dia_va
+            recordD['csng_material_cd'] = csng_material_cd
+            recordD['csng_material_ds'] = None
+            recordD['csng_material_cl'] = None
+            if csng_material_cd is not None:
+                recordD['csng_material_ds'] = codeName(csngDefs, 'csng_material_cd', csng_material_cd)
+
+            csngsL.append(recordD)
+
+    return csngsL
+
+# =============================================================================
+def openRecords (openInfoD, openDefs):
+
+    opensL = []
+
+    for record in openInfoD:
+        open_top_va      = record.open_top_va
+        open_bottom_va   = record.open_bottom_va
+        open_dia_va      = record.open_dia_va
+        open_cd          = record.open_cd
+
+        # Valid record
+        #
+        if None not in (open_top_va, open_bottom_va, open_dia_va):
+
+            recordD                     = {}
+            recordD['cons_seq_nu']      = record.cons_seq_nu
+            recordD['open_seq_nu']      = record.open_seq_nu
+            recordD['open_top_va']      = open_top_va
+            recordD['open_bottom_va']   = open_bottom_va
+            recordD['open_dia_va']      = open_dia_va
+            recordD['open_cd']          = open_cd
+            recordD['open_ds']          = None
+            if open_cd is not None:
+                recordD['open_ds'] = codeName(openDefs, 'open_cd', open_cd)
+
+            opensL.append(recordD)
+
+    return opensL
+
+# =============================================================================
+def aquiferName (aqfrInfoD, lith_unit_cd):
+
+    # Aquifer names may be resolved on first use, so a code is looked up by
+    #  index and a code without a name reported as a data error
+    #
+    try:
+        return aqfrInfoD[lith_unit_cd]
+    except KeyError:
+        message = 'No aquifer name for lith_unit_cd %s' % lith_unit_cd
+        raise WellDataError(message)
+
+# =============================================================================
+def checkCodes (tablesD, definitionsD, aqfrInfoD=None):
+
+    # Every code the records above join is looked up before a document is
+    #  written, for the records that show it
+    #
+    for table_nm, code_nm, requiredL in code_joinsL:
+        for record in tablesD.get(table_nm, []):
+            code = getattr(record, code_nm)
+            if code is not None and None not in [getattr(record, column) for column in requiredL]:
+                codeName(definitionsD[code_nm], code_nm, code)
+
+    if aqfrInfoD is not None:
+        for record in tablesD.get('gw_geoh', []):
+            if record.lith_cd is not None and record.lith_unit_cd is not None:
+                aquiferName(aqfrInfoD, record.lith_unit_cd)
+
+# =============================================================================
+def geohRecords (geohInfoD, geohDefs, aqfrInfoD):
+
+    geohsL = []
+
+    # Raw records are only dumped when debug logging has been configured
+    #
+    logging     = sys.modules.get('logging')
+    debugLogger = None
+    if logging is not None and logging.getLogger().isEnabledFor(logging.DEBUG):
+        debugLogger = logging.getLogger()
+
+    for record in geohInfoD:
+        if debugLogger is not None:
+            debugLogger.debug(record)
+
+        lith_cd          = record.lith_cd
+        lith_unit_cd     = record.lith_unit_cd
+
+        # Valid record
+        #
+        if lith_cd is None:
+            continue
+
+        recordD                   = {}
+        recordD['geoh_seq_nu']    = record.geoh_seq_nu
+        recordD['lith_top_va']    = record.lith_top_va
+        recordD['lith_bottom_va'] = record.lith_bottom_va
+        recordD['lith_cd']        = lith_cd
+        recordD['lith_unit_cd']   = lith_unit_cd
+        recordD['lith_ds']        = codeName(geohDefs, 'lith_cd', lith_cd)
+        if lith_unit_cd is not None :
+            recordD['lith_unit_ds'] = aquiferName(aqfrInfoD, lith_unit_cd)
+
+        geohsL.append(recordD)
+
+    return geohsL
+
+# =============================================================================
+def writeArray (write, table_nm, recordsL, separator=''):
+
+    # Each record is encoded by the shared encoder and written as it comes;
+    #  a table without records writes nothing
+    #
+    if len(recordsL) < 1:
+        return False
+
+    encode = recordEncoder.encode
+
+    write('%s"%s":[%s' % (separator, table_nm, encode(recordsL[0])))
+    for recordD in recordsL[1:]:
+        write(',' + encode(recordD))
+    write(']')
+
+    return True
+
+# =============================================================================
+def writeConstructionMember (write, tablesD, definitionsD):
+
+    # Prepare and write output table by table
+    # -------------------------------------------------
+    #
+    write('"well_construction":{')
+
+    separator = ''
+    if writeArray(write, 'gw_cons', sealRecords(tablesD['gw_cons'], definitionsD['seal_cd']), separator):
+        separator = ','
+    if writeArray(write, 'gw_hole', holeRecords(tablesD['gw_hole']), separator):
+        separator = ','
+    if writeArray(write, 'gw_csng', casingRecords(tablesD['gw_csng'], definitionsD['csng_material_cd']), separator):
+        separator = ','
+    writeArray(write, 'gw_open', openRecords(tablesD['gw_open'], definitionsD['open_cd']), separator)
+
+    write('}')
+
+# =============================================================================
+def writeGeohydrologyMember (write, tablesD, definitionsD, aqfrInfoD, separator=''):
+
+    # Prepare geohydrology output; the member is left out when the site has
+    #  no lithology
+    # -------------------------------------------------
+    #
+    return writeArray(write, 'gw_geoh', geohRecords(tablesD['gw_geoh'], definitionsD['lith_cd'], aqfrInfoD), separator)
+
+# =============================================================================
+def writeSiteDocuments (write, siteL, tablesD, writeDocument):
+
+    with wellTiming.phase('render'):
+
+        # A single site writes its document as is
+        #
+        if siteL is None:
+            writeDocument(write, tablesD)
+            return
+
+        # Several sites write one document per site keyed by site_no
+        #
+        write('{')
+        separator = ''
+        for site in siteL:
+            write('%s"%s":' % (separator, site))
+            writeDocument(write, tablesD[site])
+            separator = ','
+        write('}')
+
+# =============================================================================
+def siteOutput (site_no, table_nmL, writeDocument, checkTables=None):
+
+    # The tables are read and checked here, so a read error or a code
+    #  without a name is raised before anything is written; the function
+    #  returned writes the documents
+    #
+    if ',' not in site_no:
+        siteL   = None
+        tablesD = readTables(table_nmL, site_no)
+        sitesL  = [tablesD]
+    else:
+        siteL   = siteNumbers(site_no)
+        tablesD = readBatchTables(table_nmL, siteL)
+        sitesL  = [tablesD[site] for site in siteL]
+
+    if checkTables is not None:
+        for siteTablesD in sitesL:
+            checkTables(siteTablesD)
+
+    return lambda write: writeSiteDocuments(write, siteL, tablesD, writeDocument)
+
+# =============================================================================
+def renderJson (output):
+
+    # Documents written to one buffer and returned as a single string
+    #
+    buffer = JsonBuffer()
+    output(buffer.write)
+
+    return buffer.getvalue()
+
+# =============================================================================
+def writeConstructionDocument (write, tablesD, definitionsD):
+
+    write('{')
+    writeConstructionMember(write, tablesD, definitionsD)
+    write('}')
+
+# =============================================================================
+def writeGeohydrologyDocument (write, tablesD, definitionsD, aqfrInfoD):
+
+    write('{')
+    writeGeohydrologyMember(write, tablesD, definitionsD, aqfrInfoD)
+    write('}')
+
+# =============================================================================
+def writeWellDocument (write, tablesD, sectionsL, definitionsD, aqfrInfoD, message=None):
+
+    # Merge the construction and geohydrology documents; a message tells
+    #  why a section asked for is missing
+    #
+    write('{')
+    separator = ''
+    if 'well_construction' in sectionsL:
+        writeConstructionMember(write, tablesD, definitionsD)
+        separator = ','
+    if 'gw_geoh' in sectionsL:
+        if writeGeohydrologyMember(write, tablesD, definitionsD, aqfrInfoD, separator):
+            separator = ','
+    if message is not None:
+        write('%s"message":%s' % (separator, json.dumps(message)))
+    write('}')
+
+# =============================================================================
+def constructionDocument (tablesD, definitionsD):
+
+    return renderJson(lambda write: writeConstructionDocument(write, tablesD, definitionsD))
+
+# =============================================================================
+def geohydrologyDocument (tablesD, definitionsD, aqfrInfoD):
+
+    return renderJson(lambda write: writeGeohydrologyDocument(write, tablesD, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def wellDocument (tablesD, sectionsL, definitionsD, aqfrInfoD):
+
+    return renderJson(lambda write: writeWellDocument(write, tablesD, sectionsL, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def constructionOutput (site_no, definitionsD):
+
+    return siteOutput(site_no, construction_tablesL,
+                      lambda write, tablesD: writeConstructionDocument(write, tablesD, definitionsD),
+                      lambda tablesD: checkCodes(tablesD, definitionsD))
+
+# =============================================================================
+def geohydrologyOutput (site_no, definitionsD, aqfrInfoD):
+
+    return siteOutput(site_no, geohydrology_tablesL,
+                      lambda write, tablesD: writeGeohydrologyDocument(write, tablesD, definitionsD, aqfrInfoD),
+                      lambda tablesD: checkCodes(tablesD, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def constructionJson (site_no, definitionsD):
+
+    return renderJson(constructionOutput(site_no, definitionsD))
+
+# =============================================================================
+def geohydrologyJson (site_no, definitionsD, aqfrInfoD):
+
+    return renderJson(geohydrologyOutput(site_no, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def wellSections (sections):
+
+    # Empty selection returns every section
+    #
+    if sections is None or len(sections) < 1:
+        return list(well_sectionsL)
+
+    sectionsL = []
+    for section in sections.split(','):
+        if section not in well_sectionsL:
+            message = "Unknown section %s; choose from %s" % (section, ", ".join(well_sectionsL))
+            raise WellDataError(message)
+        if section not in sectionsL:
+            sectionsL.append(section)
+
+    return sectionsL
+
+# =============================================================================
+def sectionTables (sectionsL):
+
+    table_nmL = []
+    if 'well_construction' in sectionsL:
+        table_nmL.extend(construction_tablesL)
+    if 'gw_geoh' in sectionsL:
+        table_nmL.extend(geohydrology_tablesL)
+
+    return table_nmL
+
+# =============================================================================
+def wellAquifers (sectionsL, loader):
+
+    # Aquifer names for the lithology section. When they cannot be loaded
+    #  and construction was asked for too, the lithology section is left
+    #  out and its error returned, so the construction still goes out
+    #
+    if 'gw_geoh' not in sectionsL:
+        return sectionsL, None, None
+
+    try:
+        return sectionsL, loader(), None
+    except WellDataError as e:
+        if 'well_construction' not in sectionsL:
+            raise
+        screenLogger().info(str(e))
+        return [section for section in sectionsL if section != 'gw_geoh'], None, str(e)
+
+# =============================================================================
+def wellOutput (site_no, sectionsL, definitionsD, aqfrInfoD=None, message=None):
+
+    # Read every table the requested sections need in a single pass
+    #
+    return siteOutput(site_no, sectionTables(sectionsL),
+                      lambda write, tablesD: writeWellDocument(write, tablesD, sectionsL, definitionsD, aqfrInfoD, message),
+                      lambda tablesD: checkCodes(tablesD, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def wellJson (site_no, sectionsL, definitionsD, aqfrInfoD=None, message=None):
+
+    return renderJson(wellOutput(site_no, sectionsL, definitionsD, aqfrInfoD, message))
+
+# =============================================================================
+def registryTables (tables):
+
+    # Empty selection returns every registered table
+    #
+    if tables is None or len(tables) < 1:
+        return nwisRegistry.registeredTables()
+
+    table_nmL = []
+    for table_nm in tables.split(','):
+        if table_nm not in nwisRegistry.tableRegistryD:
+            message = "Unknown table %s; choose from %s" % (table_nm, ", ".join(nwisRegistry.registeredTables()))
+            raise WellDataError(message)
+        if table_nm not in table_nmL:
+            table_nmL.append(table_nm)
+
+    return table_nmL
+
+# =============================================================================
+def registryRecords (rowsL, table_nm, definitionsD, aqfrInfoD=None):
+
+    # Code table of each joined column, looked up once per table
+    #
+    joinsL = []
+    for column in table_columnsD[table_nm]:
+        code_nm = nwisRegistry.tableCodes(table_nm).get(column)
+        codesD  = None
+        if code_nm == nwisRegistry.aquiferCodes:
+            codesD = aqfrInfoD
+        elif code_nm is not None:
+            codesD = definitionsD[code_nm]
+        joinsL.append((column, nwisRegistry.descriptionColumn(column) if code_nm is not None else None, codesD))
+
+    recordsL = []
+
+    for record in rowsL:
+        recordD = {}
+        for column, description, codesD in joinsL:
+            value           = getattr(record, column)
+            recordD[column] = value
+            if description is not None:
+                recordD[description] = None
+
+                # Aquifer names may be resolved on first use (SQLite), so
+                #  codes are looked up by index rather than get()
+                #
+                if value is not None and codesD is not None:
+                    try:
+                        recordD[description] = codesD[value]
+                    except KeyError:
+                        pass
+
+        recordsL.append(recordD)
+
+    return recordsL
+
+# =============================================================================
+def writeTablesDocument (write, tablesD, table_nmL, definitionsD, aqfrInfoD=None):
+
+    # Tables without rows for the site are left out
+    #
+    write('{')
+    separator = ''
+    for table_nm in table_nmL:
+        if writeArray(write, table_nm, registryRecords(tablesD[table_nm], table_nm, definitionsD, aqfrInfoD), separator):
+            separator = ','
+    write('}')
+
+# =============================================================================
+def tablesDocument (tablesD, table_nmL, definitionsD, aqfrInfoD=None):
+
+    return renderJson(lambda write: writeTablesDocument(write, tablesD, table_nmL, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def tablesOutput (site_no, table_nmL, definitionsD, aqfrInfoD=None):
+
+    return siteOutput(site_no, table_nmL,
+                      lambda write, tablesD: writeTablesDocument(write, tablesD, table_nmL, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def tablesJson (site_no, table_nmL, definitionsD, aqfrInfoD=None):
+
+    return renderJson(tablesOutput(site_no, table_nmL, definitionsD, aqfrInfoD))
+
+# =============================================================================
+def dataSources ():
+
+    # Files every response is derived from
+    #
+    return [nwisFileName(table_nm) for table_nm in nwisRegistry.registeredTables()] + \
+           [well_lookup_file, aqfr_lookup_file]
+
+# =============================================================================
+def dataStamps (root=None):
+
+    stampsL = []
+    for source_file in dataSources():
+
+        # The same files under another directory (a staged data version)
+        #
+        if root is not None:
+            source_file = os.path.join(root, os.path.relpath(source_file, data_dir))
+
+        try:
+            statInfo = os.stat(source_file)
+            stampsL.append([os.path.basename(source_file), statInfo.st_size, statInfo.st_mtime_ns])
+        except OSError:
+            stampsL.append([os.path.basename(source_file), None, None])
+
+    return stampsL
+
+# =============================================================================
+def dataVersion (stampsL=None):
+
+    # Version of the data files; changes whenever an extract or lookup file
+    #  is replaced
+    #
+    if stampsL is None:
+        stampsL = dataStamps()
+
+    # The configured state changes the aquifer names of the responses
+    #
+    return hashlib.blake2b(json.dumps([stampsL, state_cd]).encode('utf-8'), digest_size=8).hexdigest()
+
+# =============================================================================
+def responseValidators (kind, site_no, sections='', stampsL=None):
+
+    # Responses only change with the data files, so the entity tag is
+    #  derived from the data version and the request instead of the body
+    #
+    if stampsL is None:
+        stampsL = dataStamps()
+
+    data_version = dataVersion(stampsL)
+    request      = '\t'.join([data_version, kind, site_no, sections or ''])
+    mtimesL      = [stampL[2] for stampL in stampsL if stampL[2] is not None]
+
+    return {
+        'version':  data_version,
+        'etag':     '"%s"' % hashlib.blake2b(request.encode('utf-8'), digest_size=16).hexdigest(),
+        'modified': max(mtimesL) // 1000000000 if len(mtimesL) > 0 else None
+    }
+
+# =============================================================================
+def httpDate (seconds):
+
+    # RFC 7231 date without importing email.utils or depending on the locale
+    #
+    t = time.gmtime(seconds)
+
+    return '%s, %02d %s %04d %02d:%02d:%02d GMT' % (['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'][t.tm_wday],
+                                                   t.tm_mday,
+                                                   ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                                    'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'][t.tm_mon - 1],
+                                                   t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+
+# =============================================================================
+def validatorHeaders (validatorsD, max_age=None):
+
+    if max_age is None:
+        max_age = cache_max_age
+
+    headersL = [('ETag', validatorsD['etag'])]
+    if validatorsD['modified'] is not None:
+        headersL.append(('Last-Modified', httpDate(validatorsD['modified'])))
+    headersL.append(('Cache-Control', 'public, max-age=%d' % max_age))
+
+    return headersL
+
+# =============================================================================
+def notModified (validatorsD, if_none_match=None, if_modified_since=None):
+
+    # If-None-Match takes precedence over If-Modified-Since
+    #
+    if if_none_match:
+        tagsL = [tag.strip() for tag in if_none_match.split(',')]
+        if '*' in tagsL:
+            return True
+        return validatorsD['etag'] in [tag[2:] if tag.startswith('W/') else tag for tag in tagsL]
+
+    if if_modified_since and validatorsD['modified'] is not None:
+        from email.utils import parsedate_to_datetime
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        return validatorsD['modified'] <= since
+
+    return False
@@ -0,0 +1,611 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellBenchmark.py
+#
+# Project:  wellConstruction
+# Purpose:  Benchmark the NWIS table lookups and the construction and
+#            geohydrology rendering across table positions, extract sizes
+#            and lookup modes.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# For every extract size the shipped tables are copied into a work directory
+#  with each site group repeated size times under new site numbers
+#  (422031121400001 -> 42203112140000107), so a 100x extract keeps the sort
+#  order and the shape of the real wells. Each size and lookup mode is then
+#  measured in its own process:
+#
+#    python wellBenchmark.py --sizes 1,10,100 --modes scan,index,bisect,snapshot
+#
+#  Sites are sampled at the head, middle and tail of every table. For each
+#  sample the table lookup alone (processNwisFile) and the whole request
+#  (all tables of the endpoint, record shaping and JSON assembly) are timed
+#  and reported as p50/p95/p99 latency. The report also holds the rows
+#  returned per second of lookup time, the peak RSS of the measuring
+#  process, the time to build the mode's artifacts, the first request of a
+#  fresh process (cold) and the CGI script run from interpreter start to
+#  its first byte of output and to exit. The report is written as JSON.
+#
+# With --render the heaviest wells of the shipped tables are rendered
+#  alone, 50 and 1,000 at a time: joined from per-record strings as the
+#  scripts once did, through the JSON writer into one string, and written
+#  straight to an output. Time and peak traced memory are reported for
+#  each, with the time and memory saved against the joined strings.
+#
+###############################################################################
+
+import os, sys
+
+import json
+
+import time
+
+import shutil
+
+import platform
+
+import subprocess
+
+import usgsWellData
+
+import nwisTables
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+program         = "USGS Well Lookup Benchmark"
+version         = "1.00"
+version_date    = "18October2026"
+
+script_dir      = os.path.dirname(os.path.abspath(__file__))
+work_dir        = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'well_benchmark')
+
+positionsL      = ['head', 'middle', 'tail']
+modesL          = ['scan', 'index', 'bisect', 'snapshot', 'sqlite', 'memory']
+
+# Endpoint each table is read for
+#
+endpointsD = {
+    'construction': ('requestUsgsConstruction.py', usgsWellData.construction_tablesL),
+    'geohydrology': ('requestUsgsGeohydrology.py', usgsWellData.geohydrology_tablesL)
+}
+
+# =============================================================================
+def tableEndpoint (table_nm):
+
+    for endpoint, (script, table_nmL) in endpointsD.items():
+        if table_nm in table_nmL:
+            return endpoint
+
+    return None
+
+# =============================================================================
+def percentiles (valuesL):
+
+    valuesL = sorted(valuesL)
+    if len(valuesL) < 1:
+        return {'count': 0}
+
+    # Nearest-rank percentiles in milliseconds
+    #
+    def rank (p):
+        return round(valuesL[max(0, int(len(valuesL) * p / 100.0 + 0.999999) - 1)] * 1000.0, 4)
+
+    return {
+        'count': len(valuesL),
+        'p50':   rank(50),
+        'p95':   rank(95),
+        'p99':   rank(99),
+        'max':   round(valuesL[-1] * 1000.0, 4)
+    }
+
+# =============================================================================
+def peakRss ():
+
+    import resource
+
+    # Kilobytes on Linux, bytes on macOS
+    #
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+
+    return peak
+
+# =============================================================================
+def syntheticTable (source_file, target_file, size):
+
+    width = len(str(max(size - 1, 0)))
+    rows  = 0
+
+    with open(source_file, "r", newline='') as fh, open(target_file, "w", newline='') as out:
+
+        # Comments, column names and column types are copied as is
+        #
+        keyIndex = None
+        for line in fh:
+            out.write(line)
+            if line[0] == '#':
+                continue
+            if keyIndex is None:
+                keyIndex = line.rstrip('\r\n').split('\t').index(nwisTables.keyColumn)
+            else:
+                break
+
+        # Each site group is written size times with a numbered site_no
+        #
+        def writeGroup (site_no, groupL):
+            rows = 0
+            for copy in range(size):
+                site = site_no if size < 2 else '%s%0*d' % (site_no, width, copy)
+                for fieldsL in groupL:
+                    fieldsL[keyIndex] = site
+                    out.write('\t'.join(fieldsL))
+                    rows += 1
+            return rows
+
+        site_no = None
+        groupL  = []
+        for line in fh:
+            fieldsL = line.split('\t')
+            if fieldsL[keyIndex] != site_no and len(groupL) > 0:
+                rows  += writeGroup(site_no, groupL)
+                groupL = []
+            site_no = fieldsL[keyIndex]
+            groupL.append(fieldsL)
+
+        if len(groupL) > 0:
+            rows += writeGroup(site_no, groupL)
+
+    return rows
+
+# =============================================================================
+def syntheticExtract (size):
+
+    target_dir = os.path.join(work_dir, 'x%d' % size)
+    stampsL    = usgsWellData.dataStamps()
+    marker     = os.path.join(target_dir, 'benchmark.json')
+
+    # Reuse an extract generated from the same shipped files
+    #
+    try:
+        with open(marker, "r") as fh:
+            markerD = json.load(fh)
+        if markerD['stamps'] == stampsL and markerD['size'] == size:
+            return target_dir, markerD['rows']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.makedirs(target_dir)
+
+    rowsD = {}
+    for table_nm in usgsWellData.construction_tablesL + usgsWellData.geohydrology_tablesL:
+        rowsD[table_nm] = syntheticTable(usgsWellData.nwisFileName(table_nm),
+                                         os.path.join(target_dir, os.path.basename(usgsWellData.nwisFileName(table_nm))),
+                                         size)
+
+    shutil.copy(usgsWellData.well_lookup_file, target_dir)
+    shutil.copy(usgsWellData.aqfr_lookup_file, target_dir)
+
+    with open(marker, "w") as fh:
+        json.dump({'size': size, 'stamps': stampsL, 'rows': rowsD}, fh)
+
+    return target_dir, rowsD
+
+# =============================================================================
+def tableSites (nwisFile):
+
+    siteL = []
+
+    with open(nwisFile, "r", newline='') as fh:
+        keyIndex = None
+        header   = 0
+        for line in fh:
+            if line[0] == '#':
+                continue
+            header += 1
+            if header == 1:
+                keyIndex = line.rstrip('\r\n').split('\t').index(nwisTables.keyColumn)
+            elif header > 2:
+                site_no = line.split('\t', keyIndex + 1)[keyIndex]
+                if len(siteL) < 1 or siteL[-1] != site_no:
+                    siteL.append(site_no)
+
+    return siteL
+
+# =============================================================================
+def sampleSites (samples):
+
+    sampleD = {}
+
+    for table_nm in usgsWellData.construction_tablesL + usgsWellData.geohydrology_tablesL:
+        siteL  = tableSites(usgsWellData.nwisFileName(table_nm))
+        middle = max(0, len(siteL) // 2 - samples // 2)
+        sampleD[table_nm] = {
+            'head':   siteL[:samples],
+            'middle': siteL[middle:middle + samples],
+            'tail':   siteL[-samples:]
+        }
+
+    return sampleD
+
+# =============================================================================
+def buildArtifacts (data_dir, mode, environ):
+
+    nwis_fileL = [os.path.join(data_dir, os.path.basename(usgsWellData.nwisFileName(table_nm)))
+                  for table_nm in usgsWellData.construction_tablesL + usgsWellData.geohydrology_tablesL]
+
+    # Artifacts are built with the modules' own command lines
+    #
+    if mode == 'index':
+        commandL = [sys.executable, 'nwisTables.py'] + nwis_fileL
+    elif mode == 'snapshot':
+        commandL = [sys.executable, 'nwisSnapshot.py'] + nwis_fileL
+    elif mode == 'sqlite':
+        commandL = [sys.executable, 'nwisSqlite.py', '--data', data_dir, '--database', environ['NWIS_SQLITE']]
+    else:
+        return 0.0
+
+    start = time.perf_counter()
+    subprocess.run(commandL, cwd=script_dir, env=environ, check=True, stdout=subprocess.DEVNULL)
+
+    return time.perf_counter() - start
+
+# =============================================================================
+def cgiStart (environ, endpoint, site_no, runs):
+
+    script, table_nmL = endpointsD[endpoint]
+
+    cgi_environ = dict(environ)
+    cgi_environ['QUERY_STRING'] = 'site_no=%s' % site_no
+
+    # Interpreter start to the first byte written and to exit of the script
+    #
+    firstL = []
+    exitL  = []
+    for run in range(runs):
+        start   = time.perf_counter()
+        process = subprocess.Popen([sys.executable, script], cwd=script_dir, env=cgi_environ,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        process.stdout.read(1)
+        firstL.append(time.perf_counter() - start)
+        process.stdout.read()
+        process.wait()
+        exitL.append(time.perf_counter() - start)
+
+    return {
+        'first_byte_ms': percentiles(firstL),
+        'exit_ms':       percentiles(exitL)
+    }
+
+# =============================================================================
+def renderEndpoint (endpoint, site_no, definitionsD, aqfrInfoD):
+
+    if endpoint == 'construction':
+        return usgsWellData.constructionJson(site_no, definitionsD)
+
+    return usgsWellData.geohydrologyJson(site_no, definitionsD, aqfrInfoD)
+
+# =============================================================================
+def measureWorker (sampleD, repeat):
+
+    # Runs inside a fresh process pointed at one extract and lookup mode
+    #
+    resultD = {'cold': {}, 'tables': {}}
+
+    start        = time.perf_counter()
+    definitionsD = usgsWellData.loadDefinitions()
+    aqfrInfoD    = usgsWellData.loadAquifers()
+    resultD['cold']['lookups_seconds'] = round(time.perf_counter() - start, 6)
+
+    # First request of each endpoint pays for opening the tables
+    #
+    for endpoint in endpointsD:
+        table_nm = endpointsD[endpoint][1][0]
+        site_no  = sampleD[table_nm]['head'][0]
+        start    = time.perf_counter()
+        renderEndpoint(endpoint, site_no, definitionsD, aqfrInfoD)
+        resultD['cold']['%s_first_request_seconds' % endpoint] = round(time.perf_counter() - start, 6)
+
+    lookupTime = 0.0
+    lookupRows = 0
+
+    for table_nm, positionD in sampleD.items():
+        nwis_file = usgsWellData.nwisFileName(table_nm)
+        endpoint  = tableEndpoint(table_nm)
+        tableD    = {}
+
+        for position in positionsL:
+            lookupsL  = []
+            requestsL = []
+
+            for run in range(repeat):
+                for site_no in positionD[position]:
+                    start = time.perf_counter()
+                    rowsL = usgsWellData.processNwisFile(nwis_file, site_no)
+                    lookupsL.append(time.perf_counter() - start)
+                    lookupRows += len(rowsL)
+
+                    start = time.perf_counter()
+                    renderEndpoint(endpoint, site_no, definitionsD, aqfrInfoD)
+                    requestsL.append(time.perf_counter() - start)
+
+            lookupTime += sum(lookupsL)
+            tableD[position] = {
+                'lookup_ms':  percentiles(lookupsL),
+                'request_ms': percentiles(requestsL)
+            }
+
+        resultD['tables'][table_nm] = tableD
+
+    resultD['rows_returned']   = lookupRows
+    resultD['rows_per_second'] = round(lookupRows / lookupTime, 1) if lookupTime > 0 else None
+    resultD['peak_rss_kb']     = peakRss()
+
+    return resultD
+
+# =============================================================================
+def concatenatedDocument (tablesD, sectionsL, definitionsD, aqfrInfoD):
+
+    # Well document assembled the way the scripts did before the JSON
+    #  writer: every record dumped on its own and joined per table, per
+    #  section and per document; kept as the reference of --render
+    #
+    def jsonArray (table_nm, recordsL):
+        return '"%s":' % table_nm + '[' + ",".join([json.dumps(myRecord) for myRecord in recordsL]) + ']'
+
+    jsonL = []
+    if 'well_construction' in sectionsL:
+        cnsL = []
+        for table_nm, recordsL in [('gw_cons', usgsWellData.sealRecords(tablesD['gw_cons'], definitionsD['seal_cd'])),
+                                   ('gw_hole', usgsWellData.holeRecords(tablesD['gw_hole'])),
+                                   ('gw_csng', usgsWellData.casingRecords(tablesD['gw_csng'], definitionsD['csng_material_cd'])),
+                                   ('gw_open', usgsWellData.openRecords(tablesD['gw_open'], definitionsD['open_cd']))]:
+            if len(recordsL) > 0:
+                cnsL.append(jsonArray(table_nm, recordsL))
+        jsonL.append('"well_construction":' + '{' + ",".join(cnsL) + '}')
+
+    if 'gw_geoh' in sectionsL:
+        geohsL = usgsWellData.geohRecords(tablesD['gw_geoh'], definitionsD['lith_cd'], aqfrInfoD)
+        if len(geohsL) > 0:
+            jsonL.append(jsonArray('gw_geoh', geohsL))
+
+    return "{" + ",".join(jsonL) + "}"
+
+# =============================================================================
+def heaviestSites (count, definitionsD, aqfrInfoD):
+
+    import nwisSchema
+
+    # Sites with the most rows in the well tables; sites whose records
+    #  cannot be rendered are passed over
+    #
+    countsD = {}
+    for table_nm in usgsWellData.construction_tablesL + usgsWellData.geohydrology_tablesL:
+        for (site_no,) in nwisSchema.tableRows(usgsWellData.nwisFileName(table_nm), ['site_no']):
+            countsD[site_no] = countsD.get(site_no, 0) + 1
+
+    sectionsL = usgsWellData.wellSections('')
+    siteL     = []
+    for site_no in sorted(countsD, key=lambda site: (-countsD[site], site)):
+        try:
+            usgsWellData.wellJson(site_no, sectionsL, definitionsD, aqfrInfoD)
+        except usgsWellData.WellDataError:
+            continue
+        siteL.append(site_no)
+        if len(siteL) >= count:
+            break
+
+    return siteL, countsD
+
+# =============================================================================
+def measureRender (siteL, definitionsD, aqfrInfoD, repeat):
+
+    import gc
+
+    import tracemalloc
+
+    sectionsL = usgsWellData.wellSections('')
+    batchD    = usgsWellData.readBatchTables(usgsWellData.sectionTables(sectionsL), siteL)
+
+    # A single site is answered with its document, several sites with
+    #  their documents keyed by site_no
+    #
+    def concatenated ():
+        if len(siteL) == 1:
+            return concatenatedDocument(batchD[siteL[0]], sectionsL, definitionsD, aqfrInfoD)
+        return "{" + ",".join(['"%s":' % site + concatenatedDocument(batchD[site], sectionsL, definitionsD, aqfrInfoD) for site in siteL]) + "}"
+
+    def output (write):
+        writeDocument = lambda write, tablesD: usgsWellData.writeWellDocument(write, tablesD, sectionsL, definitionsD, aqfrInfoD)
+        if len(siteL) == 1:
+            return usgsWellData.writeSiteDocuments(write, None, batchD[siteL[0]], writeDocument)
+        return usgsWellData.writeSiteDocuments(write, siteL, batchD, writeDocument)
+
+    # The response as one string, as the service keeps it, and written
+    #  straight to an output, as the CGI scripts do
+    #
+    renderersL = [
+        ('concatenated', concatenated),
+        ('buffered',     lambda: usgsWellData.renderJson(output)),
+        ('streamed',     lambda: output(lambda text: None))
+    ]
+
+    jsonOutput = concatenated()
+    if usgsWellData.renderJson(output) != jsonOutput:
+        raise ValueError('Rendered documents differ from the reference for %s' % ','.join(siteL))
+
+    resultD = {'sites': len(siteL), 'bytes': len(jsonOutput)}
+    for name, render in renderersL:
+        best = None
+        for run in range(5):
+            start = time.perf_counter()
+            for count in range(repeat):
+                render()
+            elapsed = (time.perf_counter() - start) / repeat
+            best    = elapsed if best is None else min(best, elapsed)
+
+        gc.collect()
+        tracemalloc.start()
+        render()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        resultD[name] = {'ms': round(best * 1000.0, 4), 'peak_kb': round(peak / 1024.0, 1)}
+
+    for name in ['buffered', 'streamed']:
+        resultD[name]['saved_ms']      = round(resultD['concatenated']['ms'] - resultD[name]['ms'], 4)
+        resultD[name]['saved_peak_kb'] = round(resultD['concatenated']['peak_kb'] - resultD[name]['peak_kb'], 1)
+
+    return resultD
+
+# =============================================================================
+def runRender (repeat):
+
+    # Rendering of the heaviest wells of the shipped tables, alone and in
+    #  batches up to the largest a request may hold
+    #
+    definitionsD   = usgsWellData.loadDefinitions()
+    aqfrInfoD      = usgsWellData.loadAquifers()
+    siteL, countsD = heaviestSites(usgsWellData.max_batch_sites, definitionsD, aqfrInfoD)
+
+    reportD = {
+        'program':  program,
+        'version':  version,
+        'platform': platform.platform(),
+        'python':   platform.python_version(),
+        'heaviest': dict([(site_no, countsD[site_no]) for site_no in siteL[:5]]),
+        'results':  []
+    }
+
+    for count in [1, 50, usgsWellData.max_batch_sites]:
+        resultD = measureRender(siteL[:count], definitionsD, aqfrInfoD, max(1, repeat * 40 // count))
+        reportD['results'].append(resultD)
+        print('%s render %d sites done' % (program, count), file=sys.stderr)
+
+    return reportD
+
+# =============================================================================
+def runBenchmark (sizesL, lookupL, samples, repeat, cgi_runs):
+
+    reportD = {
+        'program':      program,
+        'version':      version,
+        'python':       platform.python_version(),
+        'platform':     platform.platform(),
+        'samples':      samples,
+        'repeat':       repeat,
+        'results':      []
+    }
+
+    for size in sizesL:
+        data_dir, rowsD = syntheticExtract(size)
+
+        for mode in lookupL:
+            environ = dict(os.environ)
+            environ.update({
+                'WELL_DATA_DIR': data_dir,
+                'NWIS_LOOKUP':   mode,
+                'NWIS_SQLITE':   os.path.join(data_dir, 'nwis.sqlite')
+            })
+
+            resultD = {
+                'size':          size,
+                'mode':          mode,
+                'rows':          rowsD,
+                'build_seconds': round(buildArtifacts(data_dir, mode, environ), 6)
+            }
+
+            # Sites and timings are taken in a separate process so each mode
+            #  starts cold and reports its own peak RSS
+            #
+            workerL = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker',
+                                      '--samples', str(samples), '--repeat', str(repeat)],
+                                     cwd=script_dir, env=environ, check=True,
+                                     stdout=subprocess.PIPE).stdout
+            workerD = json.loads(workerL)
+            siteD   = workerD.pop('cgi_site')
+            resultD.update(workerD)
+
+            resultD['cold']['cgi_ms'] = {}
+            for endpoint, site_no in siteD.items():
+                resultD['cold']['cgi_ms'][endpoint] = cgiStart(environ, endpoint, site_no, cgi_runs)
+
+            reportD['results'].append(resultD)
+            print('%s x%d %s done' % (program, size, mode), file=sys.stderr)
+
+    return reportD
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description=program)
+    parser.add_argument('--sizes', default='1,10,100', help='Comma-separated extract sizes as multiples of the shipped tables')
+    parser.add_argument('--modes', default='scan,index,bisect,snapshot', help='Comma-separated lookup modes (%s)' % ', '.join(modesL))
+    parser.add_argument('--samples', default=5, type=int, help='Sites sampled at each table position')
+    parser.add_argument('--repeat', default=5, type=int, help='Times each sampled site is requested')
+    parser.add_argument('--cgi-runs', default=5, type=int, help='CGI script runs per endpoint for the cold start')
+    parser.add_argument('--output', default=None, help='Report file (default standard output)')
+    parser.add_argument('--render', action='store_true', help='Time and trace the JSON rendering of the heaviest shipped wells instead')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Measuring process started by the benchmark
+    #
+    if args.worker:
+        sampleD = sampleSites(args.samples)
+        resultD = measureWorker(sampleD, args.repeat)
+        resultD['cgi_site'] = dict([(endpoint, sampleD[table_nmL[0]]['middle'][0])
+                                    for endpoint, (script, table_nmL) in endpointsD.items()])
+        print(json.dumps(resultD))
+        sys.exit()
+
+    if args.render:
+        reportD = runRender(args.repeat)
+
+    else:
+        lookupL = [mode.strip() for mode in args.modes.split(',') if len(mode.strip()) > 0]
+        for mode in lookupL:
+            if mode not in modesL:
+                parser.error('Unknown lookup mode %s' % mode)
+
+        reportD = runBenchmark([int(size) for size in args.sizes.split(',')], lookupL,
+                               args.samples, args.repeat, args.cgi_runs)
+
+    if args.output is None:
+        print(json.dumps(reportD, indent=2))
+    else:
+        with open(args.output, "w") as fh:
+            json.dump(reportD, fh, indent=2)
+
+    sys.exit()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellLruCache.py
+#
+# Project:  wellConstruction
+# Purpose:  Module provides the in-process LRU cache of rendered responses
+#            used by the persistent well lithology service.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Entries are bounded both by count and by the total bytes of the cached
+#  bodies as sent (UTF-8); the least recently used entries are evicted
+#  first. Every lookup
+#  carries the current data version (usgsWellData.dataVersion) and the whole
+#  cache is dropped when it differs from the version the entries were
+#  rendered from, so replacing an extract or lookup file invalidates it.
+#
+###############################################################################
+
+import threading
+
+from collections import OrderedDict
+
+# =============================================================================
+class LruCache:
+
+    def __init__ (self, max_entries=2048, max_bytes=64 * 1024 * 1024):
+
+        self.max_entries   = max_entries
+        self.max_bytes     = max_bytes
+        self.version       = None
+        self.entriesD      = OrderedDict()
+        self.size          = 0
+        self.lock          = threading.Lock()
+
+        self.hits          = 0
+        self.misses        = 0
+        self.evictions     = 0
+        self.invalidations = 0
+
+    # -------------------------------------------------------------------------
+    def checkVersion (self, version):
+
+        # Drop everything rendered from another data version
+        #
+        if version != self.version:
+            if len(self.entriesD) > 0:
+                self.invalidations += 1
+            self.entriesD.clear()
+            self.size    = 0
+            self.version = version
+
+    # -------------------------------------------------------------------------
+    def get (self, key, version):
+
+        with self.lock:
+            self.checkVersion(version)
+
+            entryT = self.entriesD.get(key)
+            if entryT is None:
+                self.misses += 1
+                return None
+
+            self.entriesD.move_to_end(key)
+            self.hits += 1
+
+            return entryT[0]
+
+    # -------------------------------------------------------------------------
+    def put (self, key, version, body):
+
+        # Bodies are counted by their encoded size, so names with accents
+        #  count as sent; bodies larger than a quarter of the byte budget
+        #  are not kept
+        #
+        if self.max_entries < 1:
+            return
+
+        size = len(body.encode('utf-8'))
+        if size > self.max_bytes // 4:
+            return
+
+        with self.lock:
+            self.checkVersion(version)
+
+            oldEntryT = self.entriesD.pop(key, None)
+            if oldEntryT is not None:
+                self.size -= oldEntryT[1]
+
+            self.entriesD[key] = (body, size)
+            self.size += size
+
+            while len(self.entriesD) > self.max_entries or self.size > self.max_bytes:
+                oldKey, oldEntryT = self.entriesD.popitem(last=False)
+                self.size        -= oldEntryT[1]
+                self.evictions   += 1
+
+    # -------------------------------------------------------------------------
+    def statistics (self):
+
+        with self.lock:
+            return {
+                'entries':       len(self.entriesD),
+                'bytes':         self.size,
+                'max_entries':   self.max_entries,
+                'max_bytes':     self.max_bytes,
+                'hits':          self.hits,
+                'misses':        self.misses,
+                'evictions':     self.evictions,
+                'invalidations': self.invalidations,
+                'version':       self.version
+            }
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellMetrics.py
+#
+# Project:  wellConstruction
+# Purpose:  Module keeps the request, table scan, error and cache counters of
+#            the well lithology service and writes them in the Prometheus
+#            text exposition format.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Every metric holds its labelled values in a dictionary guarded by its own
+#  lock, so the threads of the service update them with one dictionary
+#  update each. The service records each finished request from its request
+#  timer (see wellTiming.py) and serves the text from /metrics.
+#
+# Metrics are on unless WELL_METRICS is 0 (or the service is started with
+#  --no-metrics); while they are off nothing is recorded and the service
+#  keeps no request timer unless timing is on.
+#
+###############################################################################
+
+import os, re
+
+import threading
+
+metricsEnabled  = os.environ.get('WELL_METRICS', '1') not in ['', '0']
+
+# Latency buckets in seconds and row count buckets
+#
+latencyBucketsL = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+rowsBucketsL    = [0, 1, 5, 10, 25, 50, 100, 250, 1000, 10000, 100000]
+
+# Error messages grouped by cause
+#
+errorCausesL = [
+    ('missing_file', re.compile(r'(not found|does not exist|Can not open)')),
+    ('permission',   re.compile(r'^No permission')),
+    ('definitions',  re.compile(r'^No .* definitions loaded')),
+    ('batch_limit',  re.compile(r'^Requests are limited')),
+    ('bad_request',  re.compile(r'^(Unknown section|Requires)')),
+    ('internal',     re.compile(r'^An error occurred'))
+]
+
+# =============================================================================
+def labelText (namesL, valuesL):
+
+    if len(namesL) < 1:
+        return ''
+
+    return '{%s}' % ','.join(['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                              for name, value in zip(namesL, valuesL)])
+
+# =============================================================================
+class Counter:
+
+    kind = 'counter'
+
+    def __init__ (self, name, help_text, labelsL=[]):
+
+        self.name     = name
+        self.help     = help_text
+        self.labelsL  = labelsL
+        self.valuesD  = {}
+        self.lock     = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    def inc (self, labelsL=(), amount=1):
+
+        labelsL = tuple(labelsL)
+        with self.lock:
+            self.valuesD[labelsL] = self.valuesD.get(labelsL, 0) + amount
+
+    # -------------------------------------------------------------------------
+    def samples (self):
+
+        with self.lock:
+            return [(self.name + labelText(self.labelsL, labelsL), value) for labelsL, value in sorted(self.valuesD.items())]
+
+# =============================================================================
+class Gauge (Counter):
+
+    kind = 'gauge'
+
+    # -------------------------------------------------------------------------
+    def set (self, labelsL=(), value=0):
+
+        with self.lock:
+            self.valuesD[tuple(labelsL)] = value
+
+# =============================================================================
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__ (self, name, help_text, labelsL=[], bucketsL=latencyBucketsL):
+
+        self.name     = name
+        self.help     = help_text
+        self.labelsL  = labelsL
+        self.bucketsL = bucketsL
+        self.valuesD  = {}
+        self.lock     = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    def observe (self, labelsL=(), value=0):
+
+        labelsL = tuple(labelsL)
+
+        # Counts per bucket are kept unsummed and added up when written
+        #
+        bucket = len(self.bucketsL)
+        for i, bound in enumerate(self.bucketsL):
+            if value <= bound:
+                bucket = i
+                break
+
+        with self.lock:
+            seriesL = self.valuesD.get(labelsL)
+            if seriesL is None:
+                seriesL = self.valuesD[labelsL] = [[0] * (len(self.bucketsL) + 1), 0.0, 0]
+            seriesL[0][bucket] += 1
+            seriesL[1]         += value
+            seriesL[2]         += 1
+
+    # -------------------------------------------------------------------------
+    def samples (self):
+
+        samplesL = []
+
+        with self.lock:
+            for labelsL, (countsL, total, count) in sorted(self.valuesD.items()):
+                cumulative = 0
+                for bound, bucketCount in zip(self.bucketsL + ['+Inf'], countsL):
+                    cumulative += bucketCount
+                    samplesL.append((self.name + '_bucket' + labelText(self.labelsL + ['le'], list(labelsL) + [bound]), cumulative))
+                samplesL.append((self.name + '_sum' + labelText(self.labelsL, labelsL), round(total, 6)))
+                samplesL.append((self.name + '_count' + labelText(self.labelsL, labelsL), count))
+
+        return samplesL
+
+# =============================================================================
+requestsTotal     = Counter('well_requests_total', 'Requests answered by endpoint and status', ['endpoint', 'status'])
+requestSeconds    = Histogram('well_request_duration_seconds', 'Request latency by endpoint', ['endpoint'])
+requestRows       = Histogram('well_request_rows_scanned', 'NWIS table rows scanned per request', ['endpoint'], rowsBucketsL)
+rowsScanned       = Counter('well_rows_scanned_total', 'NWIS table rows scanned by table', ['table'])
+rowsMatched       = Counter('well_rows_matched_total', 'NWIS table rows returned by table', ['table'])
+tableNotFound     = Counter('well_table_not_found_total', 'Table reads without any row for the requested sites', ['table'])
+requestNotFound   = Counter('well_not_found_total', 'Requests read from the tables without any row for the requested sites', ['endpoint'])
+errorsTotal       = Counter('well_errors_total', 'Error responses by cause', ['endpoint', 'cause'])
+cacheTotal        = Counter('well_cache_requests_total', 'Response cache lookups by cache and result', ['cache', 'result'])
+cacheGauge        = Gauge('well_lru_cache', 'In-process response cache state', ['field'])
+
+metricsL = [requestsTotal, requestSeconds, requestRows, rowsScanned, rowsMatched, tableNotFound,
+            requestNotFound, errorsTotal, cacheTotal, cacheGauge]
+
+# =============================================================================
+def errorCause (message):
+
+    for cause, pattern in errorCausesL:
+        if pattern.search(message):
+            return cause
+
+    return 'other'
+
+# =============================================================================
+def recordRequest (recordD):
+
+    # Request timer record of a finished request (wellTiming.finishRequest)
+    #
+    if not metricsEnabled:
+        return
+
+    endpoint = recordD['endpoint']
+
+    requestsTotal.inc([endpoint, recordD['status']])
+    requestSeconds.observe([endpoint], recordD['total_ms'] / 1000.0)
+
+    tablesD = recordD['tables']
+    if len(tablesD) < 1:
+        return
+
+    scanned = 0
+    matched = 0
+    for table_nm, tableD in tablesD.items():
+        rowsScanned.inc([table_nm], tableD['scanned'])
+        rowsMatched.inc([table_nm], tableD['matched'])
+        if tableD['matched'] < 1:
+            tableNotFound.inc([table_nm])
+        scanned += tableD['scanned']
+        matched += tableD['matched']
+
+    requestRows.observe([endpoint], scanned)
+    if matched < 1:
+        requestNotFound.inc([endpoint])
+
+# =============================================================================
+def recordStatus (endpoint, status):
+
+    # Requests turned away before a timer is started
+    #
+    if metricsEnabled:
+        requestsTotal.inc([endpoint, status])
+
+# =============================================================================
+def recordError (endpoint, message):
+
+    if metricsEnabled:
+        errorsTotal.inc([endpoint, errorCause(message)])
+
+# =============================================================================
+def recordCache (cache, hit):
+
+    if metricsEnabled:
+        cacheTotal.inc([cache, 'hit' if hit else 'miss'])
+
+# =============================================================================
+def metricsText (cacheStatisticsD=None):
+
+    # Current state of the in-process cache is copied in at scrape time
+    #
+    if cacheStatisticsD is not None:
+        for field, value in cacheStatisticsD.items():
+            if isinstance(value, (int, float)):
+                cacheGauge.set([field], value)
+
+    linesL = []
+    for metric in metricsL:
+        linesL.append('# HELP %s %s' % (metric.name, metric.help))
+        linesL.append('# TYPE %s %s' % (metric.name, metric.kind))
+        for sample, value in metric.samples():
+            linesL.append('%s %s' % (sample, value))
+
+    return '\n'.join(linesL) + '\n'
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellPrefork.py
+#
+# Project:  wellConstruction
+# Purpose:  Module runs the well lithology service as a prefork pool of
+#            worker processes sharing the data loaded once by the master.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Started with --workers N the service binds its socket and loads the data
+#  image in the master process: the code tables and aquifer names, the
+#  memory-mapped table snapshots (or the typed arrays of --lookup memory)
+#  and the pre-rendered response pack. The loaded objects are moved out of
+#  the garbage collector's reach (gc.freeze) and N workers are forked. The
+#  workers accept on the shared socket and read the image through pages
+#  shared copy-on-write with the master, so start-up is paid once and each
+#  added worker costs little more than its own request state.
+#
+#    python wellService.py --workers 4 --port 8080
+#
+# The master checks the data version every --reload-interval seconds. When
+#  an extract or lookup file is replaced, or on SIGHUP, it loads the new
+#  image, forks a new generation of workers and only then sends SIGTERM to
+#  the old ones, which finish the requests they have accepted and exit.
+#  Workers that die are replaced. SIGTERM or SIGINT stops the pool.
+#
+# Each worker keeps its own response cache, timing and /metrics counters.
+#
+###############################################################################
+
+import os, sys
+
+import gc
+
+import time
+
+import signal
+
+import threading
+
+from socketserver import ThreadingMixIn
+
+from wsgiref.simple_server import WSGIServer
+
+import usgsWellData
+
+import nwisResponseCache
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger()
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+reload_interval = 2.0
+stop_timeout    = 30.0
+
+# =============================================================================
+class PreforkWSGIServer (ThreadingMixIn, WSGIServer):
+
+    # A stopping worker waits for the requests it has accepted
+    #
+    daemon_threads = False
+    block_on_close = True
+
+# =============================================================================
+def loadImage (loadService):
+
+    # Lookups, table snapshots or arrays and the response pack, loaded by
+    #  the master before the workers are forked
+    #
+    gc.unfreeze()
+
+    data_version = usgsWellData.dataVersion()
+    loadService(data_version)
+    nwisResponseCache.openCache()
+
+    # Objects that live as long as the image are kept out of later
+    #  collections so the workers do not write to their pages
+    #
+    gc.collect()
+    gc.freeze()
+
+    return data_version
+
+# =============================================================================
+def workerMain (server):
+
+    stopEvent = threading.Event()
+    master    = os.getppid()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopEvent.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # SQLite connections are not carried over a fork
+    #
+    nwisSqlite = sys.modules.get('nwisSqlite')
+    if nwisSqlite is not None:
+        nwisSqlite.connectionLocal = threading.local()
+
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+
+    # Serve until told to stop or orphaned by the master
+    #
+    while not stopEvent.wait(1.0):
+        if os.getppid() != master:
+            break
+
+    server.shutdown()
+    server.server_close()
+
+# =============================================================================
+def spawnWorker (server):
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            workerMain(server)
+            status = 0
+        finally:
+            os._exit(status)
+
+    return pid
+
+# =============================================================================
+def stopWorkers (pidL, timeout=None):
+
+    for pid in pidL:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    if timeout is None:
+        return
+
+    # Wait for the workers, killing those still busy after the timeout
+    #
+    deadline = time.monotonic() + timeout
+    pendingL = list(pidL)
+    while len(pendingL) > 0:
+        for pid in list(pendingL):
+            try:
+                done = os.waitpid(pid, os.WNOHANG)[0] != 0
+            except ChildProcessError:
+                done = True
+            if done:
+                pendingL.remove(pid)
+        if len(pendingL) > 0 and time.monotonic() > deadline:
+            for pid in pendingL:
+                os.kill(pid, signal.SIGKILL)
+            deadline = float('inf')
+        time.sleep(0.1)
+
+# =============================================================================
+def servePrefork (server, workers, loadService, interval=reload_interval):
+
+    signalsD = {'stop': False, 'reload': False}
+
+    def stopSignal (signum, frame):
+        signalsD['stop'] = True
+
+    def reloadSignal (signum, frame):
+        signalsD['reload'] = True
+
+    signal.signal(signal.SIGTERM, stopSignal)
+    signal.signal(signal.SIGINT, stopSignal)
+    signal.signal(signal.SIGHUP, reloadSignal)
+
+    data_version = loadImage(loadService)
+    generation   = 1
+    poolD        = {}
+    for worker in range(workers):
+        poolD[spawnWorker(server)] = generation
+    screen_logger.info('Started %d workers for data version %s' % (workers, data_version))
+
+    checked = time.monotonic()
+    while not signalsD['stop']:
+        time.sleep(0.2)
+
+        # Reap exited workers and replace those of the current generation
+        #
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if poolD.pop(pid, None) == generation and not signalsD['stop']:
+                screen_logger.error('Worker %d exited with status %d; starting another' % (pid, status))
+                poolD[spawnWorker(server)] = generation
+
+        if not signalsD['reload'] and time.monotonic() - checked < interval:
+            continue
+        checked = time.monotonic()
+
+        # New extract or SIGHUP: the new generation is serving before the
+        #  old one is told to stop
+        #
+        if signalsD['reload'] or usgsWellData.dataVersion() != data_version:
+            signalsD['reload'] = False
+            data_version = loadImage(loadService)
+            generation  += 1
+            oldL = [pid for pid, worker_generation in poolD.items() if worker_generation != generation]
+            for worker in range(workers):
+                poolD[spawnWorker(server)] = generation
+            stopWorkers(oldL)
+            screen_logger.info('Reloaded data version %s; replacing %d workers' % (data_version, len(oldL)))
+
+    stopWorkers(list(poolD.keys()), stop_timeout)
+    server.server_close()
@@ -0,0 +1,562 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellService.py
+#
+# Project:  wellConstruction
+# Purpose:  Persistent WSGI service answering the USGS well construction and
+#            geohydrology requests without a process per request.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The service loads the code tables, the aquifer names and the NWIS table
+#  indexes once and answers the same endpoints as the CGI scripts with the
+#  same JSON. Requests are routed on the last path segment so the existing
+#  URLs can be proxied unchanged, for example
+#
+#    /cgi-bin/lithology/requestUsgsConstruction.py?site_no=422031121400001
+#    /cgi-bin/lithology/requestUsgsGeohydrology.py?site_no=451626122522001
+#    /cgi-bin/lithology/requestUsgsWell.py?site_no=422031121400001
+#    /cgi-bin/lithology/requestUsgsTable.py?site_no=434400121275801&tables=gw_repr
+#
+# Run standalone with the threaded stdlib server
+#
+#    python wellService.py --host 127.0.0.1 --port 8080
+#
+#  or point any WSGI server (mod_wsgi, gunicorn, uWSGI) at
+#  wellService:application.
+#
+# Rendered responses are kept in an LRU cache bounded by entry count and
+#  bytes (--cache-entries, --cache-bytes or WELL_CACHE_ENTRIES and
+#  WELL_CACHE_BYTES) and keyed by the data version, so the cache and the
+#  loaded lookups are dropped when an extract or lookup file is replaced.
+#
+# Responses carry ETag, Last-Modified and Cache-Control headers; requests
+#  revalidating the current data version get a 304 without a table read.
+#
+# Request counts, latency histograms, rows scanned, not-found and error
+#  counts and cache hit ratios are served in the Prometheus text format
+#  from /metrics (see wellMetrics.py), unless started with --no-metrics.
+#
+# /requestUsgsCrossReference.py translates site numbers, OWRD well log ids
+#  and other agency ids into each other (see nwisCrossReference.py), and
+#  /requestUsgsFilter.py finds the wells with intervals in a depth range
+#  and with given codes (see nwisIntervals.py).
+#
+# /requestUsgsExport.py streams the shaped records of every well, or of a
+#  network, as NDJSON or CSV (see nwisExport.py).
+#
+# With --workers N the service runs as a prefork pool sharing the data the
+#  master loads once (see wellPrefork.py).
+#
+# With --lookup memory (or NWIS_LOOKUP=memory) the tables are read once into
+#  typed arrays held by the service (see nwisStore.py).
+#
+# With --table-threads N (or WELL_TABLE_THREADS=N) the NWIS tables of a
+#  request are read by a pool of N threads instead of one after another.
+#
+# With --timing (or WELL_TIMING=1) every response carries a Server-Timing
+#  header and one JSON line with its phases is logged (see wellTiming.py).
+#
+###############################################################################
+
+import os, sys
+
+import threading
+
+import nwisTables
+
+import nwisSnapshot
+
+import nwisStore
+
+import usgsWellData
+
+import nwisRegistry
+
+import nwisResponseCache
+
+import nwisCrossReference
+
+import nwisIntervals
+
+import nwisExport
+
+import wellLruCache
+
+import wellTiming
+
+import wellMetrics
+
+# Set up logging
+#
+import logging
+
+screen_logger = logging.getLogger()
+
+# ------------------------------------------------------------
+# -- Set
+# ------------------------------------------------------------
+program         = "USGS Well Lithology Service"
+version         = "1.00"
+version_date    = "18October2026"
+
+# Lookups shared by every request once the service is loaded
+#
+serviceD        = None
+serviceLock     = threading.Lock()
+
+# Rendered responses of popular wells
+#
+responseCache   = wellLruCache.LruCache(int(os.environ.get('WELL_CACHE_ENTRIES', 2048)),
+                                        int(os.environ.get('WELL_CACHE_BYTES', 64 * 1024 * 1024)))
+
+# =============================================================================
+def loadLookup (loader):
+
+    # Keep a load error so the affected endpoint answers with the same
+    #  message the CGI script would print
+    #
+    try:
+        return loader()
+    except usgsWellData.WellDataError as e:
+        screen_logger.error(str(e))
+        return e
+
+# =============================================================================
+def loadService (data_version=None):
+
+    global serviceD
+
+    if data_version is None:
+        data_version = usgsWellData.dataVersion()
+
+    with serviceLock:
+
+        # Lookups are reloaded when an extract or lookup file is replaced
+        #
+        if serviceD is not None and serviceD['version'] == data_version:
+            return serviceD
+
+        lookupsD = {
+            'version':     data_version,
+            'definitions': loadLookup(usgsWellData.loadDefinitions),
+            'aquifers':    loadLookup(usgsWellData.loadAquifers)
+        }
+
+        # Load the table indexes so the first request does not pay for them
+        #
+        for table_nm in nwisRegistry.registeredTables():
+            nwis_file = usgsWellData.nwisFileName(table_nm)
+            try:
+                if nwisTables.lookupMode == 'snapshot' and nwisSnapshot.openSnapshot(nwis_file) is not None:
+                    continue
+                if nwisTables.lookupMode == 'memory':
+                    nwisStore.openStore(nwis_file)
+                    continue
+                if nwisTables.lookupMode == 'bisect':
+                    nwisTables.rdbHeader(nwis_file)
+                else:
+                    nwisTables.loadNwisIndex(nwis_file)
+            except (OSError, ValueError) as e:
+                screen_logger.error('Unable to load NWIS table %s: %s' % (nwis_file, e))
+
+        # Id cross-reference indexes; rebuilt on their own when gw_coop or
+        #  gw_otid change
+        #
+        loadLookup(nwisCrossReference.loadCrossReference)
+        loadLookup(nwisIntervals.loadIntervals)
+
+        serviceD = lookupsD
+
+    return serviceD
+
+# =============================================================================
+def lookup (name):
+
+    value = serviceD[name]
+    if isinstance(value, usgsWellData.WellDataError):
+        raise value
+
+    return value
+
+# =============================================================================
+def constructionRequest (site_no, params):
+
+    return usgsWellData.constructionJson(site_no, lookup('definitions'))
+
+# =============================================================================
+def geohydrologyRequest (site_no, params):
+
+    return usgsWellData.geohydrologyJson(site_no, lookup('definitions'), lookup('aquifers'))
+
+# =============================================================================
+def wellRequest (site_no, params):
+
+    sectionsL = usgsWellData.wellSections(params.get('sections'))
+
+    # Without aquifer names the construction is returned with a message
+    #
+    sectionsL, aqfrInfoD, message = usgsWellData.wellAquifers(sectionsL, lambda: lookup('aquifers'))
+
+    return usgsWellData.wellJson(site_no, sectionsL, lookup('definitions'), aqfrInfoD, message)
+
+# =============================================================================
+def tableRequest (site_no, params):
+
+    table_nmL = usgsWellData.registryTables(params.get('tables'))
+
+    aqfrInfoD = None
+    if nwisRegistry.needsAquifers(table_nmL):
+        aqfrInfoD = lookup('aquifers')
+
+    return usgsWellData.tablesJson(site_no, table_nmL, lookup('definitions'), aqfrInfoD)
+
+# Endpoints keyed by the CGI script name they replace with the kind of
+#  pre-rendered response that answers them
+#
+routesD = {
+    'requestUsgsConstruction.py': (constructionRequest, 'construction'),
+    'requestUsgsGeohydrology.py': (geohydrologyRequest, 'geohydrology'),
+    'requestUsgsWell.py':         (wellRequest,         'well'),
+    'requestUsgsTable.py':        (tableRequest,        'table')
+}
+
+crossReferenceScript = 'requestUsgsCrossReference.py'
+filterScript         = 'requestUsgsFilter.py'
+exportScript         = 'requestUsgsExport.py'
+
+# =============================================================================
+def crossReferenceResponse (start_response, params):
+
+    startTimer('crossreference')
+
+    try:
+        definitionsD = None
+        aqfrInfoD    = None
+        if len(params.get('sections', '')) > 0:
+            with wellTiming.phase('load'):
+                loadService()
+            definitionsD = lookup('definitions')
+            if 'gw_geoh' in usgsWellData.wellSections(params['sections']):
+                aqfrInfoD = lookup('aquifers')
+
+        jsonOutput = nwisCrossReference.crossReferenceJson(params, definitionsD, aqfrInfoD)
+    except usgsWellData.WellDataError as e:
+        screen_logger.info(str(e))
+        wellMetrics.recordError('crossreference', str(e))
+        return jsonResponse(start_response, '200 OK', usgsWellData.messageJson(str(e)), timedHeaders([], 'error'))
+
+    return jsonResponse(start_response, '200 OK', jsonOutput, timedHeaders([], '200'))
+
+# =============================================================================
+def filterResponse (start_response, params):
+
+    startTimer('filter')
+
+    try:
+        jsonOutput = nwisIntervals.filterJson(params)
+    except usgsWellData.WellDataError as e:
+        screen_logger.info(str(e))
+        wellMetrics.recordError('filter', str(e))
+        return jsonResponse(start_response, '200 OK', usgsWellData.messageJson(str(e)), timedHeaders([], 'error'))
+
+    return jsonResponse(start_response, '200 OK', jsonOutput, timedHeaders([], '200'))
+
+# =============================================================================
+def exportResponse (start_response, params, accept_encoding=None):
+
+    timer = startTimer('export')
+
+    try:
+        with wellTiming.phase('load'):
+            loadService()
+        definitionsD = lookup('definitions')
+        aqfrInfoD    = None
+        if 'gw_geoh' in usgsWellData.wellSections(params.get('sections')):
+            aqfrInfoD = lookup('aquifers')
+
+        compress = nwisExport.exportCompressed(params, accept_encoding)
+        content_type, chunksI = nwisExport.exportStream(params, definitionsD, aqfrInfoD, compress)
+    except usgsWellData.WellDataError as e:
+        screen_logger.info(str(e))
+        wellMetrics.recordError('export', str(e))
+        return jsonResponse(start_response, '200 OK', usgsWellData.messageJson(str(e)), timedHeaders([], 'error'))
+
+    # No Content-Length: the server streams the chunks as they are shaped
+    #  (chunked transfer on HTTP/1.1) and the request is timed until the
+    #  last one is sent
+    #
+    headersL = [('Content-Type', content_type)]
+    if compress:
+        headersL.append(('Content-Encoding', 'gzip'))
+    start_response('200 OK', headersL)
+
+    return streamedChunks(chunksI, timer)
+
+# =============================================================================
+def streamedChunks (chunksI, timer):
+
+    # The chunks are sent after application() returned, so the request
+    #  timer is installed again on the thread sending them
+    #
+    wellTiming.resumeRequest(timer)
+
+    status = 'error'
+    try:
+        for chunk in chunksI:
+            yield chunk
+        status = '200'
+    finally:
+        timedHeaders([], status)
+
+# =============================================================================
+def startTimer (endpoint, site_no=None):
+
+    # A timer is only kept for timing output or the metrics
+    #
+    return wellTiming.startRequest(endpoint, site_no, collect=wellMetrics.metricsEnabled)
+
+# =============================================================================
+def jsonResponse (start_response, status, jsonOutput, headersL=[]):
+
+    body = jsonOutput.encode('utf-8')
+
+    start_response(status, [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(body)))
+    ] + headersL)
+
+    return [body]
+
+# =============================================================================
+def timedHeaders (headersL, status):
+
+    # Close the request timer, count the request and pass its phases on as
+    #  Server-Timing when timing is on
+    #
+    timingD = wellTiming.finishRequest(status)
+    if timingD is None:
+        return headersL
+
+    wellMetrics.recordRequest(timingD)
+
+    if 'server_timing' not in timingD:
+        return headersL
+
+    return headersL + [('Server-Timing', timingD['server_timing'])]
+
+# =============================================================================
+def metricsResponse (start_response):
+
+    body = wellMetrics.metricsText(responseCache.statistics()).encode('utf-8')
+
+    start_response('200 OK', [
+        ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+        ('Content-Length', str(len(body)))
+    ])
+
+    return [body]
+
+# =============================================================================
+def application (environ, start_response):
+
+    # A request that raised must not leave its timer to the next request of
+    #  the thread
+    #
+    try:
+        return routeRequest(environ, start_response)
+    finally:
+        wellTiming.clearRequest()
+
+# =============================================================================
+def routeRequest (environ, start_response):
+
+    script  = environ.get('PATH_INFO', '').rstrip('/').split('/')[-1]
+    handler, kind = routesD.get(script, (None, None))
+
+    if script == 'metrics' and wellMetrics.metricsEnabled:
+        return metricsResponse(start_response)
+
+    if handler is None and script not in [crossReferenceScript, filterScript, exportScript]:
+        message = "Unknown request %s" % environ.get('PATH_INFO', '')
+        wellMetrics.recordStatus('unknown', '404')
+        return jsonResponse(start_response, '404 Not Found', usgsWellData.messageJson(message))
+
+    params = usgsWellData.queryParameters(environ.get('QUERY_STRING', ''))
+
+    # Id translations are answered from the cross-reference indexes alone
+    #
+    if script == crossReferenceScript:
+        return crossReferenceResponse(start_response, params)
+
+    # Depth and code filters are answered from the interval indexes alone
+    #
+    if script == filterScript:
+        return filterResponse(start_response, params)
+
+    # Exports stream every well, or a network, in one pass over the tables
+    #
+    if script == exportScript:
+        return exportResponse(start_response, params, environ.get('HTTP_ACCEPT_ENCODING'))
+
+    if 'site_no' not in params:
+        message = "Requires a NWIS site number"
+        wellMetrics.recordStatus(kind, 'error')
+        wellMetrics.recordError(kind, message)
+        return jsonResponse(start_response, '200 OK', usgsWellData.messageJson(message))
+
+    startTimer(kind, params['site_no'])
+
+    # The generic table endpoint selects tables, the others sections
+    #
+    selection    = params.get('tables' if kind == 'table' else 'sections', '')
+
+    # Answer a revalidation before loading or reading anything
+    #
+    validatorsD  = usgsWellData.responseValidators(kind, params['site_no'], selection)
+    headersL     = usgsWellData.validatorHeaders(validatorsD)
+    data_version = validatorsD['version']
+
+    if usgsWellData.notModified(validatorsD,
+                                environ.get('HTTP_IF_NONE_MATCH'),
+                                environ.get('HTTP_IF_MODIFIED_SINCE')):
+        start_response('304 Not Modified', timedHeaders(headersL, '304'))
+        return []
+
+    with wellTiming.phase('load'):
+        loadService(data_version)
+
+    # Response already rendered by this process
+    #
+    key        = (kind, params['site_no'], selection)
+    with wellTiming.phase('lru'):
+        jsonOutput = responseCache.get(key, data_version)
+    wellMetrics.recordCache('lru', jsonOutput is not None)
+
+    # Pre-rendered response when the pack is current
+    #
+    if jsonOutput is None and len(selection) < 1 and kind in nwisResponseCache.responseKindsL:
+        with wellTiming.phase('pack'):
+            cached = nwisResponseCache.cachedResponse(kind, params['site_no'])
+        wellMetrics.recordCache('pack', cached is not None)
+        if cached is not None:
+            jsonOutput = cached
+            responseCache.put(key, data_version, jsonOutput)
+
+    if jsonOutput is not None:
+        return jsonResponse(start_response, '200 OK', jsonOutput, timedHeaders(headersL, '200'))
+
+    # Errors are reported in the message document like the CGI scripts
+    #
+    try:
+        jsonOutput = handler(params['site_no'], params)
+        responseCache.put(key, data_version, jsonOutput)
+    except usgsWellData.WellDataError as e:
+        screen_logger.info(str(e))
+        wellMetrics.recordError(kind, str(e))
+        return jsonResponse(start_response, '200 OK', usgsWellData.messageJson(str(e)), timedHeaders([], 'error'))
+    except Exception as e:
+        screen_logger.exception(e)
+        wellMetrics.recordError(kind, 'An error occurred: %s' % e)
+        return jsonResponse(start_response, '200 OK', usgsWellData.messageJson('An error occurred: %s' % e), timedHeaders([], 'error'))
+
+    return jsonResponse(start_response, '200 OK', jsonOutput, timedHeaders(headersL, '200'))
+
+# =============================================================================
+
+# ----------------------------------------------------------------------
+# -- Main program
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+
+    import argparse
+
+    from socketserver import ThreadingMixIn
+
+    from wsgiref.simple_server import make_server, WSGIServer
+
+    # -- Set logging file
+    #
+    # Create screen handler
+    #
+    formatter     = logging.Formatter(fmt='%(message)s')
+    console       = logging.StreamHandler()
+    console.setFormatter(formatter)
+    screen_logger.addHandler(console)
+    screen_logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description=program)
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', default=8080, type=int, help='Port to listen on')
+    parser.add_argument('--cache-entries', default=responseCache.max_entries, type=int, help='Most responses kept in memory')
+    parser.add_argument('--cache-bytes', default=responseCache.max_bytes, type=int, help='Most bytes of responses kept in memory')
+    parser.add_argument('--timing', action='store_true', help='Send Server-Timing headers and log the phases of every request')
+    parser.add_argument('--no-metrics', action='store_true', help='Keep no request metrics and do not serve /metrics')
+    parser.add_argument('--max-age', default=usgsWellData.cache_max_age, type=int, help='Cache-Control max-age in seconds')
+    parser.add_argument('--lookup', default=nwisTables.lookupMode, choices=['snapshot', 'index', 'bisect', 'sqlite', 'memory', 'scan'],
+                        help='NWIS table lookup mode; memory holds the tables as typed arrays')
+    parser.add_argument('--workers', default=0, type=int, help='Prefork this many worker processes sharing the loaded data')
+    parser.add_argument('--reload-interval', default=2.0, type=float, help='Seconds between data version checks of the prefork master')
+    parser.add_argument('--table-threads', default=usgsWellData.table_threads, type=int, help='Threads reading the NWIS tables of a request; 1 reads them in turn')
+    args = parser.parse_args()
+
+    nwisTables.lookupMode = args.lookup
+
+    usgsWellData.cache_max_age = args.max_age
+    usgsWellData.table_threads = args.table_threads
+    if args.timing:
+        wellTiming.timingEnabled = True
+    if args.no_metrics:
+        wellMetrics.metricsEnabled = False
+
+    responseCache.max_entries = args.cache_entries
+    responseCache.max_bytes   = args.cache_bytes
+
+    class ThreadingWSGIServer (ThreadingMixIn, WSGIServer):
+
+        daemon_threads = True
+
+    # Prefork pool; the master loads the data and the workers serve
+    #
+    if args.workers > 0:
+        import wellPrefork
+
+        httpd = make_server(args.host, args.port, application, server_class=wellPrefork.PreforkWSGIServer)
+        screen_logger.info('%s %s listening on %s:%d' % (program, version, args.host, args.port))
+        wellPrefork.servePrefork(httpd, args.workers, loadService, args.reload_interval)
+        sys.exit()
+
+    loadService()
+
+    httpd = make_server(args.host, args.port, application, server_class=ThreadingWSGIServer)
+    screen_logger.info('%s %s listening on %s:%d' % (program, version, args.host, args.port))
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    sys.exit()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: wellTiming.py
+#
+# Project:  wellConstruction
+# Purpose:  Module records the time spent in each phase of a well request
+#            and the rows read per NWIS table, for Server-Timing headers and
+#            one structured log line per request.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# Timing is off unless WELL_TIMING is set (or the service is started with
+#  --timing). While it is off no timer exists: phase() hands back one shared
+#  no-op context and rows() returns at once, so the instrumented code paths
+#  do no timing work at all. The service also keeps a timer per request
+#  while its metrics are on (see wellMetrics.py), but only logs and sends
+#  headers with timing on.
+#
+# When it is on, each request gets a timer held per thread. Phases such as
+#  definitions, aquifers, the table lookups (gw_cons, ...) and render are
+#  summed by name, and the rows matched and scanned are counted per table.
+#  The finished request is written as one JSON log line
+#
+#    {"timing": {"endpoint": "construction", "site_no": "...",
+#                "total_ms": 1.9, "phases": {...}, "tables": {...}}}
+#
+#  and returned as a Server-Timing header value
+#
+#    definitions;dur=0.41, gw_cons;dur=0.12;desc="1 rows", ..., total;dur=1.9
+#
+###############################################################################
+
+import os
+
+import time
+
+import json
+
+import threading
+
+timingEnabled = os.environ.get('WELL_TIMING', '') not in ['', '0']
+
+# Timer of the request being answered by this thread
+#
+timingLocal   = threading.local()
+
+# =============================================================================
+class NullPhase:
+
+    def __enter__ (self):
+
+        return self
+
+    def __exit__ (self, *excL):
+
+        return False
+
+nullPhase = NullPhase()
+
+# =============================================================================
+class TimedPhase:
+
+    __slots__ = ['timer', 'name', 'start']
+
+    def __init__ (self, timer, name):
+
+        self.timer = timer
+        self.name  = name
+
+    def __enter__ (self):
+
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__ (self, *excL):
+
+        phasesD            = self.timer.phasesD
+        phasesD[self.name] = phasesD.get(self.name, 0.0) + time.perf_counter() - self.start
+
+        return False
+
+# =============================================================================
+class RequestTimer:
+
+    def __init__ (self, endpoint, site_no=None):
+
+        self.endpoint = endpoint
+        self.site_no  = site_no
+        self.started  = time.perf_counter()
+        self.phasesD  = {}
+        self.tablesD  = {}
+
+    # -------------------------------------------------------------------------
+    def phase (self, name):
+
+        return TimedPhase(self, name)
+
+    # -------------------------------------------------------------------------
+    def rows (self, table_nm, matched, scanned=None):
+
+        tableD = self.tablesD.setdefault(table_nm, {'matched': 0, 'scanned': 0})
+        tableD['matched'] += matched
+        tableD['scanned'] += matched if scanned is None else scanned
+
+    # -------------------------------------------------------------------------
+    def record (self, status):
+
+        return {
+            'endpoint': self.endpoint,
+            'site_no':  self.site_no,
+            'status':   status,
+            'total_ms': round((time.perf_counter() - self.started) * 1000.0, 3),
+            'phases':   dict([(name, round(seconds * 1000.0, 3)) for name, seconds in self.phasesD.items()]),
+            'tables':   self.tablesD
+        }
+
+    # -------------------------------------------------------------------------
+    def serverTiming (self, recordD):
+
+        metricsL = []
+        for name, duration in recordD['phases'].items():
+            metric = '%s;dur=%s' % (name, duration)
+            if name in self.tablesD:
+                metric += ';desc="%d rows"' % self.tablesD[name]['matched']
+            metricsL.append(metric)
+        metricsL.append('total;dur=%s' % recordD['total_ms'])
+
+        return ', '.join(metricsL)
+
+# =============================================================================
+def processSeconds ():
+
+    # Time since the interpreter was started, from the process start time
+    #  in clock ticks after boot (Linux only)
+    #
+    try:
+        with open('/proc/self/stat', 'r') as fh:
+            started = int(fh.read().rsplit(')', 1)[1].split()[19]) / os.sysconf('SC_CLK_TCK')
+        with open('/proc/uptime', 'r') as fh:
+            uptime = float(fh.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return max(0.0, uptime - started)
+
+# =============================================================================
+def startRequest (endpoint, site_no=None, interpreter=False, collect=False):
+
+    # A timer is also kept without timing output when the caller collects
+    #  the records itself (service metrics)
+    #
+    if not (timingEnabled or collect):
+        return None
+
+    timer = RequestTimer(endpoint, site_no)
+
+    # A CGI process also reports the interpreter start up to this point
+    #
+    if interpreter:
+        seconds = processSeconds()
+        if seconds is not None:
+            timer.phasesD['startup'] = seconds
+
+    timingLocal.timer = timer
+
+    return timer
+
+# =============================================================================
+def active ():
+
+    return getattr(timingLocal, 'timer', None)
+
+# =============================================================================
+def phase (name):
+
+    timer = active()
+    if timer is None:
+        return nullPhase
+
+    return timer.phase(name)
+
+# =============================================================================
+def rows (table_nm, matched, scanned=None):
+
+    timer = active()
+    if timer is not None:
+        timer.rows(table_nm, matched, scanned)
+
+# =============================================================================
+def runWith (timer, function, *argsL):
+
+    # Run part of a request on a pool thread under the request's timer
+    #
+    timingLocal.timer = timer
+    try:
+        return function(*argsL)
+    finally:
+        timingLocal.timer = None
+
+# =============================================================================
+def resumeRequest (timer):
+
+    # Continue a request on the thread sending its streamed response
+    #
+    timingLocal.timer = timer
+
+# =============================================================================
+def clearRequest ():
+
+    timingLocal.timer = None
+
+# =============================================================================
+def finishRequest (status='200'):
+
+    # Close the request timer; with timing on the request is logged and the
+    #  record carries its Server-Timing header value
+    #
+    timer = active()
+    if timer is None:
+        return None
+
+    timingLocal.timer = None
+
+    recordD = timer.record(status)
+    if timingEnabled:
+        import usgsWellData
+        usgsWellData.screenLogger().info(json.dumps({'timing': recordD}))
+        recordD['server_timing'] = timer.serverTiming(recordD)
+
+    return recordD
@@ -292,6 +292,40 @@ $(document).ready(function() {
         }));
     }
 
+    // Request for the USGS well of an OWRD well log id
+    //
+    if(coop_site_no && !site_no) {
+        var request_type = "GET";
+        var script_http  = `/cgi-bin/lithology/requestUsgsCrossReference.py?coop_site_no=${coop_site_no}&sections=well_construction,gw_geoh`
+        var data_http    = '';
+        var dataType     = "json";
+
+        // Web request
+        //
+        webRequests.push($.ajax( {
+            method:   request_type,
+            url:      script_http,
+            data:     data_http,
+            dataType: dataType,
+            success: function (myData) {
+                let siteList = [];
+                if(myData.coop_site_no) { siteList = Object.values(myData.coop_site_no)[0] || []; }
+                myLogger.info(`USGS sites for OWRD ${coop_site_no} ${siteList}`);
+
+                // No USGS well holds this OWRD well log id
+                //
+                if(siteList.length < 1 || !myData.wells || !myData.wells[siteList[0]]) { return; }
+
+                site_no = siteList[0];
+                [usgsWellConstruction, usgsConstructionLegend, usgsWellDepth, usgsWellDia] = processUsgsConstructionService(myData.wells[site_no], myConstructionLookup);
+                [usgsLithologyInfo, usgsLithologyLegend, usgsLithDepth] = processUsgsLithService(myData.wells[site_no], myLithologyLookup);
+            },
+            error: function (error) {
+                myLogger.info(`No USGS well for OWRD ${coop_site_no} ${error.status} ${error.statusText}`);
+            }
+        }));
+    }
+
     // Request for USGS information
     //
     if(site_no) {
@@ -327,10 +361,10 @@ $(document).ready(function() {
             }
         }));
         
-        // Request for USGS well construction information
+        // Request for USGS well construction and geohydrology information
         //
         var request_type = "GET";
-        var script_http  = `/cgi-bin/lithology/requestUsgsConstruction.py?site_no=${site_no}`
+        var script_http  = `/cgi-bin/lithology/requestUsgsWell.py?site_no=${site_no}`
         var data_http    = '';
         var dataType     = "json";
 
@@ -352,41 +386,14 @@ $(document).ready(function() {
                 myLogger.info(usgsConstructionLegend);
                 myLogger.info(usgsWellDepth);
                 myLogger.info(usgsWellDia);
-            },
-            error: function (error) {
-                message = `Failed to load USGS well construction information for site ${site_no} ${error.status} ${error.statusText}`;
-                updateModal(message);
-                fadeModal(2000);
-                failRequest = message;
-            }
-        }));
-        
-        // Request for USGS geohydrology information
-        //
-        var request_type = "GET";
-        var script_http  = `/cgi-bin/lithology/requestUsgsGeohydrology.py?site_no=${site_no}`
-        var data_http    = '';
-        var dataType     = "json";
-
-        // Web request
-        //
-        webRequests.push($.ajax( {
-            method:   request_type,
-            url:      script_http,
-            data:     data_http,
-            dataType: dataType,
-            success: function (myData) {
-                //message = "Processed USGS geohydrology information for site ${site_no}";
-                //updateModal(message);
                 [usgsLithologyInfo, usgsLithologyLegend, usgsLithDepth] = processUsgsLithService(myData, myLithologyLookup);
-                //usgsWellConstruction = myData;
                 myLogger.info(`usgsLithologyInfo`);
                 myLogger.info(usgsLithologyInfo);
                 myLogger.info(usgsLithologyLegend);
                 myLogger.info(usgsLithDepth);
             },
             error: function (error) {
-                message = `Failed to load USGS geohydrology information for site ${site_no} ${error.status} ${error.statusText}`;
+                message = `Failed to load USGS well construction and geohydrology information for site ${site_no} ${error.status} ${error.statusText}`;
                 updateModal(message);
                 fadeModal(2000);
                 failRequest = message;
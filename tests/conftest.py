@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: conftest.py
+#
+# Project:  wellConstruction
+# Purpose:  Test set up; the shipped NWIS extract is copied to a temporary
+#            data directory where the indexes, snapshots, database and
+#            response pack are built.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+#
+# The modules read WELL_DATA_DIR when they are imported, so it is pointed
+#  at a copy of the shipped files before any test module imports them. The
+#  generated files, the SQLite database among them, are built there once
+#  per session by the fixtures below, leaving cgi-bin/data untouched:
+#
+#    python -m pytest -q tests
+#
+###############################################################################
+
+import os, sys
+
+import glob
+
+import shutil
+
+import tempfile
+
+import pytest
+
+cgi_dir     = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cgi-bin')
+shipped_dir = os.path.join(cgi_dir, 'data')
+test_dir    = tempfile.mkdtemp(prefix='nwis_tests.')
+data_dir    = os.path.join(test_dir, 'data')
+
+# Files of the extract as shipped; everything else is generated
+#
+shippedL    = ['gw_*.txt', 'aqfr_cd_query.txt', 'well_construction_lookup.json']
+
+os.mkdir(data_dir)
+for pattern in shippedL:
+    for shipped_file in glob.glob(os.path.join(shipped_dir, pattern)):
+        shutil.copy2(shipped_file, data_dir)
+
+os.environ['WELL_DATA_DIR'] = data_dir
+for name in ['NWIS_SQLITE', 'NWIS_LOOKUP', 'NWIS_STATE_CD', 'WELL_TIMING', 'WELL_METRICS', 'WELL_TABLE_THREADS',
+             'WELL_CACHE_MAX_AGE']:
+    os.environ.pop(name, None)
+
+sys.path.insert(0, cgi_dir)
+
+# =============================================================================
+@pytest.fixture(scope='session', autouse=True)
+def testData ():
+
+    yield data_dir
+
+    shutil.rmtree(test_dir, ignore_errors=True)
+
+# =============================================================================
+@pytest.fixture(scope='session')
+def nwisFiles ():
+
+    import usgsWellData, nwisRegistry
+
+    return [usgsWellData.nwisFileName(table_nm) for table_nm in nwisRegistry.registeredTables()]
+
+# =============================================================================
+@pytest.fixture(scope='session')
+def indexes (nwisFiles):
+
+    import nwisTables
+
+    for nwis_file in nwisFiles:
+        nwisTables.writeNwisIndex(nwis_file, nwisTables.buildNwisIndex(nwis_file))
+
+    return nwisFiles
+
+# =============================================================================
+@pytest.fixture(scope='session')
+def snapshots (nwisFiles):
+
+    import nwisSnapshot
+
+    for nwis_file in nwisFiles:
+        metaD, bytesL = nwisSnapshot.buildSnapshot(nwis_file)
+        nwisSnapshot.writeSnapshot(nwis_file, metaD, bytesL)
+
+    return nwisFiles
+
+# =============================================================================
+@pytest.fixture(scope='session')
+def database (indexes):
+
+    import nwisSqlite
+
+    nwisSqlite.importDatabase(data_dir, nwisSqlite.database_file)
+
+    return nwisSqlite.database_file
+
+# =============================================================================
+@pytest.fixture(scope='session')
+def codeTables ():
+
+    import usgsWellData
+
+    return usgsWellData.loadDefinitions(), usgsWellData.loadAquifers()
+
+# =============================================================================
+@pytest.fixture(scope='session')
+def responsePack (indexes, snapshots):
+
+    import nwisResponseCache
+
+    pack_file, metaD, skippedD = nwisResponseCache.buildCache()
+
+    return pack_file, metaD, skippedD
+
+# =============================================================================
+@pytest.fixture(scope='session')
+def siteNumbers (indexes):
+
+    import usgsWellData, nwisRegistry, nwisTables
+
+    siteS = set()
+    for table_nm in nwisRegistry.registeredTables():
+        siteS.update(nwisTables.loadNwisIndex(usgsWellData.nwisFileName(table_nm))['sites'])
+
+    return sorted(siteS)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_aquifers.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the state partitions of the aquifer code table name
+#            every code as a full read of the table does.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os
+
+import pytest
+
+import nwisAquifers
+
+import nwisSqlite
+
+import usgsWellData
+
+# Codes used by several states: a state name wins over the national one,
+#  the national one over other states and the last name given otherwise
+#
+aquiferRowsL = [('00', 'A', 'National A'),
+                ('41', 'A', 'Oregon A'),
+                ('06', 'A', 'California A'),
+                ('06', 'B', 'California B'),
+                ('53', 'B', 'Washington B'),
+                ('00', 'C', 'National C'),
+                ('41', 'D', 'Oregon D'),
+                ('41', 'E', 'Oregon E'),
+                ('00', 'E', 'National E')]
+
+# Names each state is expected to get
+#
+expectedD    = {
+    '41': {'A': 'Oregon A',     'B': 'Washington B', 'C': 'National C', 'D': 'Oregon D', 'E': 'Oregon E'},
+    '06': {'A': 'California A', 'B': 'California B', 'C': 'National C', 'D': 'Oregon D', 'E': 'National E'},
+    '53': {'A': 'National A',   'B': 'Washington B', 'C': 'National C', 'D': 'Oregon D', 'E': 'National E'},
+    '99': {'A': 'National A',   'B': 'Washington B', 'C': 'National C', 'D': 'Oregon D', 'E': 'National E'}
+}
+
+# =============================================================================
+def writeAquiferFile (aqfr_file, rowsL):
+
+    with open(aqfr_file, 'w') as fh:
+        fh.write('# aquifer codes\n#\nstate_cd\taqfr_cd\taqfr_nm\n2s\t8s\t70s\n')
+        for rowT in rowsL:
+            fh.write('\t'.join(rowT) + '\n')
+
+# =============================================================================
+def codeNames (aqfrInfoD, codesL):
+
+    # Codes are resolved by index, as the records look them up
+    #
+    namesD = {}
+    for aqfr_cd in codesL:
+        try:
+            namesD[aqfr_cd] = aqfrInfoD[aqfr_cd]
+        except KeyError:
+            namesD[aqfr_cd] = None
+
+    return namesD
+
+# =============================================================================
+@pytest.mark.parametrize('state_cd', sorted(expectedD))
+def test_statePrecedence (tmp_path, state_cd):
+
+    aqfr_file = str(tmp_path / 'aqfr_cd_query.txt')
+    writeAquiferFile(aqfr_file, aquiferRowsL)
+
+    codesL    = sorted(expectedD[state_cd]) + ['Z']
+    aqfrInfoD = nwisAquifers.stateAquifers(aqfr_file, state_cd)
+
+    assert isinstance(aqfrInfoD, nwisAquifers.StateAquifers)
+    assert os.path.exists(nwisAquifers.aquiferFileName(aqfr_file))
+    assert codeNames(aqfrInfoD, codesL) == dict(expectedD[state_cd], Z=None)
+    assert codeNames(usgsWellData.processAqfrCodes(aqfr_file, state_cd), codesL) == dict(expectedD[state_cd], Z=None)
+
+    # Codes resolved through the national or last-name partitions are kept
+    #
+    assert set(expectedD[state_cd]) <= set(aqfrInfoD.keys())
+
+# =============================================================================
+def test_staleCompiledFile (tmp_path):
+
+    aqfr_file = str(tmp_path / 'aqfr_cd_query.txt')
+    writeAquiferFile(aqfr_file, aquiferRowsL)
+    assert nwisAquifers.stateAquifers(aqfr_file, '41')['A'] == 'Oregon A'
+
+    # An edited code table is compiled again on first use
+    #
+    writeAquiferFile(aqfr_file, aquiferRowsL + [('41', 'A', 'Oregon A, edited')])
+    os.utime(aqfr_file, ns=(0, os.stat(aqfr_file).st_mtime_ns + 1000))
+    assert nwisAquifers.stateAquifers(aqfr_file, '41')['A'] == 'Oregon A, edited'
+
+    metaD, viewsD, mm = nwisAquifers.nwisSnapshot.mapPacked(nwisAquifers.aquiferFileName(aqfr_file),
+                                                             nwisAquifers.aquiferMagic, nwisAquifers.aquiferVersion)
+    assert metaD['stamp'] == nwisAquifers.nwisTables.sourceStamp(aqfr_file)
+
+# =============================================================================
+@pytest.mark.parametrize('state_cd', ['41', '06', '53', '00'])
+def test_shippedPartitions (database, state_cd):
+
+    # Every code of the shipped table, from the partitions, a full read
+    #  and the SQLite table; the full read also keeps the column types line
+    #
+    aqfr_file = usgsWellData.aqfr_lookup_file
+    codesL    = sorted(set(usgsWellData.processAqfrCodes(aqfr_file)) - {'8s'})
+    namesD    = codeNames(usgsWellData.processAqfrCodes(aqfr_file, state_cd), codesL)
+
+    assert codeNames(nwisAquifers.stateAquifers(aqfr_file, state_cd), codesL) == namesD
+    assert codeNames(nwisSqlite.AquiferNames(state_cd), codesL) == namesD
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_codes.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that a code missing from its definitions is reported as a
+#            data error before any part of a document is written.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, sys
+
+import glob
+
+import json
+
+import shutil
+
+import subprocess
+
+import pytest
+
+import nwisSchema
+
+import usgsWellData
+
+from tests.conftest import cgi_dir
+
+# =============================================================================
+def codedSite (table_nm, code_nm, requiredL):
+
+    # First site with a record that shows the code
+    #
+    columnsL = ['site_no', code_nm] + requiredL
+    for recordT in nwisSchema.tableRows(usgsWellData.nwisFileName(table_nm), columnsL):
+        if None not in recordT:
+            return recordT[0], recordT[1]
+
+# =============================================================================
+@pytest.mark.parametrize('table_nm, code_nm, requiredL', usgsWellData.code_joinsL)
+def test_unknownCodeRaisesBeforeWriting (indexes, codeTables, table_nm, code_nm, requiredL):
+
+    definitionsD, aqfrInfoD = codeTables
+    site_no, code           = codedSite(table_nm, code_nm, requiredL)
+
+    missingD          = dict(definitionsD)
+    missingD[code_nm] = dict([(key, value) for key, value in definitionsD[code_nm].items() if key != code])
+    message           = 'No description for %s %s' % (code_nm, code)
+
+    # Each output that holds the table raises before its writer is returned
+    #
+    outputsL = [lambda site: usgsWellData.wellOutput(site, usgsWellData.wellSections(''), missingD, aqfrInfoD)]
+    if table_nm in usgsWellData.construction_tablesL:
+        outputsL.append(lambda site: usgsWellData.constructionOutput(site, missingD))
+    else:
+        outputsL.append(lambda site: usgsWellData.geohydrologyOutput(site, missingD, aqfrInfoD))
+
+    for output in outputsL:
+        for site in [site_no, '%s,%s' % (site_no, site_no)]:
+            with pytest.raises(usgsWellData.WellDataError) as error:
+                output(site)
+            assert str(error.value) == message
+
+    # The generic tables leave the description empty
+    #
+    tablesD = json.loads(usgsWellData.tablesJson(site_no, [table_nm], missingD, aqfrInfoD))
+    assert None in [recordD.get(code_nm.replace('_cd', '_ds')) for recordD in tablesD[table_nm] if recordD[code_nm] == code]
+
+# =============================================================================
+def test_unknownCodeAnsweredByScript (testData, tmp_path):
+
+    # The construction script with a seal code missing from the lookup file
+    #  answers the message document, not a cut off one
+    #
+    data_dir = str(tmp_path / 'data')
+    os.makedirs(data_dir)
+    for source_file in glob.glob(os.path.join(testData, 'gw_*.txt')) + [os.path.join(testData, 'aqfr_cd_query.txt')]:
+        shutil.copy2(source_file, data_dir)
+
+    site_no, code = codedSite('gw_cons', 'seal_cd', [])
+    with open(os.path.join(testData, 'well_construction_lookup.json'), 'r') as fh:
+        jsonD = json.load(fh)
+    del jsonD['seal_cd']['Codes'][code]
+    with open(os.path.join(data_dir, 'well_construction_lookup.json'), 'w') as fh:
+        json.dump(jsonD, fh)
+
+    environ = dict(os.environ, WELL_DATA_DIR=data_dir, QUERY_STRING='site_no=%s' % site_no)
+    result  = subprocess.run([sys.executable, 'requestUsgsConstruction.py'], cwd=cgi_dir, env=environ,
+                             capture_output=True, text=True)
+
+    headers, body = result.stdout.split('\n\n', 1)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(body) == {'message': 'No description for seal_cd %s' % code}
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_conditional.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests the entity tags of the WSGI service and its 304 answers to
+#            If-None-Match and If-Modified-Since revalidations.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import pytest
+
+import usgsWellData
+
+import wellService
+
+# =============================================================================
+def serviceRequest (script, query, **headersD):
+
+    # One request through the WSGI application; the status and headers are
+    #  returned with the joined body
+    #
+    environ = {'PATH_INFO': '/' + script, 'QUERY_STRING': query}
+    environ.update(headersD)
+
+    responseL = []
+    def start_response (status, headersL):
+        responseL.extend([status, dict(headersL)])
+
+    body = b''.join(wellService.application(environ, start_response))
+
+    return responseL[0], responseL[1], body
+
+# =============================================================================
+@pytest.fixture(scope='module')
+def siteRequest (indexes, siteNumbers):
+
+    query = 'site_no=%s' % siteNumbers[0]
+    status, headersD, body = serviceRequest('requestUsgsWell.py', query)
+
+    assert status == '200 OK'
+    assert len(body) > 0
+    for header in ['ETag', 'Last-Modified', 'Cache-Control']:
+        assert header in headersD
+
+    return query, headersD
+
+# =============================================================================
+def test_entityTagIsStable (siteRequest):
+
+    query, headersD = siteRequest
+
+    status, repeatD, body = serviceRequest('requestUsgsWell.py', query)
+    assert status == '200 OK'
+    assert repeatD['ETag'] == headersD['ETag']
+    assert repeatD['Last-Modified'] == headersD['Last-Modified']
+
+# =============================================================================
+@pytest.mark.parametrize('if_none_match', ['%s', 'W/%s', '*', '"0123", %s', ' %s ,"0123"'])
+def test_ifNoneMatchIsNotModified (siteRequest, if_none_match):
+
+    query, headersD = siteRequest
+
+    tag = if_none_match.replace('%s', headersD['ETag'])
+    status, notModifiedD, body = serviceRequest('requestUsgsWell.py', query, HTTP_IF_NONE_MATCH=tag)
+
+    assert status == '304 Not Modified'
+    assert body == b''
+    assert notModifiedD['ETag'] == headersD['ETag']
+    assert 'Content-Length' not in notModifiedD
+
+# =============================================================================
+@pytest.mark.parametrize('if_none_match', ['"0123"', 'W/"0123"', ''])
+def test_otherEntityTagIsAnswered (siteRequest, if_none_match):
+
+    query, headersD = siteRequest
+
+    status, answerD, body = serviceRequest('requestUsgsWell.py', query, HTTP_IF_NONE_MATCH=if_none_match)
+    assert status == '200 OK'
+    assert len(body) > 0
+
+# =============================================================================
+def test_ifModifiedSince (siteRequest):
+
+    query, headersD = siteRequest
+    modified        = usgsWellData.responseValidators('well', query.split('=')[1])['modified']
+
+    status, answerD, body = serviceRequest('requestUsgsWell.py', query, HTTP_IF_MODIFIED_SINCE=headersD['Last-Modified'])
+    assert status == '304 Not Modified'
+
+    status, answerD, body = serviceRequest('requestUsgsWell.py', query, HTTP_IF_MODIFIED_SINCE=usgsWellData.httpDate(modified + 3600))
+    assert status == '304 Not Modified'
+
+    # Older dates and dates that cannot be parsed are answered in full
+    #
+    for if_modified_since in [usgsWellData.httpDate(modified - 1), 'yesterday', '']:
+        status, answerD, body = serviceRequest('requestUsgsWell.py', query, HTTP_IF_MODIFIED_SINCE=if_modified_since)
+        assert status == '200 OK'
+        assert len(body) > 0
+
+    # If-None-Match takes precedence over If-Modified-Since
+    #
+    status, answerD, body = serviceRequest('requestUsgsWell.py', query,
+                                           HTTP_IF_NONE_MATCH='"0123"',
+                                           HTTP_IF_MODIFIED_SINCE=headersD['Last-Modified'])
+    assert status == '200 OK'
+
+# =============================================================================
+def test_entityTagFollowsRequest (siteRequest, siteNumbers):
+
+    query, headersD = siteRequest
+    site_no         = siteNumbers[0]
+
+    # Another kind, selection or site is another entity
+    #
+    tagsL = [headersD['ETag']]
+    for script, query in [('requestUsgsConstruction.py', 'site_no=%s' % site_no),
+                          ('requestUsgsGeohydrology.py', 'site_no=%s' % site_no),
+                          ('requestUsgsTable.py',        'site_no=%s' % site_no),
+                          ('requestUsgsWell.py',         'site_no=%s&sections=well_construction' % site_no),
+                          ('requestUsgsWell.py',         'site_no=%s' % siteNumbers[1])]:
+        status, answerD, body = serviceRequest(script, query, HTTP_IF_NONE_MATCH=headersD['ETag'])
+        assert status == '200 OK'
+        tagsL.append(answerD['ETag'])
+
+    assert len(set(tagsL)) == len(tagsL)
+
+# =============================================================================
+def test_entityTagFollowsData (siteNumbers):
+
+    # A replaced data file changes the version and with it every tag
+    #
+    stampsL   = usgsWellData.dataStamps()
+    replacedL = [list(stampL) for stampL in stampsL]
+    replacedL[0][2] = (replacedL[0][2] or 0) + 1
+
+    currentD  = usgsWellData.responseValidators('well', siteNumbers[0], '', stampsL)
+    replacedD = usgsWellData.responseValidators('well', siteNumbers[0], '', replacedL)
+
+    assert currentD['version'] != replacedD['version']
+    assert currentD['etag'] != replacedD['etag']
+    assert not usgsWellData.notModified(replacedD, currentD['etag'])
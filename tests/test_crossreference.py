@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_crossreference.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the cross reference indexes translate every OWRD well
+#            log id and other agency id of the NWIS tables in both directions.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+
+import os
+
+import json
+
+import shutil
+
+import pytest
+
+import nwisCrossReference
+
+import nwisSchema
+
+import usgsWellData
+
+# =============================================================================
+@pytest.mark.parametrize('identifier, key', [('DESC0008977',   'DESC0008977'),
+                                             ('desc 8977',     'DESC0008977'),
+                                             ('DESC  8977',    'DESC0008977'),
+                                             (' Desc0008977 ', 'DESC0008977'),
+                                             ('CDWR 49906',    'CDWR0049906'),
+                                             ('DESC 12345678', 'DESC 12345678'),
+                                             ('L50201',        'L50201'),
+                                             ('nhd   reach',   'NHD REACH')])
+def test_idKey (identifier, key):
+
+    assert nwisCrossReference.idKey(identifier) == key
+
+# =============================================================================
+def test_everyTableId (indexes):
+
+    crossD = nwisCrossReference.loadCrossReference()
+
+    # Each id is found as written in NWIS and in lower case, OWRD ids also
+    #  padded apart, and the site lists it back
+    #
+    coopFile = usgsWellData.nwisFileName(nwisCrossReference.coop_table_nm)
+    for site_no, coop_site_no in nwisSchema.tableRows(coopFile, ['site_no', 'coop_site_no']):
+        if site_no is None or coop_site_no is None:
+            continue
+        valuesL = [coop_site_no, coop_site_no.lower()]
+        match   = nwisCrossReference.owrdPattern.match(nwisCrossReference.idKey(coop_site_no))
+        if match:
+            valuesL.append('%s  %d' % (match.group(1), int(match.group(2))))
+        for value in valuesL:
+            assert site_no in nwisCrossReference.translate(crossD, 'coop_site_no', [value])[value]
+        siteD = nwisCrossReference.translate(crossD, 'site_no', [site_no])[site_no]
+        assert nwisCrossReference.idKey(coop_site_no) in siteD['coop_site_no']
+
+    otidFile = usgsWellData.nwisFileName(nwisCrossReference.otid_table_nm)
+    for site_no, otid_id, assigner_nm in nwisSchema.tableRows(otidFile, ['site_no', 'otid_id', 'assigner_nm']):
+        if site_no is None or otid_id is None:
+            continue
+        assert site_no in nwisCrossReference.translate(crossD, 'otid_id', [otid_id.lower()])[otid_id.lower()]
+        siteD = nwisCrossReference.translate(crossD, 'site_no', [site_no])[site_no]
+        assert {'otid_id': otid_id.strip(), 'assigner_nm': assigner_nm} in siteD['otid_id']
+
+    # Unknown ids translate to nothing
+    #
+    assert nwisCrossReference.translate(crossD, 'coop_site_no', ['XXXX 1']) == {'XXXX 1': []}
+    assert nwisCrossReference.translate(crossD, 'site_no', ['1']) == {'1': {'coop_site_no': [], 'otid_id': []}}
+
+# =============================================================================
+def test_staleReference (tmp_path, monkeypatch):
+
+    # The tables are copied so the shared test data stay untouched
+    #
+    for table_nm in [nwisCrossReference.coop_table_nm, nwisCrossReference.otid_table_nm]:
+        shutil.copy2(usgsWellData.nwisFileName(table_nm), str(tmp_path))
+    monkeypatch.setattr(usgsWellData, 'data_dir', str(tmp_path))
+    monkeypatch.setattr(nwisCrossReference, 'reference_file', str(tmp_path / 'well_cross_reference.xref'))
+    monkeypatch.setattr(nwisCrossReference, 'referenceD', None)
+
+    coopFile = usgsWellData.nwisFileName(nwisCrossReference.coop_table_nm)
+    crossD   = nwisCrossReference.loadCrossReference()
+    assert os.path.exists(nwisCrossReference.reference_file)
+    assert 'ZZZZ0000001' not in crossD['coop_site_no']
+
+    # A new process reads the marshalled indexes without the tables
+    #
+    with monkeypatch.context() as m:
+        m.setattr(nwisCrossReference, 'referenceD', None)
+        m.setattr(nwisCrossReference, 'buildCrossReference', lambda *argsL: pytest.fail('indexes built again'))
+        assert nwisCrossReference.loadCrossReference() == crossD
+
+    # A changed table is read again, in this process and the next
+    #
+    with open(coopFile, 'a') as fh:
+        fh.write('USGS\t433233121300601\t9\tZZZZ     1\t\t\t\t\t\tL\t\t\t\t\n')
+    os.utime(coopFile, ns=(0, os.stat(coopFile).st_mtime_ns + 1000))
+
+    crossD = nwisCrossReference.loadCrossReference()
+    assert crossD['coop_site_no']['ZZZZ0000001'] == ['433233121300601']
+
+    monkeypatch.setattr(nwisCrossReference, 'referenceD', None)
+    monkeypatch.setattr(nwisCrossReference, 'buildCrossReference', lambda *argsL: pytest.fail('indexes built again'))
+    assert nwisCrossReference.loadCrossReference() == crossD
+
+# =============================================================================
+def test_crossReferenceSections (indexes):
+
+    definitionsD = usgsWellData.loadDefinitions()
+    aqfrInfoD    = usgsWellData.loadAquifers()
+    crossD       = nwisCrossReference.loadCrossReference()
+    sectionsL    = ['well_construction', 'gw_geoh']
+
+    # Two OWRD ids of different sites and one unknown id
+    #
+    coopL = []
+    for coop_site_no, siteL in crossD['coop_site_no'].items():
+        if len(siteL) == 1 and siteL[0] not in [crossD['coop_site_no'][value][0] for value in coopL]:
+            coopL.append(coop_site_no)
+        if len(coopL) > 1:
+            break
+    siteL = [crossD['coop_site_no'][value][0] for value in coopL]
+
+    params  = {'coop_site_no': ','.join(coopL + ['XXXX0000001']), 'sections': ','.join(sectionsL)}
+    outputD = json.loads(nwisCrossReference.crossReferenceJson(params, definitionsD, aqfrInfoD))
+
+    assert outputD['coop_site_no'] == dict([(value, [site_no]) for value, site_no in zip(coopL, siteL)], XXXX0000001=[])
+    assert outputD['wells'] == json.loads(usgsWellData.wellJson(','.join(siteL), sectionsL, definitionsD, aqfrInfoD))
+
+    # One site is keyed like a batch
+    #
+    params  = {'site_no': siteL[0], 'sections': 'well_construction'}
+    outputD = json.loads(nwisCrossReference.crossReferenceJson(params, definitionsD))
+
+    assert outputD['site_no'][siteL[0]]['coop_site_no'] == [coopL[0]]
+    assert outputD['wells'] == {siteL[0]: json.loads(usgsWellData.wellJson(siteL[0], ['well_construction'], definitionsD))}
+
+    # No wells without sections or sites found
+    #
+    assert 'wells' not in json.loads(nwisCrossReference.crossReferenceJson({'coop_site_no': coopL[0]}))
+    assert 'wells' not in json.loads(nwisCrossReference.crossReferenceJson({'otid_id': 'XXXX', 'sections': 'gw_geoh'}))
+
+    with pytest.raises(usgsWellData.WellDataError):
+        nwisCrossReference.crossReferenceJson({})
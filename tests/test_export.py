@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_export.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the streamed NDJSON export holds the well document of
+#            each site as the well request answers it.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import gzip
+
+import json
+
+import pytest
+
+import nwisTables
+
+import nwisSchema
+
+import nwisExport
+
+import usgsWellData
+
+# =============================================================================
+def exportLines (params, definitionsD, aqfrInfoD, compress=False):
+
+    content_type, chunksI = nwisExport.exportStream(params, definitionsD, aqfrInfoD, compress)
+    content = b''.join(chunksI)
+    if compress:
+        content = gzip.decompress(content)
+
+    return content_type, content.decode('utf-8').splitlines()
+
+# =============================================================================
+def tableSites (table_nmL):
+
+    siteS = set()
+    for table_nm in table_nmL:
+        siteS.update(nwisTables.loadNwisIndex(usgsWellData.nwisFileName(table_nm))['sites'])
+
+    return siteS
+
+# =============================================================================
+def wellLine (site_no, sectionsL, definitionsD, aqfrInfoD):
+
+    # The well document with the site number as its first member, or the
+    #  message of the well request
+    #
+    try:
+        document = usgsWellData.wellJson(site_no, sectionsL, definitionsD, aqfrInfoD)
+    except usgsWellData.WellDataError as e:
+        return [('site_no', site_no), ('message', str(e))]
+
+    return [('site_no', site_no)] + json.loads(document, object_pairs_hook=list)
+
+# =============================================================================
+@pytest.mark.parametrize('sections', ['', 'well_construction', 'gw_geoh'])
+def test_exportMatchesWellJson (indexes, snapshots, codeTables, sections):
+
+    definitionsD, aqfrInfoD = codeTables
+    sectionsL               = usgsWellData.wellSections(sections)
+
+    content_type, linesL = exportLines({'sections': sections}, definitionsD, aqfrInfoD)
+    assert content_type == nwisExport.exportFormatsD['ndjson']
+
+    # Every site of the exported tables once, in site order
+    #
+    siteL = [json.loads(line)['site_no'] for line in linesL]
+    assert siteL == sorted(tableSites(usgsWellData.sectionTables(sectionsL)))
+
+    for site_no, line in zip(siteL, linesL):
+        assert json.loads(line, object_pairs_hook=list) == wellLine(site_no, sectionsL, definitionsD, aqfrInfoD), site_no
+
+# =============================================================================
+def test_exportReportsSiteErrors (indexes, snapshots, codeTables, responsePack):
+
+    definitionsD, aqfrInfoD    = codeTables
+    pack_file, metaD, skippedD = responsePack
+
+    # The sites the pack skips are exported with their message
+    #
+    content_type, linesL = exportLines({}, definitionsD, aqfrInfoD)
+    messagesD = dict([(lineD['site_no'], lineD['message']) for lineD in map(json.loads, linesL) if 'message' in lineD])
+
+    assert len(messagesD) > 0
+    assert messagesD == skippedD
+
+# =============================================================================
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+def test_exportUnknownCode (indexes, snapshots, codeTables, export_format):
+
+    definitionsD, aqfrInfoD = codeTables
+
+    # A lithology code dropped from its table fails the sites holding it
+    #  mid-stream; they are reported in NDJSON, left out of CSV, and the
+    #  export goes on
+    #
+    geohL    = [recordT for recordT in nwisSchema.tableRows(usgsWellData.nwisFileName('gw_geoh'), ['site_no', 'lith_cd']) if None not in recordT]
+    lith_cd  = geohL[len(geohL) // 2][1]
+    codeS    = set([site_no for site_no, code in geohL if code == lith_cd])
+
+    missingD            = dict(definitionsD)
+    missingD['lith_cd'] = dict([(key, value) for key, value in definitionsD['lith_cd'].items() if key != lith_cd])
+    message             = 'No description for lith_cd %s' % lith_cd
+
+    params               = {'format': export_format, 'sections': 'gw_geoh'}
+    content_type, linesL = exportLines(params, missingD, aqfrInfoD)
+    content_type, fullL  = exportLines(params, definitionsD, aqfrInfoD)
+
+    if export_format == 'ndjson':
+        siteL = [json.loads(line)['site_no'] for line in linesL]
+        assert siteL == [json.loads(line)['site_no'] for line in fullL]
+
+        # An earlier record of a site may fail on its aquifer name first
+        #
+        messagesL = [json.loads(line).get('message') for line in linesL if json.loads(line)['site_no'] in codeS]
+        assert None not in messagesL
+        assert message in messagesL
+        assert [line for line in linesL if json.loads(line)['site_no'] not in codeS] == \
+               [line for line in fullL if json.loads(line)['site_no'] not in codeS]
+    else:
+        assert linesL[0] == fullL[0]
+        assert len(linesL) < len(fullL)
+        assert linesL == [line for line in fullL if line.split(',')[0] not in codeS]
+
+# =============================================================================
+@pytest.mark.parametrize('params, accept_encoding, compress', [({},             None,                         False),
+                                                              ({},             'gzip',                       True),
+                                                              ({},             'deflate, GZIP;q=0.5',        True),
+                                                              ({},             'gzip;q=0',                   False),
+                                                              ({},             'gzip; q=0.000, br',          False),
+                                                              ({},             'x-gzip',                     True),
+                                                              ({},             '*',                          True),
+                                                              ({},             '*;q=1, gzip;q=0',            False),
+                                                              ({},             'identity',                   False),
+                                                              ({'gzip': '1'},  'gzip;q=0',                   True)])
+def test_exportCompressedEncoding (params, accept_encoding, compress):
+
+    assert nwisExport.exportCompressed(params, accept_encoding) is compress
+
+# =============================================================================
+def test_exportNetwork (indexes, snapshots, codeTables):
+
+    definitionsD, aqfrInfoD = codeTables
+    sectionsL               = usgsWellData.wellSections('')
+
+    networkS = set([site_no for site_no, netw_cd in nwisSchema.tableRows(usgsWellData.nwisFileName(nwisExport.network_table_nm), ['site_no', 'netw_cd'])
+                    if netw_cd == 'WL'])
+
+    content_type, linesL = exportLines({'netw_cd': 'wl'}, definitionsD, aqfrInfoD)
+    siteL = [json.loads(line)['site_no'] for line in linesL]
+
+    assert len(siteL) > 0
+    assert siteL == sorted(networkS & tableSites(usgsWellData.sectionTables(sectionsL)))
+    for site_no, line in zip(siteL, linesL):
+        assert json.loads(line, object_pairs_hook=list) == wellLine(site_no, sectionsL, definitionsD, aqfrInfoD), site_no
+
+# =============================================================================
+def test_exportCompressed (indexes, snapshots, codeTables):
+
+    definitionsD, aqfrInfoD = codeTables
+
+    # One gzip stream of the same lines
+    #
+    params = {'netw_cd': 'QW'}
+    assert exportLines(params, definitionsD, aqfrInfoD, True) == exportLines(params, definitionsD, aqfrInfoD)
+
+# =============================================================================
+@pytest.mark.parametrize('params', [{'format': 'xml'}, {'sections': 'wells'}, {'netw_cd': 'XX'}])
+def test_exportErrors (codeTables, params):
+
+    definitionsD, aqfrInfoD = codeTables
+
+    # Raised before the first chunk, so they are answered with a message
+    #
+    with pytest.raises(usgsWellData.WellDataError):
+        nwisExport.exportStream(params, definitionsD, aqfrInfoD)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_imports.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the CGI scripts start without the modules only some
+#            of their paths use.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, sys
+
+import subprocess
+
+import pytest
+
+import nwisResponseCache
+
+from tests.conftest import cgi_dir
+
+# Modules of the scripts and those imported only on the paths that use them
+#
+cgiModulesL    = ['usgsWellData', 'wellTiming', 'nwisResponseCache', 'nwisCrossReference', 'nwisExport', 'nwisIntervals',
+                  'nwisRegistry', 'nwisSnapshot', 'nwisAquifers', 'nwisTables', 'nwisSchema']
+deferredL      = ['csv', 'logging', 'email.utils']
+
+# A script run to its exit, reporting the deferred modules it loaded
+#
+scriptRunner   = """
+import runpy, sys
+sys.path.insert(0, '.')
+try:
+    runpy.run_path(sys.argv[1], run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write(' '.join([name for name in %r if name in sys.modules]))
+""" % deferredL
+
+# =============================================================================
+def test_modulesImportWithoutDeferred ():
+
+    command = 'import sys, %s; print(" ".join([name for name in %r if name in sys.modules]))' % (', '.join(cgiModulesL), deferredL)
+    result  = subprocess.run([sys.executable, '-c', command], cwd=cgi_dir, capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+# =============================================================================
+@pytest.mark.parametrize('script, kind', [('requestUsgsConstruction.py', 'construction'),
+                                          ('requestUsgsGeohydrology.py', 'geohydrology'),
+                                          ('requestUsgsWell.py',         'well')])
+def test_packedRequestWithoutDeferred (responsePack, script, kind):
+
+    pack_file, metaD, skippedD = responsePack
+    site_no = [site_no for site_no in nwisResponseCache.cachedSites() if site_no not in skippedD][0]
+    body    = nwisResponseCache.cachedResponse(kind, site_no)
+
+    # A request answered from the pack; a revalidation by date reads the
+    #  date with email.utils and nothing else
+    #
+    for environD, status, loaded in [({}, '', ''),
+                                     ({'HTTP_IF_MODIFIED_SINCE': 'Fri, 01 Jan 2100 00:00:00 GMT'}, 'Status: 304', 'email.utils')]:
+        environ = dict(os.environ, QUERY_STRING='site_no=%s' % site_no, **environD)
+        result  = subprocess.run([sys.executable, '-c', scriptRunner, script], cwd=cgi_dir, env=environ,
+                                 capture_output=True, text=True)
+
+        assert result.stderr.strip() == loaded
+        assert status in result.stdout
+        if len(status) < 1:
+            assert body in result.stdout
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_index.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the sidecar site indexes locate every site group of
+#            the NWIS tables and that the binary search finds the same rows.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import json
+
+import pytest
+
+import nwisTables
+
+import nwisSchema
+
+import nwisRegistry
+
+import usgsWellData
+
+# Site numbers before, between and after those of the shipped tables
+#
+missingL = ['000000000000000', '420000000000000', '999999999999999', 'X']
+
+# =============================================================================
+@pytest.mark.parametrize('table_nm', nwisRegistry.registeredTables())
+def test_indexLocatesSiteGroups (indexes, table_nm):
+
+    nwis_file = usgsWellData.nwisFileName(table_nm)
+
+    with open(nwisTables.indexFileName(nwis_file), 'r') as fh:
+        indexD = json.load(fh)
+
+    assert indexD == nwisTables.buildNwisIndex(nwis_file)
+    assert indexD['stamp'] == nwisTables.sourceStamp(nwis_file)
+
+    # Each entry covers the rows of its site and nothing else
+    #
+    keyIndex = indexD['columns'].index(nwisTables.keyColumn)
+    with open(nwis_file, 'rb') as fh:
+        for site_no, (offset, length, rows) in indexD['sites'].items():
+            fh.seek(offset)
+            linesL = fh.read(length).splitlines()
+            assert len(linesL) == rows
+            assert set([line.split(b'\t')[keyIndex].decode('utf-8') for line in linesL]) == set([site_no])
+
+# =============================================================================
+@pytest.mark.parametrize('table_nm', nwisRegistry.registeredTables())
+def test_bisectMatchesIndex (indexes, table_nm):
+
+    nwis_file = usgsWellData.nwisFileName(table_nm)
+    siteL     = sorted(nwisTables.loadNwisIndex(nwis_file)['sites'])
+
+    # Every site of the table in one batch, as dictionary rows and as the
+    #  records of a row decoder
+    #
+    indexedD = nwisTables.indexBatchRows(nwis_file, siteL + missingL)
+    assert sorted(indexedD) == siteL
+    assert nwisTables.bisectBatchRows(nwis_file, siteL + missingL) == indexedD
+
+    decoder = nwisSchema.rowDecoder(nwis_file)
+    assert nwisTables.bisectBatchRows(nwis_file, siteL, decoder) == nwisTables.indexBatchRows(nwis_file, siteL, decoder)
+
+    # Single sites at both ends of the table, inside it and missing from it
+    #
+    for site_no in siteL[:3] + siteL[len(siteL) // 2:len(siteL) // 2 + 3] + siteL[-3:] + missingL:
+        assert nwisTables.bisectSiteRows(nwis_file, site_no) == nwisTables.indexSiteRows(nwis_file, site_no)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_intervals.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the depth-range and code filters of the interval
+#            indexes find the same sites as a scan of the NWIS tables.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os
+
+import json
+
+import pytest
+
+import nwisRegistry
+
+import nwisIntervals
+
+import usgsWellData
+
+# Filters of the nwisIntervals.py timings and a depth range of each table;
+#  single depths, reversed ranges and lower case codes as requested
+#
+filtersL = [{'lith_cd': 'BSLT', 'lith_depth': '100,300'},
+            {'open_depth': '500,'},
+            {'open_cd': 'S,P'},
+            {'csng_material_cd': 'S', 'csng_depth': '0,20', 'lith_cd': 'CLAY'},
+            {'hole_depth': '1000,1200'},
+            {'hole_depth': '50'},
+            {'lith_depth': '300,100', 'lith_cd': 'bslt, clay'},
+            {'open_cd': 'X'},
+            {'csng_material_cd': 'S', 'hole_depth': ',10', 'open_depth': '20,40'}] + \
+           [{nwisRegistry.depthParameter(table_nm): depth} for table_nm in nwisRegistry.intervalTables() for depth in ['0,100', '2000,']]
+
+# =============================================================================
+@pytest.fixture(scope='module')
+def intervals ():
+
+    return nwisIntervals.loadIntervals()
+
+# =============================================================================
+@pytest.mark.parametrize('params', filtersL, ids=[json.dumps(params) for params in filtersL])
+def test_filterMatchesScan (intervals, params):
+
+    assert nwisIntervals.filterSites(intervals, params) == nwisIntervals.scanSites(params)
+
+# =============================================================================
+def test_compiledIntervals (intervals):
+
+    # The compiled file answers like indexes built from the tables
+    #
+    assert os.path.exists(nwisIntervals.interval_file)
+
+    builtD = nwisIntervals.openIntervals(nwisIntervals.buildIntervals())
+    for params in filtersL:
+        assert nwisIntervals.filterSites(builtD, params) == nwisIntervals.filterSites(intervals, params)
+
+# =============================================================================
+def test_filterPages (intervals):
+
+    params = {'open_depth': '0,'}
+    siteL  = nwisIntervals.filterSites(intervals, params)
+    assert len(siteL) > nwisIntervals.default_limit
+
+    # Pages of the default size cover the sites once, in order
+    #
+    pagesL = []
+    offset = 0
+    while True:
+        pageD = json.loads(nwisIntervals.filterJson(dict(params, offset=str(offset))))
+        assert pageD['count'] == len(siteL)
+        assert pageD['limit'] == nwisIntervals.default_limit
+        if len(pageD['site_no']) < 1:
+            break
+        pagesL.extend(pageD['site_no'])
+        offset += pageD['limit']
+    assert pagesL == siteL
+
+    # Pages are limited to a batch request
+    #
+    pageD = json.loads(nwisIntervals.filterJson(dict(params, limit=str(usgsWellData.max_batch_sites * 10))))
+    assert pageD['limit'] == usgsWellData.max_batch_sites
+    assert pageD['site_no'] == siteL[:usgsWellData.max_batch_sites]
+
+# =============================================================================
+@pytest.mark.parametrize('params', [{},
+                                    {'site_no': '123'},
+                                    {'hole_depth': 'deep'},
+                                    {'hole_depth': '1,2,3'},
+                                    {'hole_depth': ','},
+                                    {'open_cd': 'S', 'offset': '-1'},
+                                    {'open_cd': 'S', 'limit': 'all'}])
+def test_filterErrors (intervals, params):
+
+    with pytest.raises(usgsWellData.WellDataError):
+        nwisIntervals.filterJson(params)
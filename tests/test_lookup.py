@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_lookup.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that every NWIS_LOOKUP mode answers single sites, batches
+#            and tables with the same documents as the sidecar indexes.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os
+
+import json
+
+import pytest
+
+import nwisTables
+
+import nwisSnapshot
+
+import nwisSqlite
+
+import nwisStore
+
+import nwisSchema
+
+import usgsWellData
+
+# Sites compared, every stride-th site of the tables; a scan reads whole
+#  tables for each request so it is compared on fewer
+#
+strideD    = {'scan': 1000}
+stride     = 10
+batch_size = 50
+
+# =============================================================================
+def rendered (function, *argsL):
+
+    # Data errors are part of the answer
+    #
+    try:
+        return function(*argsL)
+    except usgsWellData.WellDataError as e:
+        return usgsWellData.messageJson(str(e))
+
+# =============================================================================
+def lookupOutputs (siteL):
+
+    definitionsD = usgsWellData.loadDefinitions()
+    aqfrInfoD    = usgsWellData.loadAquifers()
+    sectionsL    = usgsWellData.wellSections('')
+    table_nmL    = usgsWellData.registryTables('')
+
+    def outputs (site_no):
+        return [
+            rendered(usgsWellData.constructionJson, site_no, definitionsD),
+            rendered(usgsWellData.geohydrologyJson, site_no, definitionsD, aqfrInfoD),
+            rendered(usgsWellData.wellJson, site_no, sectionsL, definitionsD, aqfrInfoD),
+            rendered(usgsWellData.tablesJson, site_no, table_nmL, definitionsD, aqfrInfoD)
+        ]
+
+    # Single sites, then the same sites in batches
+    #
+    outputsD = {}
+    for site_no in siteL:
+        outputsD[site_no] = outputs(site_no)
+    for start in range(0, len(siteL), batch_size):
+        site_no = ','.join(siteL[start:start + batch_size])
+        outputsD[site_no] = outputs(site_no)
+
+    return outputsD
+
+# =============================================================================
+@pytest.fixture(scope='module')
+def indexOutputs (indexes, siteNumbers):
+
+    # Every sample the modes are compared on
+    #
+    mode = nwisTables.lookupMode
+    nwisTables.lookupMode = 'index'
+    try:
+        outputsD = {}
+        for sample in set([stride] + list(strideD.values())):
+            outputsD.update(lookupOutputs(siteNumbers[::sample]))
+    finally:
+        nwisTables.lookupMode = mode
+
+    return outputsD
+
+# =============================================================================
+@pytest.mark.parametrize('mode', ['bisect', 'snapshot', 'sqlite', 'memory', 'scan'])
+def test_lookupModesMatchIndex (indexOutputs, snapshots, database, nwisFiles, siteNumbers, monkeypatch, mode):
+
+    monkeypatch.setattr(nwisTables, 'lookupMode', mode)
+
+    siteL    = siteNumbers[::strideD.get(mode, stride)]
+    outputsD = lookupOutputs(siteL)
+
+    assert len(outputsD) > len(siteL)
+    for site_no, outputL in outputsD.items():
+        assert outputL == indexOutputs[site_no], site_no
+
+    # The mode read its own artifact rather than falling back to the indexes
+    #
+    for nwis_file in nwisFiles:
+        if mode == 'snapshot':
+            assert nwisSnapshot.snapshotBatchRows(nwis_file, siteL[:1]) is not None
+        elif mode == 'sqlite':
+            assert nwisSqlite.sqliteBatchRows(nwis_file, siteL[:1]) is not None
+        elif mode == 'memory':
+            assert nwis_file in nwisStore.storeCacheD
+
+# =============================================================================
+def test_sqliteFollowsCodeFiles (database, monkeypatch):
+
+    monkeypatch.setattr(nwisTables, 'lookupMode', 'sqlite')
+
+    assert nwisSqlite.database_file == os.path.join(usgsWellData.data_dir, 'nwis.sqlite')
+    assert nwisSqlite.sqliteCodes('lith_cd') == usgsWellData.compiledDefinitions()['lith_cd']
+    assert isinstance(usgsWellData.loadAquifers(), nwisSqlite.AquiferNames)
+
+    # Code files edited after the import are read from the files; the
+    #  shipped files and their stamps are put back for the other tests
+    #
+    savedL = []
+    for source_file in [usgsWellData.well_lookup_file, usgsWellData.aqfr_lookup_file]:
+        with open(source_file, 'rb') as fh:
+            savedL.append((source_file, fh.read(), os.stat(source_file)))
+    try:
+        with open(usgsWellData.well_lookup_file, 'r') as fh:
+            jsonD = json.load(fh)
+        jsonD['lith_cd']['Codes']['ALVM'] = 'Alluvium, edited'
+        with open(usgsWellData.well_lookup_file, 'w') as fh:
+            json.dump(jsonD, fh)
+        os.utime(usgsWellData.aqfr_lookup_file)
+
+        assert nwisSqlite.sqliteCodes('lith_cd') is None
+        assert usgsWellData.loadDefinitions()['lith_cd']['ALVM'] == 'Alluvium, edited'
+        assert nwisSqlite.sqliteAquifers(usgsWellData.state_cd) is None
+        assert not isinstance(usgsWellData.loadAquifers(), nwisSqlite.AquiferNames)
+    finally:
+        for source_file, content, statInfo in savedL:
+            with open(source_file, 'wb') as fh:
+                fh.write(content)
+            os.utime(source_file, ns=(statInfo.st_atime_ns, statInfo.st_mtime_ns))
+
+    assert nwisSqlite.sqliteCodes('lith_cd') is not None
+
+# =============================================================================
+def test_unsortedSiteGroups (testData, tmp_path):
+
+    # A site whose rows are split by another site's keeps its first group
+    #  in every mode that locates groups; bisect needs a sorted extract
+    #
+    with open(os.path.join(testData, 'gw_hole_01.txt'), 'r') as fh:
+        linesL = fh.read().splitlines()
+    headerL = [line for line in linesL if line.startswith('#')] + [line for line in linesL if not line.startswith('#')][:2]
+    groupsD = {}
+    for line in [line for line in linesL if not line.startswith('#')][2:]:
+        groupsD.setdefault(line.split('\t')[1], []).append(line)
+
+    splitL = [site_no for site_no, rowsL in groupsD.items() if len(rowsL) > 1][:2]
+    otherL = [site_no for site_no in groupsD if site_no not in splitL][:3]
+    rowsL  = groupsD[splitL[0]][:1] + groupsD[otherL[0]] + groupsD[splitL[0]][1:] + \
+             groupsD[splitL[1]][:1] + groupsD[otherL[1]] + groupsD[splitL[1]][1:] + groupsD[otherL[2]]
+
+    nwis_file = str(tmp_path / 'gw_hole_01.txt')
+    with open(nwis_file, 'w') as fh:
+        fh.write('\n'.join(headerL + rowsL) + '\n')
+
+    nwisTables.writeNwisIndex(nwis_file, nwisTables.buildNwisIndex(nwis_file))
+    metaD, bytesL = nwisSnapshot.buildSnapshot(nwis_file)
+    nwisSnapshot.writeSnapshot(nwis_file, metaD, bytesL)
+
+    siteL    = splitL + otherL
+    decoder  = nwisSchema.rowDecoder(nwis_file)
+    firstD   = dict([(site_no, groupsD[site_no][:1] if site_no in splitL else groupsD[site_no]) for site_no in siteL])
+    indexedD = nwisTables.indexBatchRows(nwis_file, siteL, decoder)
+
+    assert dict([(site_no, len(rowsL)) for site_no, rowsL in indexedD.items()]) == \
+           dict([(site_no, len(rowsL)) for site_no, rowsL in firstD.items()])
+    assert nwisSnapshot.snapshotBatchRows(nwis_file, siteL, decoder) == indexedD
+    assert nwisStore.storeBatchRows(nwis_file, siteL, decoder) == indexedD
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_lrucache.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the in-process response cache counts its bodies by
+#            the bytes sent and evicts the least recently used first.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+
+import wellLruCache
+
+# =============================================================================
+def test_encodedBytes ():
+
+    cache = wellLruCache.LruCache(max_entries=10, max_bytes=80)
+    body  = '{"nm":"Cañon"}'
+
+    cache.put('a', 1, body)
+    assert cache.statistics()['bytes'] == len(body.encode('utf-8')) == len(body) + 1
+    assert cache.get('a', 1) == body
+
+    # Replacing an entry counts only the new body
+    #
+    cache.put('a', 1, 'é' * 5)
+    assert cache.statistics()['bytes'] == 10
+
+    # A body over a quarter of the budget in bytes, not characters, is
+    #  not kept
+    #
+    cache.put('b', 1, 'é' * 11)
+    assert cache.get('b', 1) is None
+
+# =============================================================================
+def test_leastRecentlyUsed ():
+
+    cache = wellLruCache.LruCache(max_entries=10, max_bytes=80)
+
+    for key in 'abcd':
+        cache.put(key, 1, 'é' * 10)
+    assert cache.get('a', 1) is not None
+
+    # The budget is exceeded by bytes; b was used least recently
+    #
+    cache.put('e', 1, 'é' * 10)
+    statisticsD = cache.statistics()
+    assert (statisticsD['entries'], statisticsD['bytes'], statisticsD['evictions']) == (4, 80, 1)
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) is not None
+
+    # Another data version drops every entry
+    #
+    assert cache.get('a', 2) is None
+    assert cache.statistics()['bytes'] == 0
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_pack.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that the response pack holds the same bodies as a fresh
+#            render of each site and reports the sites it skips.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os
+
+import pytest
+
+import usgsWellData
+
+import nwisSnapshot
+
+import nwisResponseCache
+
+# =============================================================================
+def freshResponses (site_no, definitionsD, aqfrInfoD):
+
+    # Bodies of the request path for each cached kind, in pack order
+    #
+    sectionsL = usgsWellData.wellSections('')
+
+    return [
+        usgsWellData.constructionJson(site_no, definitionsD),
+        usgsWellData.geohydrologyJson(site_no, definitionsD, aqfrInfoD),
+        usgsWellData.wellJson(site_no, sectionsL, definitionsD, aqfrInfoD)
+    ]
+
+# =============================================================================
+def test_packMatchesFreshRenders (responsePack, codeTables):
+
+    pack_file, metaD, skippedD = responsePack
+    definitionsD, aqfrInfoD    = codeTables
+
+    packD = nwisResponseCache.openCache()
+    assert packD is not None
+    assert packD['meta']['version'] == usgsWellData.dataVersion()
+
+    # Every site of the construction and geohydrology tables is either
+    #  packed or skipped
+    #
+    siteL = nwisResponseCache.cachedSites()
+    assert packD['meta']['nsites'] + len(skippedD) == len(siteL)
+
+    for site_no in siteL:
+        site = nwisSnapshot.findSite(packD, site_no)
+        if site_no in skippedD:
+            assert site is None
+            continue
+
+        bodiesL, digestsL = nwisResponseCache.packedResponses(packD, site)
+        assert [body.decode('utf-8') for body in bodiesL] == freshResponses(site_no, definitionsD, aqfrInfoD)
+        assert digestsL == [nwisResponseCache.contentHash(body) for body in bodiesL]
+
+# =============================================================================
+def test_packReportsSkippedSites (responsePack, codeTables):
+
+    pack_file, metaD, skippedD = responsePack
+    definitionsD, aqfrInfoD    = codeTables
+
+    # The shipped extract has sites with a lith_unit_cd missing from the
+    #  aquifer names; the request path reports the same message
+    #
+    assert len(skippedD) > 0
+    for site_no, message in skippedD.items():
+        with pytest.raises(usgsWellData.WellDataError) as error:
+            freshResponses(site_no, definitionsD, aqfrInfoD)
+        assert str(error.value) == message
+
+        for kind in nwisResponseCache.responseKindsL:
+            assert nwisResponseCache.cachedResponse(kind, site_no) is None
+
+# =============================================================================
+def test_cachedResponseServesPack (responsePack, codeTables):
+
+    pack_file, metaD, skippedD = responsePack
+    definitionsD, aqfrInfoD    = codeTables
+
+    site_no = [site_no for site_no in nwisResponseCache.cachedSites() if site_no not in skippedD][0]
+    for kind, body in zip(nwisResponseCache.responseKindsL, freshResponses(site_no, definitionsD, aqfrInfoD)):
+        assert nwisResponseCache.cachedResponse(kind, site_no) == body
+
+    # Batches and other kinds are left to the request path
+    #
+    assert nwisResponseCache.cachedResponse('construction', site_no + ',' + site_no) is None
+    assert nwisResponseCache.cachedResponse('tables', site_no) is None
+
+# =============================================================================
+def test_replacedPackIsClosed (responsePack, monkeypatch):
+
+    pack_file, metaD, skippedD = responsePack
+
+    served   = nwisResponseCache.openCache()['mmap']
+    statInfo = os.stat(pack_file)
+    touch    = lambda offset: os.utime(pack_file, ns=(statInfo.st_atime_ns, statInfo.st_mtime_ns + offset))
+
+    # A replaced pack is mapped again and the previous mapping closed
+    #
+    try:
+        touch(1000)
+        replaced = nwisResponseCache.openCache()['mmap']
+        assert replaced is not served
+        assert served.closed
+
+        # A pack of another data version is not served and both mappings
+        #  are closed
+        #
+        touch(2000)
+        with monkeypatch.context() as patch:
+            patch.setattr(usgsWellData, 'dataVersion', lambda stampsL=None: 'other')
+            assert nwisResponseCache.openCache() is None
+        assert replaced.closed
+        assert nwisResponseCache.cacheD == {}
+    finally:
+        touch(0)
+
+    assert not nwisResponseCache.openCache()['mmap'].closed
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# $Id: test_refresh.py
+#
+# Project:  wellConstruction
+# Purpose:  Tests that refreshing a served extract with a changed one
+#            publishes the same files as building them from scratch.
+#
+# Author:   Leonard Orzol <llorzol@usgs.gov>
+#
+###############################################################################
+# Copyright (c) Oregon Water Science Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+
+import os, sys, re
+
+import glob
+
+import shutil
+
+import sqlite3
+
+import subprocess
+
+import pytest
+
+from tests.conftest import cgi_dir, shippedL
+
+# Generated files a full rebuild writes, the way the modules are run by hand
+#
+rebuildScript = """
+import glob, os
+import nwisTables, nwisSnapshot, nwisSqlite, nwisResponseCache, usgsWellData
+for nwis_file in sorted(glob.glob(os.path.join(usgsWellData.data_dir, 'gw_*_01.txt'))):
+    nwisTables.writeNwisIndex(nwis_file, nwisTables.buildNwisIndex(nwis_file))
+    metaD, bytesL = nwisSnapshot.buildSnapshot(nwis_file)
+    nwisSnapshot.writeSnapshot(nwis_file, metaD, bytesL)
+nwisSqlite.importDatabase(usgsWellData.data_dir, nwisSqlite.database_file)
+nwisResponseCache.buildCache()
+"""
+
+# A resident sqlite mode process reading gw_cons across a refresh run by
+#  another process
+#
+residentScript = """
+import sys, subprocess
+import nwisTables, nwisSchema, nwisSqlite, usgsWellData
+nwis_file = usgsWellData.nwisFileName('gw_cons')
+siteL     = sorted(nwisTables.loadNwisIndex(nwis_file)['sites'])
+decoder   = nwisSchema.rowDecoder(nwis_file)
+servedD   = nwisTables.lookupBatchRows(nwis_file, siteL, 'sqlite', decoder)
+assert nwisSqlite.sqliteBatchRows(nwis_file, siteL[:1]) is not None
+subprocess.run([sys.executable, 'nwisRefresh.py', sys.argv[1]], check=True, capture_output=True)
+assert nwisSqlite.sqliteBatchRows(nwis_file, siteL[:1]) is not None
+refreshedD = nwisTables.lookupBatchRows(nwis_file, siteL, 'sqlite', decoder)
+assert refreshedD != servedD
+assert refreshedD == nwisTables.lookupBatchRows(nwis_file, siteL, 'index', decoder)
+"""
+
+# =============================================================================
+def runModule (data_dir, argsL, lookup=None):
+
+    # The modules read WELL_DATA_DIR when imported, so each run is a fresh
+    #  process
+    #
+    environ = dict(os.environ)
+    environ['WELL_DATA_DIR'] = data_dir
+    environ['NWIS_SQLITE']   = os.path.join(data_dir, 'nwis.sqlite')
+    if lookup is not None:
+        environ['NWIS_LOOKUP'] = lookup
+
+    return subprocess.run([sys.executable] + argsL, cwd=cgi_dir, env=environ, capture_output=True, text=True)
+
+# =============================================================================
+def changedExtract (data_dir, extract_dir):
+
+    # gw_cons rows with a new seal depth and cons_md and a gw_hole site
+    #  group removed; every other table as served
+    #
+    os.makedirs(extract_dir)
+    for nwis_file in glob.glob(os.path.join(data_dir, 'gw_*_01.txt')):
+        shutil.copy2(nwis_file, extract_dir)
+
+    with open(os.path.join(extract_dir, 'gw_cons_01.txt'), 'r') as fh:
+        linesL = fh.read().splitlines()
+    headerL = [line for line in linesL if not line.startswith('#')][0].split('\t')
+    start   = len([line for line in linesL if line.startswith('#')]) + 2
+    for row in range(start, len(linesL), 500):
+        valuesL = linesL[row].split('\t')
+        valuesL[headerL.index('seal_depth_va')] = '25'
+        valuesL[headerL.index('cons_md')]       = '01-JAN-2030 00:00:00'
+        linesL[row] = '\t'.join(valuesL)
+    with open(os.path.join(extract_dir, 'gw_cons_01.txt'), 'w') as fh:
+        fh.write('\n'.join(linesL) + '\n')
+
+    with open(os.path.join(extract_dir, 'gw_hole_01.txt'), 'r') as fh:
+        linesL = fh.read().splitlines()
+    site_no = linesL[-1].split('\t')[1]
+    with open(os.path.join(extract_dir, 'gw_hole_01.txt'), 'w') as fh:
+        fh.write('\n'.join([line for line in linesL if line.split('\t')[1:2] != [site_no]]) + '\n')
+
+# =============================================================================
+def servedVersion (data_dir, version_dir):
+
+    # Copy of the session data files, the database through the backup API
+    #
+    os.makedirs(version_dir)
+    for name in os.listdir(data_dir):
+        if name.startswith('nwis.sqlite') or not os.path.isfile(os.path.join(data_dir, name)):
+            continue
+        shutil.copy2(os.path.join(data_dir, name), version_dir)
+
+    source = sqlite3.connect(os.path.join(data_dir, 'nwis.sqlite'))
+    target = sqlite3.connect(os.path.join(version_dir, 'nwis.sqlite'))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+# =============================================================================
+def databaseContents (database_file):
+
+    connection = sqlite3.connect(database_file)
+    try:
+        contentsD = {}
+        for table_nm, size, mtime_ns in connection.execute('SELECT table_nm, size, mtime_ns FROM nwis_import ORDER BY table_nm').fetchall():
+            order = 'site_no, rowid' if table_nm.startswith('gw_') else 'rowid'
+            rowsL = connection.execute('SELECT * FROM "%s" ORDER BY %s' % (table_nm, order)).fetchall()
+            contentsD[table_nm] = (size, mtime_ns, rowsL)
+    finally:
+        connection.close()
+
+    return contentsD
+
+# =============================================================================
+def linkedData (testData, root_dir):
+
+    # The served version behind a data link and a changed extract
+    #
+    data_dir = os.path.join(root_dir, 'data')
+
+    servedVersion(testData, os.path.join(root_dir, 'data.initial'))
+    os.symlink('data.initial', data_dir)
+    changedExtract(testData, os.path.join(root_dir, 'extract'))
+
+    return data_dir
+
+# =============================================================================
+@pytest.fixture(scope='module')
+def refreshedData (testData, responsePack, database, tmp_path_factory):
+
+    root_dir = str(tmp_path_factory.mktemp('refresh'))
+    data_dir = linkedData(testData, root_dir)
+
+    result = runModule(data_dir, ['nwisRefresh.py', os.path.join(root_dir, 'extract')])
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'published' in result.stdout
+    assert re.search(r'gw_cons_01.txt: [1-9]\d* sites changed \(0 added, 0 removed', result.stdout)
+    assert re.search(r'gw_hole_01.txt: 1 sites changed \(0 added, 1 removed', result.stdout)
+
+    # The same extract built from scratch
+    #
+    rebuilt_dir = os.path.join(root_dir, 'rebuilt')
+    os.makedirs(rebuilt_dir)
+    for pattern in shippedL:
+        for source_file in glob.glob(os.path.join(data_dir, pattern)):
+            shutil.copy2(source_file, rebuilt_dir)
+
+    result = runModule(rebuilt_dir, ['-c', rebuildScript])
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    return root_dir, os.path.realpath(data_dir), rebuilt_dir
+
+# =============================================================================
+def test_refreshPublishesVersion (refreshedData):
+
+    root_dir, version_dir, rebuilt_dir = refreshedData
+
+    # The link points at the new version; the served one is kept
+    #
+    assert os.path.islink(os.path.join(root_dir, 'data'))
+    assert os.path.basename(version_dir).startswith('data.')
+    assert version_dir != os.path.join(root_dir, 'data.initial')
+    assert os.path.isdir(os.path.join(root_dir, 'data.initial'))
+    assert len(glob.glob(os.path.join(root_dir, '*.tmp'))) == 0
+
+# =============================================================================
+@pytest.mark.parametrize('pattern', ['gw_*_01.txt', 'gw_*_01.idx', 'gw_*_01.snap', 'well_responses.pack'])
+def test_refreshMatchesRebuild (refreshedData, pattern):
+
+    root_dir, version_dir, rebuilt_dir = refreshedData
+
+    namesL = sorted([os.path.basename(path) for path in glob.glob(os.path.join(rebuilt_dir, pattern))])
+    assert len(namesL) > 0
+    assert sorted([os.path.basename(path) for path in glob.glob(os.path.join(version_dir, pattern))]) == namesL
+
+    for name in namesL:
+        with open(os.path.join(version_dir, name), 'rb') as fh:
+            refreshed = fh.read()
+        with open(os.path.join(rebuilt_dir, name), 'rb') as fh:
+            rebuilt = fh.read()
+        assert refreshed == rebuilt, name
+
+# =============================================================================
+def test_refreshMatchesDatabase (refreshedData):
+
+    root_dir, version_dir, rebuilt_dir = refreshedData
+
+    assert databaseContents(os.path.join(version_dir, 'nwis.sqlite')) == databaseContents(os.path.join(rebuilt_dir, 'nwis.sqlite'))
+
+# =============================================================================
+def test_refreshRefusesPlainDirectory (refreshedData, tmp_path):
+
+    root_dir, version_dir, rebuilt_dir = refreshedData
+
+    # A data directory that is not a link is left as it is
+    #
+    data_dir = str(tmp_path / 'data')
+    shutil.copytree(os.path.join(root_dir, 'data.initial'), data_dir)
+    namesL   = sorted(os.listdir(data_dir))
+
+    result = runModule(data_dir, ['nwisRefresh.py', os.path.join(root_dir, 'extract')])
+    assert result.returncode == 1
+    assert 'not a symbolic link' in result.stdout
+    assert sorted(os.listdir(data_dir)) == namesL
+    assert sorted(os.listdir(str(tmp_path))) == ['data']
+
+# =============================================================================
+def test_refreshReconnectsDatabase (testData, responsePack, database, tmp_path):
+
+    # A process that read the served database reads the published one
+    #
+    data_dir = linkedData(testData, str(tmp_path))
+
+    result = runModule(data_dir, ['-c', residentScript, str(tmp_path / 'extract')], 'sqlite')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert os.path.realpath(data_dir) != str(tmp_path / 'data.initial')